@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+
+import os
+import json
+import wfpm.testing
+from wfpm.execution import ProcessResult
+from wfpm.testing import RunOptions, collect_test_jobs, gen_batch_wrapper, batchable, run_test_batch
+
+
+CHECKER = """nextflow.enable.dsl = 2
+version = '0.1.0'
+
+params.input_file = ""
+params.label = 'params.label'
+params.outdir = "${params.input_file}.out"
+
+include { demo } from '../main'
+
+workflow checker {
+  take:
+    input_file
+  main:
+    demo(input_file)
+}
+
+workflow {
+  checker(file(params.input_file))
+  println "params.label: ${params.label}"
+}
+"""
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def make_pkg(pkg_dir, config="process.cpus = 2\n"):
+    write(os.path.join(pkg_dir, 'tests', 'checker.nf'), CHECKER)
+    write(os.path.join(pkg_dir, 'tests', 'test-job-1.json'), json.dumps({'input_file': 'a.txt', 'cpus': 1}))
+    write(os.path.join(pkg_dir, 'tests', 'test-job-2.json'),
+          json.dumps({'input_file': 'b.txt', 'cpus': 2, 'label': 'B'}))
+    write(os.path.join(pkg_dir, 'tests', 'nextflow.config'), "includeConfig '../nextflow.config'\n")
+    write(os.path.join(pkg_dir, 'nextflow.config'), config)
+    return collect_test_jobs(pkg_dir)
+
+
+def test_gen_batch_wrapper(tmp_path):
+    jobs = make_pkg(os.path.join(str(tmp_path), 'demo'))
+    launch_dir = str(tmp_path)
+    assert gen_batch_wrapper(jobs, launch_dir) == ['job_1', 'job_2']
+
+    # literal defaults of the checker are merged under the params of each job
+    params = []
+    for i in (1, 2):
+        with open(os.path.join(launch_dir, f"wfpm-batch-{i}.params.json"), 'r') as f:
+            params.append(json.load(f))
+    assert params == [
+        {'input_file': 'a.txt', 'label': 'params.label', 'cpus': 1},
+        {'input_file': 'b.txt', 'label': 'B', 'cpus': 2}
+    ]
+    with open(os.path.join(launch_dir, 'wfpm-batch.params.json'), 'r') as f:
+        assert json.load(f) == {}  # no param has the same value in both jobs
+
+    with open(os.path.join(launch_dir, 'wfpm-batch-2.nf'), 'r') as f:
+        module = f.read()
+    # other defaults are kept as they are, the entry workflow is copied untouched
+    assert 'params.outdir = "${params.input_file}.out"\n' in module
+    assert f"include {{ checker }} from '{os.path.join(str(tmp_path), 'demo', 'tests', 'checker')}'" in module
+    assert 'workflow job_2 {\n  checker(file(params.input_file))\n  println "params.label: ${params.label}"\n}' \
+        in module
+
+    with open(os.path.join(launch_dir, 'wfpm-batch.nf'), 'r') as f:
+        wrapper = f.read()
+    assert "include { job_1 } from './wfpm-batch-1' addParams(p_1)" in wrapper
+    assert "include { job_2 } from './wfpm-batch-2' addParams(p_2)" in wrapper
+    assert ' params(' not in wrapper
+
+
+def test_batchable(tmp_path):
+    assert batchable(make_pkg(os.path.join(str(tmp_path), 'fixed')))
+    # the config would need a different value of 'cpus' for each job
+    assert not batchable(make_pkg(os.path.join(str(tmp_path), 'by_params'), "process.cpus = params.cpus\n"))
+
+
+def test_run_test_batch_durations(tmp_path, monkeypatch):
+    jobs = make_pkg(os.path.join(str(tmp_path), 'demo'))
+
+    def run_nextflow(argv, launch_dir, opts, label='', timeout=None):
+        assert argv[:3] == ['nextflow', 'run', 'wfpm-batch.nf']
+        write(os.path.join(launch_dir, 'wfpm-batch.trace.txt'), '\n'.join([
+            'task_id\tname\tstatus\texit\tsubmit\tcomplete\trealtime',
+            '1\tjob_1:checker:demo (1)\tCOMPLETED\t0\t2021-01-19 12:00:00.000\t2021-01-19 12:00:10.000\t10s',
+            '2\tjob_2:checker:demo (1)\tCOMPLETED\t0\t2021-01-19 12:00:00.000\t2021-01-19 12:00:30.000\t30s',
+            '3\tjob_2:checker:demo (2)\tFAILED\t1\t2021-01-19 12:00:01.000\t2021-01-19 12:00:02.000\t1s',
+        ]) + '\n')
+        return ProcessResult(argv=argv, returncode=0, duration=35.0)
+
+    monkeypatch.setattr(wfpm.testing, 'run_nextflow', run_nextflow)
+    launch_root = os.path.join(str(tmp_path), 'runs')
+    results = run_test_batch(jobs, launch_root, RunOptions())
+
+    assert [r.passed for r in results] == [True, False]
+    # each job takes the time of its own tasks plus the start up of the session (35s - 30s)
+    assert [r.duration for r in results] == [15.0, 35.0]
+    assert all(r.duration_measured for r in results)
+    assert list(results[0].processes) == ['demo']
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+
+import os
+import json
+import importlib
+from wfpm.project import Project
+from wfpm.utils import run_cmd
+
+# the module, 'wfpm.cli.test_cmd' is also the name of the command function re-exported by 'wfpm.cli'
+test_cmd = importlib.import_module('wfpm.cli.test_cmd')
+
+PROJECT = 'github.com/acct/repo'
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def write_pkg(root, name, dependencies=()):
+    write(os.path.join(root, name, 'pkg.json'), json.dumps({
+        'name': name,
+        'version': '0.1.0',
+        'main': 'main',
+        'repository': {'type': 'git', 'url': 'https://github.com/acct/repo.git'},
+        'dependencies': list(dependencies),
+        'devDependencies': []
+    }))
+    write(os.path.join(root, name, 'main.nf'), "version = '0.1.0'\n")
+
+
+def test_changed_pkgs_and_local_dependents(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv('WFPM_CACHE_DIR', os.path.join(str(tmp_path), 'cache'))
+    root = os.path.join(str(tmp_path), 'repo')
+    write(os.path.join(root, '.wfpm'), 'project_name: repo\nrepo_type: git\nrepo_server: github.com\nrepo_account: acct\n')
+    write(os.path.join(root, '.gitignore'), '.log\n')
+    write_pkg(root, 'utils')
+    write_pkg(root, 'align', [f"{PROJECT}/utils@0.1.0"])
+    write_pkg(root, 'wf', [f"{PROJECT}/align@0.1.0", "github.com/other/repo/qc@1.0.0"])
+    write_pkg(root, 'other')
+    for cmd in (['git', 'init', '-q'], ['git', 'checkout', '-q', '-b', 'main'], ['git', 'add', '.'],
+                ['git', 'commit', '-q', '-m', 'init'], ['git', 'checkout', '-q', '-b', 'utils@0.2.0']):
+        assert run_cmd(cmd, cwd=root)[2] == 0
+
+    write(os.path.join(root, 'utils', 'main.nf'), "version = '0.2.0'\n")  # committed on the branch
+    assert run_cmd(['git', 'commit', '-q', '-am', 'bump'], cwd=root)[2] == 0
+    write(os.path.join(root, 'other', 'notes.txt'), 'untracked\n')
+
+    monkeypatch.chdir(root)
+    project = Project(project_root=root)
+    assert project.git.changed_files('main') == [
+        os.path.join(root, 'other', 'notes.txt'), os.path.join(root, 'utils', 'main.nf')
+    ]
+    assert project.changed_pkgs('main') == ['other', 'utils']
+    assert project.git.changed_files('HEAD') == [os.path.join(root, 'other', 'notes.txt')]
+
+    assert project.local_dependents(['utils']) == ['align', 'wf']
+    assert project.local_dependents(['align', 'other']) == ['wf']
+    assert project.local_dependents(['wf']) == []
+
+    # with no ref given, compared with 'origin/main', or 'main' without remote
+    os.remove(os.path.join(root, 'other', 'notes.txt'))
+    assert test_cmd.select_changed_pkgs(project) == {'utils', 'align', 'wf'}
+    assert run_cmd(['git', 'update-ref', 'refs/remotes/origin/main', 'HEAD'], cwd=root)[2] == 0
+    assert test_cmd.select_changed_pkgs(project) == set()
+
+    # a ref not available, eg, not fetched, all packages are tested
+    assert test_cmd.select_changed_pkgs(project, since='0' * 40) == {'utils', 'align', 'wf', 'other'}
+    assert "Warning: unable to resolve git ref" in capsys.readouterr().out
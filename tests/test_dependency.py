@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import os
+import json
+import shutil
+import pytest
+import networkx as nx
+from wfpm.cache import hash_file
+from wfpm.package import Package, INSTALLED_RELEASE_JSON
+from wfpm.dependency import DependentsIndex, build_dep_graph, installed_package
+from wfpm.utils import run_cmd
+
+PROJECT = 'github.com/acct/repo'
+
+
+def write_pkg_json(pkg_dir, name, version, dependencies=(), devDependencies=()):
+    os.makedirs(pkg_dir, exist_ok=True)
+    with open(os.path.join(pkg_dir, 'pkg.json'), 'w') as f:
+        json.dump({
+            'name': name,
+            'version': version,
+            'main': 'main',
+            'repository': {'type': 'git', 'url': 'https://github.com/Acct/repo.git'},
+            'dependencies': list(dependencies),
+            'devDependencies': list(devDependencies)
+        }, f)
+
+
+def write_installed_pkg(modules, name, version, dependencies=()):
+    """
+    An installed package as 'Package.install' leaves it, with the release json listing its files
+    """
+    pkg_dir = os.path.join(modules, f"{name}@{version}")
+    write_pkg_json(pkg_dir, name, version, dependencies)
+    with open(os.path.join(pkg_dir, 'main.nf'), 'w') as f:
+        f.write(f"version = '{version}'\n")
+
+    files = [
+        {'path': f, 'size': os.path.getsize(os.path.join(pkg_dir, f)), 'checksum': hash_file(os.path.join(pkg_dir, f))}
+        for f in ('main.nf', 'pkg.json')
+    ]
+    os.symlink(os.path.join('..', '..', '..', '..', '..', 'wfpr_modules'), os.path.join(pkg_dir, 'wfpr_modules'))
+    with open(os.path.join(pkg_dir, INSTALLED_RELEASE_JSON), 'w') as f:
+        json.dump({'_release': {'assets': [{'filename': f"{name}.v{version}.tar.gz", 'files': files}]}}, f)
+
+    return pkg_dir
+
+
+def test_dependents_index(tmp_path):
+    root = str(tmp_path)
+    write_pkg_json(os.path.join(root, 'utils'), 'utils', '1.1.0')
+    write_pkg_json(os.path.join(root, 'align'), 'align', '0.1.0', [f"{PROJECT}/utils@1.0.0"])
+    write_pkg_json(os.path.join(root, 'wf'), 'wf', '0.1.0', [f"{PROJECT}/align@0.1.0"], [f"{PROJECT}/utils@1.1.0"])
+    write_pkg_json(os.path.join(root, 'wfpr_modules', 'github.com', 'acct', 'repo', 'utils@1.0.0'), 'utils', '1.0.0')
+
+    index_file = os.path.join(root, 'index.json')
+    index = DependentsIndex(root, path=index_file)
+    assert index.refresh()
+    assert not index.refresh()
+
+    assert index.direct_dependents(f"{PROJECT}/utils@1.0.0") == {f"{PROJECT}/align@0.1.0": 'dependencies'}
+    assert sorted(index.direct_dependents(f"{PROJECT}/utils", any_version=True)) == \
+        [f"{PROJECT}/align@0.1.0", f"{PROJECT}/wf@0.1.0"]
+    assert index.all_dependents(f"{PROJECT.upper()}/utils@1.0.0") == [f"{PROJECT}/align@0.1.0", f"{PROJECT}/wf@0.1.0"]
+    assert index.why(f"{PROJECT}/utils@1.0.0") == [
+        [f"{PROJECT}/align@0.1.0", f"{PROJECT}/utils@1.0.0"],
+        [f"{PROJECT}/wf@0.1.0", f"{PROJECT}/align@0.1.0", f"{PROJECT}/utils@1.0.0"],
+    ]
+
+    # persisted index is picked up, only changed pkg.json files are read again
+    write_pkg_json(os.path.join(root, 'align'), 'align', '0.1.0', [f"{PROJECT}/utils@1.1.0"])
+    index = DependentsIndex(root, path=index_file)
+    assert index.direct_dependents(f"{PROJECT}/utils@1.0.0")
+    assert index.refresh()
+    assert index.direct_dependents(f"{PROJECT}/utils@1.0.0") == {}
+    assert sorted(index.direct_dependents(f"{PROJECT}/utils@1.1.0").items()) == \
+        [(f"{PROJECT}/align@0.1.0", 'dependencies'), (f"{PROJECT}/wf@0.1.0", 'devDependencies')]
+
+    os.remove(os.path.join(root, 'wf', 'pkg.json'))
+    assert index.refresh()
+    assert index.all_dependents(f"{PROJECT}/utils@1.1.0") == [f"{PROJECT}/align@0.1.0"]
+
+
+def test_build_dep_graph_from_installed(tmp_path):
+    root = str(tmp_path)
+    modules = os.path.join(root, 'wfpr_modules', 'github.com', 'acct', 'repo')
+    write_installed_pkg(modules, 'utils', '1.0.0')
+    write_installed_pkg(modules, 'align', '0.1.0', [f"{PROJECT}/utils@1.0.0"])
+    write_pkg_json(os.path.join(root, 'wf'), 'wf', '0.1.0', [f"{PROJECT}/align@0.1.0", f"{PROJECT}/utils@1.0.0"])
+
+    # installed packages are read from the project, nothing is fetched
+    dep_graph = nx.DiGraph()
+    build_dep_graph(Package(pkg_json=os.path.join(root, 'wf', 'pkg.json')), DG=dep_graph, project_root=root)
+
+    assert list(nx.topological_sort(dep_graph)) == [f"{PROJECT}/wf@0.1.0", f"{PROJECT}/align@0.1.0", f"{PROJECT}/utils@1.0.0"]
+    assert dep_graph.nodes[f"{PROJECT}/utils@1.0.0"]['pkg'].pkg_path == os.path.realpath(os.path.join(modules, 'utils@1.0.0'))
+
+
+def test_dependents_index_skips_unreadable_pkg_json(tmp_path, capsys):
+    root = str(tmp_path)
+    write_pkg_json(os.path.join(root, 'align'), 'align', '0.1.0', [f"{PROJECT}/utils@1.0.0"])
+    os.makedirs(os.path.join(root, 'broken'))
+    with open(os.path.join(root, 'broken', 'pkg.json'), 'w') as f:
+        f.write('{"name": ')
+
+    index_file = os.path.join(root, 'index.json')
+    index = DependentsIndex(root, path=index_file)
+    assert index.refresh()
+    assert 'unable to read broken/pkg.json' in capsys.readouterr().out
+    assert index.local_pkg_uris == [f"{PROJECT}/align@0.1.0"]
+
+    # not recorded as up to date, read again once fixed
+    write_pkg_json(os.path.join(root, 'broken'), 'broken', '0.1.0', [f"{PROJECT}/utils@1.0.0"])
+    index = DependentsIndex(root, path=index_file)
+    assert index.refresh()
+    assert sorted(index.direct_dependents(f"{PROJECT}/utils@1.0.0")) == [f"{PROJECT}/align@0.1.0", f"{PROJECT}/broken@0.1.0"]
+
+
+def test_build_dep_graph_skips_unresolved(tmp_path, monkeypatch, capsys):
+    def package(pkg_uri=None, pkg_json=None):
+        if pkg_uri:
+            raise Exception(f"Package not found: {pkg_uri}")
+        return Package(pkg_json=pkg_json)
+
+    monkeypatch.setattr('wfpm.dependency.Package', package)
+    root = str(tmp_path)
+    modules = os.path.join(root, 'wfpr_modules', 'github.com', 'acct', 'repo')
+    write_installed_pkg(modules, 'utils', '1.0.0')
+    write_pkg_json(os.path.join(root, 'wf'), 'wf', '0.1.0', [f"{PROJECT}/missing@0.1.0", f"{PROJECT}/utils@1.0.0"])
+
+    dep_graph = nx.DiGraph()
+    build_dep_graph(Package(pkg_json=os.path.join(root, 'wf', 'pkg.json')), DG=dep_graph, project_root=root)
+
+    assert f"unable to resolve package '{PROJECT}/missing@0.1.0'" in capsys.readouterr().out
+    assert 'pkg' not in dep_graph.nodes[f"{PROJECT}/missing@0.1.0"]
+    assert dep_graph.nodes[f"{PROJECT}/missing@0.1.0"]['error']
+    assert 'pkg' in dep_graph.nodes[f"{PROJECT}/utils@1.0.0"]
+
+
+def test_installed_package_not_reused_when_changed(tmp_path, capsys):
+    root = str(tmp_path)
+    modules = os.path.join(root, 'wfpr_modules', 'github.com', 'acct', 'repo')
+    pkg_dir = write_installed_pkg(modules, 'utils', '1.0.0')
+    assert installed_package(f"{PROJECT}/utils@1.0.0", root).pkg_path == os.path.realpath(pkg_dir)
+
+    with open(os.path.join(pkg_dir, 'main.nf'), 'a') as f:
+        f.write('// changed\n')
+    assert installed_package(f"{PROJECT}/utils@1.0.0", root) is None
+    assert 'File changed: main.nf' in capsys.readouterr().out
+
+    # installed by a wfpm keeping no release manifest, reused as long as pkg.json matches
+    os.remove(os.path.join(pkg_dir, INSTALLED_RELEASE_JSON))
+    assert installed_package(f"{PROJECT}/utils@1.0.0", root).pkg_path == os.path.realpath(pkg_dir)
+
+    write_pkg_json(pkg_dir, 'utils', '1.0.1')
+    assert installed_package(f"{PROJECT}/utils@1.0.0", root) is None
+
+
+def test_install_replaces_only_once_complete(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    source = os.path.join(root, 'source')
+    write_pkg_json(source, 'utils', '1.0.0')
+    with open(os.path.join(source, 'main.nf'), 'w') as f:
+        f.write("version = '1.0.0'\n")
+    tarball = os.path.join(root, 'utils.tar.gz')
+    run_cmd(['tar', '-czf', tarball, '-C', source, '.'])
+
+    downloads = {'tarball': tarball}
+
+    def download(self, url, local_path):
+        if not downloads['tarball']:
+            return None  # not released
+        shutil.copy(downloads['tarball'], local_path)
+        return hash_file(local_path)
+
+    monkeypatch.setattr(Package, '_download', download)
+    modules = os.path.join(root, 'project', 'wfpr_modules', 'github.com', 'acct', 'repo')
+    previous = os.path.join(modules, 'utils@1.0.0')
+    write_pkg_json(previous, 'utils', '1.0.0')
+    with open(os.path.join(previous, 'local.txt'), 'w') as f:
+        f.write('changed by hand\n')
+
+    # the download fails, the previous installation is kept as it was
+    downloads['tarball'] = None
+    with pytest.raises(Exception, match='has not been released'):
+        Package(pkg_json=os.path.join(source, 'pkg.json')).install(os.path.join(root, 'project'), force=True)
+    assert os.path.isfile(os.path.join(previous, 'local.txt'))
+
+    # unpacking fails, same
+    downloads['tarball'] = os.path.join(root, 'source', 'main.nf')
+    with pytest.raises(Exception, match='installation failed'):
+        Package(pkg_json=os.path.join(source, 'pkg.json')).install(os.path.join(root, 'project'), force=True)
+    assert os.path.isfile(os.path.join(previous, 'local.txt'))
+
+    downloads['tarball'] = tarball
+    path = Package(pkg_json=os.path.join(source, 'pkg.json')).install(os.path.join(root, 'project'), force=True)
+    assert path == previous
+    assert sorted(os.listdir(path)) == ['main.nf', 'pkg.json', 'wfpr_modules']
+    assert os.listdir(modules) == ['utils@1.0.0']  # nothing left from staging
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import gzip
+from wfpm.diff import compare_lines, compare_bytes, content_digest
+
+
+def test_compare_streams(workdir):
+    lines = [f'line {i} <div id="header_filename">Tue {i}<br/>x</div>\n' for i in range(1000)]
+    with open('output.txt', 'w') as f:
+        f.writelines(lines)
+    with open('expected.bgz', 'wb') as f:  # multi-member gzip as in BGZF
+        for i in range(0, len(lines), 300):
+            f.write(gzip.compress(''.join(lines[i:i + 300]).replace('Tue', 'Wed').encode()))
+
+    mismatch = compare_bytes('output.txt', 'expected.bgz')
+    assert (mismatch.line, mismatch.column, mismatch.offset) == (1, 34, 33)
+    assert 'Wed 0' in mismatch.expected_excerpt
+
+    rule = 's#"header_filename">.*<br/>#"header_filename"><br/>#'
+    assert compare_lines('output.txt', 'expected.bgz', [rule]) is None
+
+    with open('output.txt', 'a') as f:
+        f.write('extra\n')
+    mismatch = compare_lines('output.txt', 'expected.bgz', [rule])
+    assert mismatch.line == 1001 and mismatch.expected_excerpt == '<end of file>'
+
+    with gzip.open('output.txt.gz', 'wb') as f, open('output.txt', 'rb') as o:
+        f.write(o.read())
+    assert content_digest('output.txt.gz') == content_digest('output.txt') != content_digest('expected.bgz')
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import wfpm.execution
+from wfpm.execution import run_process, ResourceScheduler
+from wfpm.utils import run_cmd
+
+
+def test_run_cmd_argv_and_shell(workdir):
+    assert run_cmd(['echo', 'a b; exit 1']) == ('a b; exit 1', '', 0)
+    assert run_cmd('echo out; echo err >&2; exit 3') == ('out', 'err', 3)
+    assert run_cmd(['no-such-command'])[2] == 127
+
+
+def test_run_process_output_tail_and_log(workdir):
+    log_file = os.path.join(workdir, 'run.log')
+    result = run_process('for i in $(seq 1 100); do echo line $i; done', shell=True, max_lines=3,
+                         log_file=log_file)
+
+    assert result.returncode == 0
+    assert result.stdout == 'line 98\nline 99\nline 100\n'
+    assert result.max_rss > 0
+    with open(log_file) as f:
+        assert len(f.readlines()) == 100
+
+
+def test_run_process_input(workdir):
+    lines = ''.join(f"line {i}\n" for i in range(100000))  # more than a pipe holds
+    result = run_process(['cat'], input=lines)
+    assert result.returncode == 0 and result.stdout == lines
+
+    result = run_process(['true'], input=lines)  # stdin not read at all
+    assert result.returncode == 0 and not result.truncated
+
+
+def test_run_process_timeout_kills_process_group(workdir):
+    result = run_process('sleep 30 & sleep 30', shell=True, timeout=1)
+
+    assert result.timed_out
+    assert result.returncode != 0
+    assert result.duration < 10
+    assert 'timed out after 1 seconds' in result.stderr
+
+
+def test_resource_scheduler_packs_tasks_within_budget():
+    lock = threading.Lock()
+    usage = {'cpus': 0, 'peak': 0}
+
+    def task(cpus):
+        with lock:
+            usage['cpus'] += cpus
+            usage['peak'] = max(usage['peak'], usage['cpus'])
+        time.sleep(0.2)
+        with lock:
+            usage['cpus'] -= cpus
+        return cpus
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        scheduler = ResourceScheduler(executor, max_cpus=4)
+        futures = [scheduler.submit(cpus, 1, task, cpus) for cpus in (2, 3, 2, 1)]
+        assert [f.result() for f in futures] == [2, 3, 2, 1]
+        assert usage['peak'] <= 4
+
+        # a task larger than the budget still runs, on its own, tasks waiting meanwhile can be cancelled
+        usage['peak'] = 0
+        futures = [scheduler.submit(cpus, 1, task, cpus) for cpus in (6, 1, 1)]
+        assert futures[2].cancel()
+        assert futures[0].result() == 6 and futures[1].result() == 1
+        assert usage['peak'] == 6
+
+
+def test_run_process_output_held_by_leftover_process(workdir, monkeypatch):
+    monkeypatch.setattr(wfpm.execution, 'KILL_GRACE_PERIOD', 0.5)
+    log_file = os.path.join(workdir, 'leftover.log')
+    # the background sleep keeps stdout open after the shell exited
+    result = run_process('echo before; sleep 5 & echo after', shell=True, log_file=log_file)
+
+    assert result.returncode == 0
+    assert result.truncated
+    assert result.duration < 4
+    assert result.stdout == 'before\nafter\n'
+    assert 'Output truncated' in result.stderr
+    with open(log_file) as f:
+        assert f.read().startswith('before\nafter\n')
+
+    result = run_process(['printf', 'no newline at the end'])
+    assert result.stdout == 'no newline at the end' and not result.truncated
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+
+import os
+import time
+import threading
+import importlib
+
+# the module, 'wfpm.cli.install_cmd' is also the name of the command function re-exported by 'wfpm.cli'
+install_cmd = importlib.import_module('wfpm.cli.install_cmd')
+
+
+class FakePackage(object):
+    """
+    Package resolved for installation, installing it takes 'delay' seconds and fails with 'error'
+    """
+    def __init__(self, name, events, delay=0.0, error=None, dependencies=()):
+        self.pkg_uri = f"github.com/acct/repo/{name}@0.1.0"
+        self.allDependencies = [f"github.com/acct/repo/{d}@0.1.0" for d in dependencies]
+        self.tarball_sha256 = f"sha-{name}"
+        self.pkg_path = None
+        self.events = events
+        self.delay = delay
+        self.error = error
+
+    def install(self, install_dest, force=False):
+        time.sleep(self.delay)
+        if self.error:
+            raise Exception(self.error)
+        self.events.append(('installed', self.pkg_uri, time.monotonic()))
+        return os.path.join(install_dest, 'wfpr_modules', *self.pkg_uri.split('/'))
+
+    def __repr__(self):
+        return self.pkg_uri
+
+
+class FakeJob(object):
+    def __init__(self, job_file):
+        self.job_file = job_file
+
+
+def test_install_deps_verifies_while_installing(tmp_path, monkeypatch):
+    events = []
+    lock = threading.Lock()
+    deps = {
+        'fast': FakePackage('fast', events),
+        'slow': FakePackage('slow', events, delay=0.5),
+        'broken': FakePackage('broken', events, error='Package downloaded but installation failed'),
+    }
+    root = FakePackage('wf', events, dependencies=['fast', 'slow', 'broken', 'unknown'])
+
+    def build_dep_graph(start_pkg, DG=None, project_root=None):
+        DG.add_node(start_pkg.pkg_uri, pkg=start_pkg)
+        for name in ('fast', 'slow', 'broken'):
+            DG.add_node(deps[name].pkg_uri, pkg=deps[name])
+            DG.add_edge(start_pkg.pkg_uri, deps[name].pkg_uri)
+        DG.add_edge(start_pkg.pkg_uri, 'github.com/acct/repo/unknown@0.1.0')  # not resolved
+
+    def verify_installed_pkg(path, pkg_uri=None, tarball_sha256=None, retest=False):
+        with lock:
+            events.append(('verifying', pkg_uri, time.monotonic()))
+        return [f"Validating package: {path}"], [], []
+
+    monkeypatch.setattr(install_cmd, 'build_dep_graph', build_dep_graph)
+    monkeypatch.setattr(install_cmd, 'verify_installed_pkg', verify_installed_pkg)
+
+    installed, failed = install_cmd.install_deps([root], str(tmp_path), jobs=2, install_jobs=3)
+
+    assert sorted(p.pkg_uri for p in installed) == [deps['fast'].pkg_uri, deps['slow'].pkg_uri]
+    assert sorted(str(p) for p in failed) == [deps['broken'].pkg_uri, 'github.com/acct/repo/unknown@0.1.0']
+
+    # the package installed first is verified while the slow one is still being installed
+    times = {(event, uri): t for event, uri, t in events}
+    assert times[('verifying', deps['fast'].pkg_uri)] < times[('installed', deps['slow'].pkg_uri)]
+    assert ('verifying', deps['broken'].pkg_uri) not in times
+
+
+def test_install_deps_verifies_after_dependencies_installed(tmp_path, monkeypatch):
+    events = []
+    lock = threading.Lock()
+    lib = FakePackage('lib', events, delay=0.5)  # dependency of 'app', the slowest to download
+    app = FakePackage('app', events, dependencies=['lib'])
+    qc = FakePackage('qc', events)
+    root = FakePackage('wf', events, dependencies=['app', 'qc'])
+
+    def build_dep_graph(start_pkg, DG=None, project_root=None):
+        for pkg, deps in ((root, [app, qc]), (app, [lib]), (qc, []), (lib, [])):
+            DG.add_node(pkg.pkg_uri, pkg=pkg)
+            for dep in deps:
+                DG.add_edge(pkg.pkg_uri, dep.pkg_uri)
+
+    def verify_installed_pkg(path, pkg_uri=None, tarball_sha256=None, retest=False):
+        with lock:
+            events.append(('verifying', pkg_uri, time.monotonic()))
+        return [f"Validating package: {path}"], [], []
+
+    monkeypatch.setattr(install_cmd, 'build_dep_graph', build_dep_graph)
+    monkeypatch.setattr(install_cmd, 'verify_installed_pkg', verify_installed_pkg)
+
+    installed, failed = install_cmd.install_deps([root], str(tmp_path), jobs=3, install_jobs=3)
+    assert sorted(p.pkg_uri for p in installed) == sorted([lib.pkg_uri, app.pkg_uri, qc.pkg_uri])
+    assert not failed
+
+    # 'app' is installed well before 'lib', but only tested once 'lib' is there too
+    times = {(event, uri): t for event, uri, t in events}
+    assert times[('installed', app.pkg_uri)] < times[('installed', lib.pkg_uri)]
+    assert times[('verifying', app.pkg_uri)] >= times[('installed', lib.pkg_uri)]
+    assert times[('verifying', qc.pkg_uri)] < times[('installed', lib.pkg_uri)]
+
+
+def test_attestation_cache_hits_and_misses(tmp_path, monkeypatch):
+    monkeypatch.setenv('WFPM_CACHE_DIR', str(tmp_path / 'cache'))
+    path = str(tmp_path / 'wfpr_modules' / 'github.com' / 'acct' / 'repo' / 'qc@0.1.0')
+    pkg_uri = 'github.com/acct/repo/qc@0.1.0'
+    jobs = [FakeJob(os.path.join(path, 'tests', f"test-job-{i}.json")) for i in (1, 2)]
+    runs = []
+    returncodes = [0]
+
+    class InstalledPackage(object):
+        def __init__(self, pkg_json=None):
+            pass
+
+        def validate(self, repo_server, repo_account, repo_name):
+            return []
+
+        def install_tests(self):
+            return False
+
+    def run_test_jobs(test_jobs, use_cache=True, report=None):
+        runs.append(len(test_jobs))
+        return [install_cmd.TestResult(job=job, returncode=returncodes[0], duration=1.0) for job in test_jobs]
+
+    monkeypatch.setattr(install_cmd, 'Package', InstalledPackage)
+    monkeypatch.setattr(install_cmd, 'collect_test_jobs', lambda pkg_path: jobs)
+    monkeypatch.setattr(install_cmd, 'run_test_jobs', run_test_jobs)
+    monkeypatch.setattr(install_cmd, 'nextflow_version', lambda: '21.04.1')
+    monkeypatch.setattr(install_cmd, 'git_user', lambda: 'Tester <tester@example.com>')
+
+    # miss: tests run and the outcome is recorded
+    lines, issues, results = install_cmd.verify_installed_pkg(path, pkg_uri, 'sha-1')
+    assert runs == [2] and not issues
+    assert not any(r.cached for r in results)
+
+    # hit: same package, tarball and Nextflow version
+    lines, issues, results = install_cmd.verify_installed_pkg(path, pkg_uri, 'sha-1')
+    assert runs == [2]
+    assert all(r.cached and r.passed for r in results)
+    assert 'by git user Tester <tester@example.com>' in lines[-1]
+
+    record = install_cmd.AttestationCache().get(install_cmd.AttestationCache.key(pkg_uri, 'sha-1', '21.04.1'))
+    assert record['passed'] and record['tests'] == 2 and record['recorded_by'] == 'Tester <tester@example.com>'
+
+    # miss: a different tarball, a different Nextflow version, or asked to retest
+    install_cmd.verify_installed_pkg(path, pkg_uri, 'sha-2')
+    assert runs == [2, 2]
+    monkeypatch.setattr(install_cmd, 'nextflow_version', lambda: '22.10.0')
+    install_cmd.verify_installed_pkg(path, pkg_uri, 'sha-1')
+    assert runs == [2, 2, 2]
+    install_cmd.verify_installed_pkg(path, pkg_uri, 'sha-1', retest=True)
+    assert runs == [2, 2, 2, 2]
+
+    # no tarball digest, nothing to attest to
+    install_cmd.verify_installed_pkg(path, pkg_uri)
+    install_cmd.verify_installed_pkg(path, pkg_uri)
+    assert runs == [2, 2, 2, 2, 2, 2]
+
+    # failed tests are recorded but never reused
+    returncodes[0] = 1
+    install_cmd.verify_installed_pkg(path, pkg_uri, 'sha-3')
+    returncodes[0] = 0
+    lines, issues, results = install_cmd.verify_installed_pkg(path, pkg_uri, 'sha-3')
+    assert runs == [2, 2, 2, 2, 2, 2, 2, 2]
+    assert not any(r.cached for r in results)
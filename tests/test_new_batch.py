@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+
+import os
+import sys
+import json
+import pytest
+from pathlib import Path
+from click.testing import CliRunner
+from wfpm.cli import main
+from wfpm.package import Package
+from wfpm.utils import run_cmd
+
+TEST_DIR = Path(__file__).parent
+DATA_DIR = os.path.join(TEST_DIR, 'data')
+
+
+@pytest.mark.datafiles(DATA_DIR)
+def test_new_batch(workdir, datafiles):
+    # unpack _project_dir.tar.gz to under workdir, then make it cwd
+    run_cmd(f'cd {datafiles} && tar xzf _project_dir.tar.gz -C {workdir}')
+    os.chdir(os.path.join(workdir, '_project_dir'))
+
+    with open(os.path.join(datafiles, 'new_tool', 'good', 'conf.json'), 'r') as f:
+        conf = json.load(f)
+    manifest = os.path.join(workdir, 'manifest.json')
+    with open(manifest, 'w') as f:
+        json.dump({'packages': [
+            {'type': 'tool', 'name': 'tool-a', 'conf': conf},
+            {'type': 'tool', 'name': 'tool-b', 'conf': dict(conf, pkg_version='0.1.0')},
+        ]}, f)
+
+    runner = CliRunner()
+    result = runner.invoke(main, ['new', '--batch', manifest])
+    assert "New package created in branch: tool-a@0.2.0" in result.output
+    assert "New package created in branch: tool-b@0.1.0" in result.output
+
+    # current branch and working tree stay untouched
+    stdout, _, _ = run_cmd('git status --porcelain && git rev-parse --abbrev-ref HEAD')
+    assert stdout == 'main'
+    assert not os.path.exists('tool-a')
+
+    stdout, _, _ = run_cmd('git ls-tree -r --name-only tool-b@0.1.0')
+    assert 'tool-b/pkg.json' in stdout.split('\n')
+    assert 'tool-b/wfpr_modules' in stdout.split('\n')
+
+    result = runner.invoke(main, ['new', '--batch', manifest])
+    assert "Package 'tool-a' is already in development as 'tool-a@0.2.0'." in result.output
+
+
+@pytest.mark.datafiles(DATA_DIR)
+def test_new_batch_puts_back_replaced_installs(workdir, datafiles, monkeypatch):
+    project_dir = os.path.join(workdir, 'replaced')  # a fresh project, not the one of the test above
+    os.makedirs(project_dir)
+    run_cmd(f'cd {datafiles} && tar xzf _project_dir.tar.gz -C {project_dir}')
+    os.chdir(os.path.join(project_dir, '_project_dir'))
+
+    modules = os.path.join(os.getcwd(), 'wfpr_modules', 'github.com', 'icgc-argo', 'demo-repo')
+    legacy, broken = os.path.join(modules, 'utils@0.1.0'), os.path.join(modules, 'qc@0.1.0')
+    for path, name in ((legacy, 'utils'), (broken, 'qc')):
+        os.makedirs(path)
+        with open(os.path.join(path, 'pkg.json'), 'w') as f:
+            json.dump({'name': name, 'version': '0.1.0', 'main': 'main',
+                       'repository': {'url': 'https://github.com/icgc-argo/demo-repo.git'}}, f)
+    # installed by an earlier wfpm without release manifest, reused
+    with open(os.path.join(legacy, 'main.nf'), 'w') as f:
+        f.write("version = '0.1.0'\n")
+    # installed with a manifest, but a file is missing, installed again
+    with open(os.path.join(broken, '.pkg-release.json'), 'w') as f:
+        json.dump({'_release': {'assets': [{'files': [{'path': 'main.nf', 'size': 1, 'checksum': 'x'}]}]}}, f)
+    run_cmd('git add wfpr_modules && git -c user.name=t -c user.email=t@t commit -qm "installed"')
+    broken_files = sorted(os.listdir(broken))
+
+    def install_deps(pkgs, install_dest, **kwargs):
+        assert os.path.isdir(legacy) and not os.path.exists(broken)  # only the one to replace is set aside
+        os.makedirs(broken)
+        for name, content in (('pkg.json', open(os.path.join(legacy, 'pkg.json')).read().replace('utils', 'qc')),
+                              ('main.nf', "version = '0.1.0'\n")):
+            with open(os.path.join(broken, name), 'w') as f:
+                f.write(content)
+        return [Package(pkg_json=os.path.join(path, 'pkg.json')) for path in (legacy, broken)], []
+
+    monkeypatch.setattr(sys.modules['wfpm.cli.new_cmd'], 'install_deps', install_deps)  # module, not the command
+    with open(os.path.join(datafiles, 'new_tool', 'good', 'conf.json'), 'r') as f:
+        conf = json.load(f)
+    conf['dependencies'] = 'github.com/icgc-argo/demo-repo/utils@0.1.0, github.com/icgc-argo/demo-repo/qc@0.1.0'
+    manifest = os.path.join(project_dir, 'manifest.json')
+    with open(manifest, 'w') as f:
+        json.dump([{'type': 'tool', 'name': 'tool-c', 'conf': conf}], f)
+
+    result = CliRunner().invoke(main, ['new', '--batch', manifest])
+    assert "New package created in branch: tool-c@0.2.0" in result.output
+
+    # the reinstalled copy is committed in the new branch, the current branch is left as it was
+    stdout, _, _ = run_cmd('git ls-tree -r --name-only tool-c@0.2.0')
+    assert 'wfpr_modules/github.com/icgc-argo/demo-repo/qc@0.1.0/main.nf' in stdout.split('\n')
+    stdout, _, _ = run_cmd('git status --porcelain')
+    assert stdout == ''
+    assert sorted(os.listdir(broken)) == broken_files
@@ -20,10 +20,13 @@
 """
 
 import os
+import sys
+import json
 import pytest
 from pathlib import Path
 from click.testing import CliRunner
 from wfpm.cli import main
+from wfpm.package import Package
 from wfpm.utils import run_cmd
 
 TEST_DIR = Path(__file__).parent
@@ -88,3 +91,38 @@ def test_good_new_tool_workon_none(workdir, datafiles):
 
     assert "Package being worked on: <none>" in result.output
     assert "Packages released: <none>\nPackages in development:\n  fastqc: 0.2.0" in result.output
+
+
+@pytest.mark.datafiles(DATA_DIR)
+def test_new_tool_rolls_back_new_installs(workdir, datafiles, monkeypatch):
+    project_dir = os.path.join(workdir, 'rollback')  # a fresh project, not the one of the tests above
+    os.makedirs(project_dir)
+    run_cmd(f'cd {datafiles} && tar xzf _project_dir.tar.gz -C {project_dir}')
+    os.chdir(os.path.join(project_dir, '_project_dir'))
+    installed_dir = os.path.join(os.getcwd(), 'wfpr_modules', 'github.com', 'icgc-argo', 'demo-repo', 'utils@0.1.0')
+    broken_dir = os.path.join(os.path.dirname(installed_dir), 'qc@0.1.0')  # installed before, a file is missing
+    os.makedirs(broken_dir)
+    with open(os.path.join(broken_dir, 'pkg.json'), 'w') as f:
+        json.dump({'name': 'qc', 'version': '0.1.0', 'main': 'main',
+                   'repository': {'url': 'https://github.com/icgc-argo/demo-repo.git'}}, f)
+    with open(os.path.join(broken_dir, '.pkg-release.json'), 'w') as f:
+        json.dump({'_release': {'assets': [{'files': [{'path': 'main.nf', 'size': 1, 'checksum': 'x'}]}]}}, f)
+    run_cmd('git add wfpr_modules && git -c user.name=t -c user.email=t@t commit -qm "installed"')
+
+    def install_cmd(pkg_json=None, install_dest=None, **kwargs):  # one dependency installed, another failed
+        assert not os.path.exists(broken_dir)  # set aside to be installed again
+        os.makedirs(broken_dir)
+        os.makedirs(installed_dir)
+        with open(os.path.join(installed_dir, 'pkg.json'), 'w') as f:
+            json.dump({'name': 'utils', 'version': '0.1.0', 'main': 'main',
+                       'repository': {'url': 'https://github.com/icgc-argo/demo-repo.git'}}, f)
+        return [Package(pkg_json=os.path.join(installed_dir, 'pkg.json'))], ['github.com/icgc-argo/demo-repo/missing@0.1.0']
+
+    monkeypatch.setattr(sys.modules['wfpm.cli.new_cmd'], 'install_cmd', install_cmd)  # module, not the command
+    conf_json = os.path.join(datafiles, 'new_tool', 'good', 'conf.json')
+    result = CliRunner().invoke(main, ['new', 'tool', 'qc-tool', '-c', conf_json])
+
+    assert "Failed to install dependencies: github.com/icgc-argo/demo-repo/missing@0.1.0" in result.output
+    assert not os.path.exists(installed_dir)
+    assert not os.path.exists('qc-tool')
+    assert sorted(os.listdir(broken_dir)) == ['.pkg-release.json', 'pkg.json']  # put back as it was
@@ -47,7 +47,7 @@ def test_good_new_workflow(workdir, datafiles):
     assert "Tested package: demo-utils@1.3.0, PASSED: 3, FAILED: 0" in result.output
     assert "Checker script version '0.1.0' does not match version in pkg.json '0.2.0'" in result.output
 
-    assert "Copying dependency 'github.com/icgc-argo/demo-wfpkgs/demo-utils@1.3.0' to:" in result.output
+    assert "Package installed in: wfpr_modules/github.com/icgc-argo/demo-wfpkgs/demo-utils@1.3.0" in result.output
 
 
 @pytest.mark.datafiles(DATA_DIR)
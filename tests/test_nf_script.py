@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+from wfpm.nf_script import parse, literal_value
+
+
+SCRIPT = '''#!/usr/bin/env nextflow
+nextflow.enable.dsl = 2
+version = '1.2.3'  // version of the package
+params.version = 'not this one'
+
+/* workflow commented {
+*/
+include { fastqc as fq; cleanupWorkdir } from './wfpr_modules/github.com/a/b/demo-utils@1.0.0/main'
+include {
+  copyFile
+} from "./local_modules/copy-file" params([*:params, 'cleanup': false])
+
+def getSecondaryFiles(main_file, exts) {
+  if (main_file =~ /\\{[^}]+$/) { return ["${main_file}.${exts.collect { "${it}}" }}"] }
+}
+
+process align {
+  container "${params.container ?: 'a'}:${params.container_version ?: version}"
+  input:
+    tuple val(meta), path(reads)
+  output:
+    path "*.bam", emit: bam
+  script:
+    """
+    bwa mem ${reads} > out.bam { not a block
+    """
+}
+
+workflow AlignWf {
+  take:
+    reads
+  main:
+    align(reads.map { it -> [it, it] })
+  emit:
+    bam = align.out.bam
+}
+
+workflow {
+  AlignWf(Channel.fromPath(params.reads))
+}
+'''
+
+
+def test_parse_script():
+    symbols = parse(SCRIPT)
+
+    assert symbols.version == '1.2.3'
+    assert symbols.functions == ['getSecondaryFiles']
+    assert [(i.items, i.source) for i in symbols.includes] == [
+        ([('fastqc', 'fq'), ('cleanupWorkdir', 'cleanupWorkdir')], './wfpr_modules/github.com/a/b/demo-utils@1.0.0/main'),
+        ([('copyFile', 'copyFile')], './local_modules/copy-file')
+    ]
+
+    align = symbols.processes[0]
+    assert align.name == 'align'
+    assert [d.text for d in align.inputs] == ['tuple val(meta), path(reads)']
+    assert [(d.qualifier, d.emit) for d in align.outputs] == [('path', 'bam')]
+
+    workflow = symbols.workflows[0]
+    assert (workflow.name, workflow.take, workflow.emit, workflow.line) == ('AlignWf', ['reads'], ['bam'], 29)
+
+    entry = symbols.entry_workflow
+    assert SCRIPT[entry.body_start:entry.end].strip() == 'AlignWf(Channel.fromPath(params.reads))'
+
+    # names included from wfpr_modules are dependencies' own, not exported
+    assert symbols.exports == ['AlignWf', 'align', 'getSecondaryFiles', 'copyFile']
+    assert parse(SCRIPT) is symbols  # cached by content
+
+    assert [(p.name, literal_value(p.tokens)) for p in symbols.params] == [('version', (True, 'not this one'))]
+    params = parse('params.a = -1\nparams.b = "${params.a}/x"; params.c = [1,\n 2]\nif (params.a == 1) {}\n').params
+    assert [(p.name, p.value, literal_value(p.tokens)[0]) for p in params] == [
+        ('a', '-1', True), ('b', '"${params.a}/x"', False), ('c', '[1,\n 2]', False)
+    ]
+
+
+def test_functions_and_export_order():
+    symbols = parse('''
+def helper(x) { x }
+String label(String name)
+{
+  "${name}"
+}
+println helper(1)
+log.info label('a')
+foo bar(2)
+
+process copy {
+  script:
+    "cp a b"
+}
+
+workflow Inner {
+  copy()
+}
+
+workflow Main {
+  Inner()
+}
+''')
+    # calls at the top level are not function definitions
+    assert symbols.functions == ['helper', 'label']
+
+    # the workflow not called by another comes first, whatever the order of definitions
+    assert symbols.main_name == 'Main'
+    assert symbols.exports == ['Main', 'Inner', 'copy', 'helper', 'label']
+
+    # without named workflow, the process, eg, of a tool package
+    assert parse('def f() { 1 }\nprocess fastqc {\n  script:\n    "x"\n}\n').exports == ['fastqc', 'f']
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+
+import os
+import json
+import gzip
+import shutil
+import time
+import tarfile
+import wfpm.pack
+from wfpm.package import Package
+from wfpm.pack import pack
+from wfpm.testing import collect_test_jobs
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def make_pkg(pkg_dir):
+    write(os.path.join(pkg_dir, 'pkg.json'), json.dumps({
+        'name': 'demo',
+        'version': '0.2.0',
+        'main': 'main',
+        'repository': {'type': 'git', 'url': 'https://github.com/acct/repo.git'}
+    }))
+    write(os.path.join(pkg_dir, 'main.nf'), "version = '0.2.0'\n")
+    write(os.path.join(pkg_dir, 'tests', 'input', 'data.txt'), 'ACGT' * 5000)
+    write(os.path.join(pkg_dir, 'tests', 'work', 'ab', 'task.out'), 'scratch')
+    write(os.path.join(pkg_dir, 'tests', '.nextflow.log'), 'log')
+    os.makedirs(os.path.join(pkg_dir, 'wfpr_modules'))
+    os.symlink(os.path.join('..', 'wfpr_modules'), os.path.join(pkg_dir, 'tests', 'wfpr_modules'))
+    return Package(pkg_json=os.path.join(pkg_dir, 'pkg.json'))
+
+
+def test_pack_reproducible(tmp_path, monkeypatch):
+    monkeypatch.setattr(wfpm.pack, 'GZIP_CHUNK_SIZE', 4096)  # several gzip members
+    pkg = make_pkg(os.path.join(str(tmp_path), 'demo'))
+
+    first = pack(pkg, os.path.join(str(tmp_path), 'out1'), jobs=4)
+    time.sleep(0.01)
+    os.utime(os.path.join(pkg.pkg_path, 'main.nf'))
+    second = pack(pkg, os.path.join(str(tmp_path), 'out2'), jobs=1)
+
+    asset, asset2 = first['_release']['assets'][0], second['_release']['assets'][0]
+    assert asset['filename'] == 'demo.v0.2.0.tar.gz'
+    assert asset['checksum'] == asset2['checksum']
+    assert asset['content_checksum'] == asset2['content_checksum']
+    assert [f['path'] for f in asset['files']] == ['main.nf', 'pkg.json', 'tests/input/data.txt']
+
+    tarball = os.path.join(str(tmp_path), 'out1', asset['filename'])
+    assert os.path.getsize(tarball) == asset['size']
+    with tarfile.open(tarball, 'r:gz') as tar:
+        members = tar.getmembers()
+        assert [m.name for m in members] == ['.', './main.nf', './pkg.json', './tests', './tests/input',
+                                             './tests/input/data.txt']
+        assert {(m.mtime, m.uid, m.gid, m.uname, m.gname) for m in members} == {(0, 0, 0, '', '')}
+        assert tar.extractfile('./tests/input/data.txt').read() == b'ACGT' * 5000
+
+    with gzip.open(tarball, 'rb') as f:
+        assert len(f.read()) % tarfile.RECORDSIZE == 0
+
+    with open(os.path.join(str(tmp_path), 'out1', 'pkg-release.json'), 'r') as f:
+        assert json.load(f)['_release']['tag'] == 'demo.v0.2.0'
+
+
+def test_split_tests_install(tmp_path, monkeypatch):
+    monkeypatch.setenv('WFPM_CACHE_DIR', os.path.join(str(tmp_path), 'cache'))
+    pkg = make_pkg(os.path.join(str(tmp_path), 'demo'))
+    write(os.path.join(pkg.pkg_path, 'tests', 'checker.nf'), "version = '0.2.0'\n")
+    write(os.path.join(pkg.pkg_path, 'tests', 'test-job-1.json'), '{}')
+
+    out_dir = os.path.join(str(tmp_path), 'out')
+    release = pack(pkg, out_dir, split_tests=True)
+    assets = {a.get('content'): a for a in release['_release']['assets'] if 'files' in a}
+    assert sorted(a['filename'] for a in assets.values()) == [
+        'demo.v0.2.0.core.tar.gz', 'demo.v0.2.0.tar.gz', 'demo.v0.2.0.tests.tar.gz']
+    assert [f['path'] for f in assets['core']['files']] == ['main.nf', 'pkg.json']
+    with tarfile.open(os.path.join(out_dir, 'demo.v0.2.0.tests.tar.gz')) as tar:
+        assert all(name.startswith('./tests') for name in tar.getnames())  # no entry for the package dir
+
+    checksums = {a['filename']: a['checksum'] for a in assets.values()}
+    downloads = []
+
+    def download(self, url, local_path):  # release assets are served from the pack output dir
+        downloads.append(os.path.basename(url))
+        shutil.copy(os.path.join(out_dir, downloads[-1]), local_path)
+        return checksums[downloads[-1]]
+
+    monkeypatch.setattr(Package, '_download', download)
+    released = Package(pkg_json=os.path.join(pkg.pkg_path, 'pkg.json'))
+    released.release = release
+    path = released.install(os.path.join(str(tmp_path), 'project'))
+    assert downloads == ['demo.v0.2.0.core.tar.gz']
+    assert not os.path.exists(os.path.join(path, 'tests'))
+
+    installed = Package(pkg_json=os.path.join(path, 'pkg.json'))
+    assert installed.tests_pending
+    assert installed.validate() == []
+    assert [j.job_file for j in collect_test_jobs(path)] == [os.path.join(path, 'tests', 'test-job-1.json')]
+
+    assert installed.install_tests()
+    assert downloads == ['demo.v0.2.0.core.tar.gz', 'demo.v0.2.0.tests.tar.gz']
+    assert os.path.isfile(os.path.join(path, 'tests', 'checker.nf'))
+    assert os.path.islink(os.path.join(path, 'tests', 'wfpr_modules'))
+    assert not installed.tests_pending and not installed.install_tests()
+
+    shutil.rmtree(os.path.join(path, 'tests'))  # fetched again from the cache
+    assert installed.install_tests()
+    assert len(downloads) == 2
+
+
+def test_pack_keeps_nested_content_named_like_nextflow_artifacts(tmp_path):
+    pkg = make_pkg(os.path.join(str(tmp_path), 'demo'))
+    write(os.path.join(pkg.pkg_path, 'tests', 'input', 'outdir', 'expected.txt'), 'expected')
+    write(os.path.join(pkg.pkg_path, 'tests', 'input', 'work', 'sample.txt'), 'sample')
+    write(os.path.join(pkg.pkg_path, 'outdir', 'result.txt'), 'result')  # left by a run from the package dir
+
+    release = pack(pkg, os.path.join(str(tmp_path), 'out'))
+    assert [f['path'] for f in release['_release']['assets'][0]['files']] == [
+        'main.nf', 'pkg.json', 'tests/input/data.txt', 'tests/input/outdir/expected.txt', 'tests/input/work/sample.txt'
+    ]
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+
+import os
+import json
+import pytest
+import xml.etree.ElementTree as ET
+from wfpm import history, testing  # not the classes, pytest would take them for test classes
+from wfpm.report import write_report
+
+
+def make_results(tmp_path):
+    jobs = [
+        testing.TestJob(pkg_path=os.path.join(str(tmp_path), pkg), job_file=os.path.join(str(tmp_path), pkg, 'tests', name),
+                        pkg_id=f"github.com/acct/repo/{pkg}", pkg_version='0.1.0')
+        for pkg, name in [('align', 'test-job-1.json'), ('align', 'test-job-2.json'), ('qc', 'test-job-1.json'),
+                          ('qc', 'test-job-2.json')]
+    ]
+    return [
+        testing.TestResult(job=jobs[0], returncode=0, stdout='Launching `checker.nf` [happy_turing] DSL2', duration=12.5),
+        testing.TestResult(job=jobs[1], returncode=1, stdout='Test FAILED', stderr='mismatch', duration=3.25),
+        testing.TestResult(job=jobs[2], returncode=0, cached=True),
+        testing.TestResult(job=jobs[3], skipped=True),
+    ]
+
+
+def test_write_json_report(tmp_path):
+    report_file = os.path.join(str(tmp_path), 'report.json')
+    write_report(make_results(tmp_path), report_file)
+
+    with open(report_file) as f:
+        report = json.load(f)
+    assert report['summary'] == {'tests': 4, 'passed': 2, 'failed': 1, 'skipped': 1, 'cached': 1, 'duration': 15.75}
+    assert [t['id'] for t in report['tests']] == [
+        'github.com/acct/repo/align/test-job-1.json', 'github.com/acct/repo/align/test-job-2.json',
+        'github.com/acct/repo/qc/test-job-1.json', 'github.com/acct/repo/qc/test-job-2.json'
+    ]
+    assert report['tests'][0]['run_name'] == 'happy_turing' and report['tests'][0]['duration'] == 12.5
+    assert report['tests'][1]['exit_code'] == 1 and report['tests'][1]['stderr'] == 'mismatch'
+
+
+def test_write_junit_xml(tmp_path):
+    report_file = os.path.join(str(tmp_path), 'report.xml')
+    write_report(make_results(tmp_path), report_file)
+
+    testsuites = ET.parse(report_file).getroot()
+    assert (testsuites.get('tests'), testsuites.get('failures'), testsuites.get('skipped')) == ('4', '1', '1')
+    assert [s.get('name') for s in testsuites] == ['align', 'qc']
+
+    passed, failed = testsuites[0]
+    assert passed.get('time') == '12.500'
+    assert passed.find('properties/property').attrib == {'name': 'run_name', 'value': 'happy_turing'}
+    assert failed.find('failure').get('message') == 'Checker exited with code 1'
+    assert failed.find('system-err').text == 'mismatch'
+
+    cached, skipped = testsuites[1]
+    assert 'cached' in cached.find('system-out').text and cached.find('failure') is None
+    assert skipped.find('skipped') is not None
+
+
+def test_write_report_unknown_format(tmp_path):
+    with pytest.raises(Exception, match='Unknown report format'):
+        write_report(make_results(tmp_path), os.path.join(str(tmp_path), 'report.txt'))
+
+
+def test_history_slowest(tmp_path):
+    test_history = history.TestHistory(path=os.path.join(str(tmp_path), 'history.json'))
+    results = make_results(tmp_path)
+    for duration in (10.0, 10.0, 10.0, 20.0, 20.0, 20.0):
+        results[0].duration, results[1].duration = duration, 5.0
+        test_history.record(results)
+
+    unmeasured = testing.TestResult(job=results[2].job, returncode=0, duration=1.0, duration_measured=False)
+    test_history.record([unmeasured])
+
+    # a fresh instance reads what was recorded, cached and skipped jobs are not
+    test_history = history.TestHistory(path=test_history.path)
+    assert len(test_history.runs[results[2].job.id]) == 1 and test_history.durations(results[2].job.id) == []
+    assert results[3].job.id not in test_history.runs
+
+    slowest = test_history.slowest(id_prefix='github.com/acct/repo/')
+    assert [s['id'] for s in slowest] == [results[0].job.id, results[1].job.id]
+    assert slowest[0]['last'] == 20.0 and slowest[0]['average'] == 15.0 and slowest[0]['runs'] == 6
+    assert slowest[0]['trend'] == pytest.approx(1.0)
+    assert slowest[1]['trend'] == pytest.approx(0.0)
+    assert test_history.slowest(top=1) == slowest[:1]
+    assert test_history.slowest(id_prefix='github.com/other/') == []
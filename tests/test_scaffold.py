@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+
+import os
+import pytest
+from wfpm.scaffold import render_template, move_into_place
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def make_template(template):
+    write(os.path.join(template, '{{ cookiecutter.name }}', 'main.nf'),
+          "name = '{{ cookiecutter.name }}'\nversion = '{{ cookiecutter.version }}'\n"
+          "container = '{{ cookiecutter.container }}'\n")
+    write(os.path.join(template, '{{ cookiecutter.name }}', 'tests', 'test-job-1.json'), '{"name": "{{ cookiecutter.name }}"}')
+
+
+def test_render_template(tmp_path):
+    template = os.path.join(str(tmp_path), 'template')
+    make_template(template)
+    output_dir = os.path.join(str(tmp_path), 'staging')
+    os.makedirs(output_dir)
+
+    context = {
+        'name': 'demo-tool',
+        'version': '0.1.0',
+        'container': 'ghcr.io/acct/repo.{{ cookiecutter.name }}',  # derived from other fields
+    }
+    path = render_template(template, context, output_dir, extra_context={'version': '1.0.0'})
+
+    assert path == os.path.join(output_dir, 'demo-tool')
+    with open(os.path.join(path, 'main.nf')) as f:
+        assert f.read() == "name = 'demo-tool'\nversion = '1.0.0'\ncontainer = 'ghcr.io/acct/repo.demo-tool'\n"
+    with open(os.path.join(path, 'tests', 'test-job-1.json')) as f:
+        assert f.read() == '{"name": "demo-tool"}'
+
+    # the template is read where it is, nothing is written next to it
+    assert os.listdir(template) == ['{{ cookiecutter.name }}']
+    assert os.listdir(output_dir) == ['demo-tool']
+
+
+def test_move_into_place(tmp_path):
+    staged = os.path.join(str(tmp_path), 'staging', 'demo-tool')
+    write(os.path.join(staged, 'main.nf'), "version = '0.1.0'\n")
+    dest = os.path.join(str(tmp_path), 'project', 'demo-tool')
+
+    move_into_place(staged, dest)  # parent dir of the destination is created
+    assert os.path.isfile(os.path.join(dest, 'main.nf'))
+    assert not os.path.exists(staged)
+
+    # an existing destination is never overwritten, nor merged into
+    staged = os.path.join(str(tmp_path), 'staging', 'demo-tool')
+    write(os.path.join(staged, 'other.nf'), '')
+    with pytest.raises(Exception, match='Destination already exists'):
+        move_into_place(staged, dest)
+    assert os.listdir(dest) == ['main.nf']
+    assert os.path.isdir(staged)
+
+    os.symlink(os.path.join(str(tmp_path), 'missing'), os.path.join(str(tmp_path), 'project', 'dangling'))
+    with pytest.raises(Exception, match='Destination already exists'):
+        move_into_place(staged, os.path.join(str(tmp_path), 'project', 'dangling'))
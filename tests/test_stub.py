@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+
+from wfpm.stub import add_stub_blocks
+
+
+SCRIPT = '''
+process copyFile {
+  input:
+    path input_file
+
+  output:
+    path "output_dir/*.bam", emit: bam
+    tuple val(id), path("report.txt"), emit: report
+
+  script:
+    """
+    mkdir output_dir && cp ${input_file} output_dir/
+    """
+}
+
+process withStub {
+  output:
+    path "out.txt"
+
+  script:
+    """
+    echo real > out.txt
+    """
+
+  stub:
+    """
+    touch out.txt
+    """
+}
+'''
+
+
+def test_add_stub_blocks():
+    script_str, updated = add_stub_blocks(SCRIPT)
+
+    assert updated == ['copyFile']
+    assert '''    """
+
+  stub:
+    """
+    mkdir -p "output_dir"
+    touch "output_dir/stub.bam"
+    touch "report.txt"
+    """
+}
+
+process withStub {''' in script_str
+
+    # nothing more to add
+    assert add_stub_blocks(script_str) == (script_str, [])
+
+
+def test_add_stub_blocks_braces_in_strings_and_comments():
+    script_str = '''
+process braces {
+  output:
+    path("${params.prefix}.txt")  // a } in a comment
+    path 'out/'
+
+  script:
+    """
+    echo "}" > ${params.prefix}.txt  # stub: in a string is not a section
+    mkdir out
+    """
+}
+
+workflow {
+  braces()
+}
+'''
+    updated_str, updated = add_stub_blocks(script_str)
+
+    assert updated == ['braces']
+    assert '''    """
+
+  stub:
+    """
+    touch "${params.prefix}.txt"
+    mkdir -p "out/"
+    """
+}
+
+workflow {''' in updated_str
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+
+import os
+import json
+import time
+import threading
+from concurrent.futures import Future
+import wfpm.testing
+from wfpm.execution import ProcessResult
+from wfpm import history  # not TestHistory, pytest would take it for a test class
+from wfpm.testing import RunOptions, collect_test_jobs, run_test_jobs, gc_resume_dirs, shard_test_jobs, \
+    load_durations, order_failed_first, cancel_on_failure
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def make_pkg(pkg_dir, jobs=('test-job-1.json', 'test-job-2.json')):
+    write(os.path.join(pkg_dir, 'tests', 'checker.nf'), "version = '0.1.0'\n")
+    write(os.path.join(pkg_dir, 'tests', 'nextflow.config'), "includeConfig '../nextflow.config'\n")
+    write(os.path.join(pkg_dir, 'tests', 'input', 'data.txt'), 'data\n')
+    for job in jobs:
+        write(os.path.join(pkg_dir, 'tests', job), '{"input_file": "input/data.txt"}')
+
+    return collect_test_jobs(pkg_dir)
+
+
+def fake_nextflow(monkeypatch, returncodes=None, delay=0.0):
+    """
+    Stand-in for Nextflow runs, records the launch dir of each run, fails jobs given in 'returncodes'
+    """
+    runs = []
+    lock = threading.Lock()
+    state = {'running': 0, 'max_running': 0}
+
+    def run_nextflow(argv, launch_dir, opts, label='', timeout=None):
+        with lock:
+            state['running'] += 1
+            state['max_running'] = max(state['max_running'], state['running'])
+            runs.append({'argv': argv, 'launch_dir': launch_dir, 'entries': sorted(os.listdir(launch_dir))})
+        time.sleep(delay)
+        with lock:
+            state['running'] -= 1
+
+        job_file = argv[argv.index('-params-file') + 1]
+        return ProcessResult(argv=argv, returncode=(returncodes or {}).get(os.path.basename(job_file), 0))
+
+    monkeypatch.setattr(wfpm.testing, 'run_nextflow', run_nextflow)
+    return runs, state
+
+
+def test_run_test_jobs_in_parallel_isolated_launch_dirs(tmp_path, monkeypatch):
+    monkeypatch.setenv('WFPM_CACHE_DIR', os.path.join(str(tmp_path), 'cache'))
+    jobs = make_pkg(os.path.join(str(tmp_path), 'demo'), jobs=[f"test-job-{i}.json" for i in range(1, 5)])
+    write(os.path.join(str(tmp_path), 'demo', 'tests', '.nextflow.log'), 'left by a run from the tests dir\n')
+    runs, state = fake_nextflow(monkeypatch, returncodes={'test-job-3.json': 1}, delay=0.2)
+
+    results = run_test_jobs(jobs, max_workers=4, use_cache=False, report=lambda line: None)
+
+    assert state['max_running'] > 1
+    assert [r.job for r in results] == jobs  # reported in the order of the jobs
+    assert [r.passed for r in results] == [True, True, False, True]
+
+    launch_dirs = [run['launch_dir'] for run in runs]
+    assert len(set(launch_dirs)) == 4
+    for run in runs:  # tests entries linked in, Nextflow leftovers and the config not
+        assert run['entries'] == ['checker.nf', 'input', 'test-job-1.json', 'test-job-2.json',
+                                  'test-job-3.json', 'test-job-4.json']
+
+    # launch dirs of passed jobs are removed, the one of the failed job is kept for inspection
+    assert [os.path.isdir(r.launch_dir) for r in results] == [False, False, True, False]
+
+
+def test_job_cache_keys_invalidation(tmp_path, monkeypatch):
+    monkeypatch.setenv('WFPM_CACHE_DIR', os.path.join(str(tmp_path), 'cache'))
+    pkg_dir = os.path.join(str(tmp_path), 'demo')
+    jobs = make_pkg(pkg_dir)
+    write(os.path.join(pkg_dir, 'pkg.json'), '{"dependencies": ["github.com/acct/repo/utils@1.0.0"]}')
+    keys = wfpm.testing.test_job_cache_keys(jobs)
+    assert len(set(keys)) == 2
+    assert wfpm.testing.test_job_cache_keys(jobs) == keys
+    assert set(wfpm.testing.test_job_cache_keys(jobs, stub=True)).isdisjoint(keys)
+
+    # Nextflow leftovers do not count
+    write(os.path.join(pkg_dir, 'tests', 'work', 'ab', 'cdef', '.command.sh'), 'echo\n')
+    write(os.path.join(pkg_dir, 'outdir', 'result.txt'), 'result\n')
+    write(os.path.join(pkg_dir, '.nextflow.log.1'), 'log\n')
+    assert wfpm.testing.test_job_cache_keys(jobs) == keys
+
+    # package content of the same names deeper down does count, eg, an input fixture
+    write(os.path.join(pkg_dir, 'tests', 'input', 'outdir', 'expected.txt'), 'expected\n')
+    changed = wfpm.testing.test_job_cache_keys(jobs)
+    assert changed[0] != keys[0] and changed[1] != keys[1]
+    keys = changed
+    write(os.path.join(pkg_dir, 'tests', 'input', 'outdir', 'expected.txt'), 'changed\n')
+    changed = wfpm.testing.test_job_cache_keys(jobs)
+    assert changed[0] != keys[0] and changed[1] != keys[1]
+    keys = changed
+
+    write(jobs[0].job_file, '{"input_file": "input/other.txt"}')
+    changed = wfpm.testing.test_job_cache_keys(jobs)
+    assert changed[0] != keys[0]
+
+    keys = changed
+    write(os.path.join(pkg_dir, 'main.nf'), 'process demo {}\n')  # all jobs of the package
+    changed = wfpm.testing.test_job_cache_keys(jobs)
+    assert changed[0] != keys[0] and changed[1] != keys[1]
+
+    keys = changed
+    os.makedirs(os.path.join(pkg_dir, 'wfpr_modules', 'github.com', 'acct', 'repo', 'utils@1.0.0'))  # installed
+    changed = wfpm.testing.test_job_cache_keys(jobs)
+    assert changed[0] != keys[0] and changed[1] != keys[1]
+
+
+def test_run_test_jobs_passed_from_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('WFPM_CACHE_DIR', os.path.join(str(tmp_path), 'cache'))
+    jobs = make_pkg(os.path.join(str(tmp_path), 'demo'))
+    runs, _ = fake_nextflow(monkeypatch, returncodes={'test-job-2.json': 1})
+
+    run_test_jobs(jobs, report=lambda line: None)
+    assert len(runs) == 2
+
+    lines = []
+    results = run_test_jobs(jobs, report=lines.append)
+    assert len(runs) == 3  # the failed job only
+    assert [r.cached for r in results] == [True, False]
+    assert any(line.endswith('test-job-1.json. PASSED (cached)') for line in lines)
+
+
+def test_resume_keeps_launch_dirs(tmp_path, monkeypatch):
+    monkeypatch.setenv('WFPM_CACHE_DIR', os.path.join(str(tmp_path), 'cache'))
+    jobs = make_pkg(os.path.join(str(tmp_path), 'demo'))
+    runs, _ = fake_nextflow(monkeypatch)
+
+    opts = RunOptions(resume=True)
+    results = run_test_jobs(jobs, use_cache=False, opts=opts, report=lambda line: None)
+    for result in results:  # left as Nextflow would, to be resumed
+        write(os.path.join(result.launch_dir, 'work', 'ab', '.command.sh'), 'echo\n')
+
+    again = run_test_jobs(jobs, use_cache=False, opts=opts, report=lambda line: None)
+    assert [r.launch_dir for r in again] == [r.launch_dir for r in results]
+    assert all(os.path.isfile(os.path.join(r.launch_dir, 'work', 'ab', '.command.sh')) for r in again)
+    assert all(os.path.islink(os.path.join(r.launch_dir, 'checker.nf')) for r in again)
+
+    stub = run_test_jobs(jobs, use_cache=False, opts=RunOptions(resume=True, stub=True), report=lambda line: None)
+    assert set(r.launch_dir for r in stub).isdisjoint(r.launch_dir for r in results)
+
+
+def test_gc_resume_dirs(tmp_path):
+    launch_root = str(tmp_path)
+    now = time.time()
+    dirs = {}
+    for name, age_days, size in [('recent', 0, 600), ('older', 2, 600), ('oldest', 3, 600), ('stale', 40, 10)]:
+        dirs[name] = os.path.join(launch_root, name)
+        write(os.path.join(dirs[name], 'work', 'data'), 'x' * size)
+        os.utime(dirs[name], (now - age_days * 86400, now - age_days * 86400))
+
+    # stale by age, then least recently used ones beyond the size limit, except those to keep
+    removed = gc_resume_dirs(launch_root, keep={dirs['oldest']}, max_age_days=30, max_size_gb=1000 / 1024 ** 3)
+    assert sorted(removed) == sorted([dirs['older'], dirs['stale']])
+    assert sorted(os.listdir(launch_root)) == ['oldest', 'recent']
+
+    assert gc_resume_dirs(launch_root, max_age_days=30, max_size_gb=1) == []
+
+
+def test_shard_test_jobs(tmp_path, monkeypatch):
+    monkeypatch.setenv('WFPM_CACHE_DIR', os.path.join(str(tmp_path), 'cache'))
+    jobs = make_pkg(os.path.join(str(tmp_path), 'demo'), jobs=[f"test-job-{i}.json" for i in range(1, 9)])
+
+    # no durations: by hash of the job ids, every job in exactly one shard, the same each time
+    shards = [shard_test_jobs(jobs, i, 3) for i in (1, 2, 3)]
+    assert sorted(j.id for shard in shards for j in shard) == sorted(j.id for j in jobs)
+    assert [shard_test_jobs(list(reversed(jobs)), i, 3) for i in (1, 2, 3)] == \
+        [list(reversed(shard)) for shard in shards]  # the order of the jobs is kept
+
+    # with durations: longest first onto the least loaded shard, jobs without one take the average
+    durations = {'test-job-1.json': 100, 'test-job-2.json': 60, 'test-job-3.json': 40, 'test-job-4.json': 30,
+                 'test-job-5.json': 20, 'test-job-6.json': 10, 'test-job-7.json': 10}
+    durations_file = os.path.join(str(tmp_path), 'durations.json')
+    with open(durations_file, 'w') as f:
+        json.dump({'tests': [{'id': j.id, 'duration': durations.get(j.name)} for j in jobs]}, f)
+    job_durations = load_durations(durations_file)
+    assert len(job_durations) == 7
+
+    shards = [shard_test_jobs(jobs, i, 2, job_durations) for i in (1, 2)]
+    assert [[j.name for j in shard] for shard in shards] == [
+        ['test-job-1.json', 'test-job-6.json', 'test-job-7.json', 'test-job-8.json'],
+        ['test-job-2.json', 'test-job-3.json', 'test-job-4.json', 'test-job-5.json'],
+    ]
+    loads = [sum(durations.get(j.name, 270 / 7) for j in shard) for shard in shards]
+    assert abs(loads[0] - loads[1]) < 10
+    assert [shard_test_jobs(jobs, i, 2, job_durations) for i in (1, 2)] == shards
+
+
+def test_shards_independent_of_local_history(tmp_path, monkeypatch):
+    jobs = make_pkg(os.path.join(str(tmp_path), 'demo'), jobs=[f"test-job-{i}.json" for i in range(1, 9)])
+
+    # runner 1 has run the tests before, runner 2 has not
+    monkeypatch.setenv('WFPM_CACHE_DIR', os.path.join(str(tmp_path), 'runner-1'))
+    history.TestHistory().record([
+        wfpm.testing.TestResult(job=job, returncode=0, duration=10.0 * i) for i, job in enumerate(jobs)
+    ])
+    shard_1 = shard_test_jobs(jobs, 1, 2)
+    monkeypatch.setenv('WFPM_CACHE_DIR', os.path.join(str(tmp_path), 'runner-2'))
+    shard_2 = shard_test_jobs(jobs, 2, 2)
+
+    assert sorted(j.id for j in shard_1 + shard_2) == sorted(j.id for j in jobs)
+    assert not set(j.id for j in shard_1) & set(j.id for j in shard_2)
+
+
+def test_order_failed_first(tmp_path, monkeypatch):
+    monkeypatch.setenv('WFPM_CACHE_DIR', os.path.join(str(tmp_path), 'cache'))
+    jobs = make_pkg(os.path.join(str(tmp_path), 'align'), jobs=['test-job-1.json', 'test-job-2.json']) + \
+        make_pkg(os.path.join(str(tmp_path), 'qc'), jobs=['test-job-1.json', 'test-job-2.json', 'test-job-3.json'])
+
+    # the failed package goes first, its failed job first, otherwise the order is kept
+    failed_ids = {jobs[3].id}
+    ordered = order_failed_first(jobs, failed_ids)
+    assert [(os.path.basename(j.pkg_path), j.name) for j in ordered] == [
+        ('qc', 'test-job-2.json'), ('qc', 'test-job-1.json'), ('qc', 'test-job-3.json'),
+        ('align', 'test-job-1.json'), ('align', 'test-job-2.json'),
+    ]
+
+    assert order_failed_first(jobs, set()) == jobs
+    assert order_failed_first(jobs, {jobs[1].id, jobs[4].id}) == [jobs[1], jobs[0], jobs[4], jobs[2], jobs[3]]
+
+
+def test_fail_fast_skips_jobs_not_started(tmp_path, monkeypatch):
+    monkeypatch.setenv('WFPM_CACHE_DIR', os.path.join(str(tmp_path), 'cache'))
+    jobs = make_pkg(os.path.join(str(tmp_path), 'demo'), jobs=[f"test-job-{i}.json" for i in range(1, 5)])
+    runs, _ = fake_nextflow(monkeypatch, returncodes={'test-job-2.json': 1})
+
+    lines = []
+    results = run_test_jobs(jobs, max_workers=1, use_cache=False, fail_fast=True, report=lines.append)
+
+    assert len(runs) == 2
+    assert [r.passed for r in results] == [True, False, False, False]
+    assert [r.skipped for r in results] == [False, False, True, True]
+    assert [r.failed for r in results] == [False, True, False, False]
+    assert 'Tested package: demo, PASSED: 1, FAILED: 1, SKIPPED: 2' in lines
+    assert sum(line.endswith('SKIPPED (fail fast)') for line in lines) == 2
+
+    # without it, all jobs run
+    runs.clear()
+    results = run_test_jobs(jobs, max_workers=1, use_cache=False, report=lambda line: None)
+    assert len(runs) == 4 and not any(r.skipped for r in results)
+
+
+def test_cancel_on_failure():
+    job = wfpm.testing.TestJob(pkg_path='demo', job_file='demo/tests/test-job-1.json')
+    done, pending = Future(), Future()
+    running = Future()
+    running.set_running_or_notify_cancel()
+    cancel_on_failure([done, running, pending])
+
+    done.set_result(wfpm.testing.TestResult(job=job, returncode=0))
+    assert not pending.cancelled()
+
+    # a batch result fails as soon as any of its jobs fails
+    running.set_result([wfpm.testing.TestResult(job=job, returncode=0), wfpm.testing.TestResult(job=job, returncode=1)])
+    assert pending.cancelled()
+    assert not running.cancelled() and not done.cancelled()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+from wfpm.trace import parse_duration, parse_size, process_metrics, compare_metrics
+
+
+def test_process_metrics_and_regressions():
+    assert parse_duration('1h 2m 3s') == 3723
+    assert parse_duration('1s 500ms') == 1.5
+    assert parse_size('1.5 GB') == 1.5 * 1024 ** 3
+    assert parse_size('-') is None
+
+    tasks = [
+        {'name': 'checker:fastqc (1)', 'status': 'COMPLETED', 'realtime': '1m', 'peak_rss': '1 GB'},
+        {'name': 'checker:fastqc (2)', 'status': 'COMPLETED', 'realtime': '2m', 'peak_rss': '512 MB'},
+        {'name': 'checker:fastqc (3)', 'status': 'FAILED', 'realtime': '9m', 'peak_rss': '9 GB'},
+    ]
+    old = process_metrics(tasks)
+    assert old == {'fastqc': {'tasks': 2, 'realtime': 120.0, 'peak_rss': 1024 ** 3,
+                              'samples': {'peak_rss': [1024 ** 3, 512 * 1024 ** 2]}}}
+
+    new = {'fastqc': {'tasks': 2, 'realtime': 130.0, 'peak_rss': 2 * 1024 ** 3}}
+    changes = {c['metric']: c for c in compare_metrics(old, new, threshold=0.2)}
+    assert not changes['realtime']['regressed']
+    assert changes['peak_rss']['regressed'] and changes['peak_rss']['change'] == 1.0
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+from wfpm.tune import recommend, resource_params, split_by_params, tune_block, update_config
+
+
+def test_recommend_and_update_config():
+    gb = 1024 ** 3
+    processes = {
+        'fastqc': {'tasks': 3, 'samples': {'%cpu': [90.0, 180.0, 250.0], 'peak_rss': [gb, 1.5 * gb, 3 * gb]}},
+        'file_smart_diff': {'tasks': 3, 'samples': {'%cpu': [10.0], 'peak_rss': [gb]}},  # not of the package
+    }
+    recommended = recommend(processes, ['fastqc'], pct=60, headroom=20)
+    assert recommended == {'fastqc': {'cpus': 2, 'memory': '2 GB', 'tasks': 3}}
+
+    config_str = "docker {\n    enabled = true\n}\n"
+    updated = update_config(config_str, tune_block(recommended, '0.1.0'))
+    assert updated.startswith(config_str)
+    assert "withName: 'fastqc'" in updated and "memory = '2 GB'" in updated
+
+    recommended['fastqc']['memory'] = '4 GB'
+    updated_again = update_config(updated, tune_block(recommended, '0.1.0'))
+    assert updated_again.count('wfpm tune starts') == 1
+    assert "memory = '4 GB'" in updated_again and "memory = '2 GB'" not in updated_again
+
+
+def test_resource_params_as_defaults():
+    assert resource_params({'cpus': 'params.cpus', 'memory': '"${params.mem} GB"'}) == ('cpus', ('mem', 'GB'))
+    assert resource_params({'cpus': '4', 'memory': 'params.mem_mb.MB'}) == (None, ('mem_mb', 'MB'))
+    assert resource_params({'container': '"ubuntu"'}) == (None, None)
+
+    recommended = {
+        'fastqc': {'cpus': 2, 'memory': '2.5 GB', 'tasks': 3},
+        'multiqc': {'cpus': 3, 'memory': '1 GB', 'tasks': 1},
+        'cleanup': {'cpus': 1, 'memory': '512 MB', 'tasks': 1},
+    }
+    process_params = {
+        'fastqc': ('cpus', ('mem', 'GB')),
+        'multiqc': ('cpus', ('mem', 'GB')),
+        'cleanup': (None, ('cleanup_mem', 'MB')),
+    }
+    param_values, selectors = split_by_params(recommended, process_params)
+    assert param_values == {'cpus': 3, 'mem': 2.5, 'cleanup_mem': 512}  # the largest where params are shared
+    assert selectors == {'cleanup': {'cpus': 1}}
+
+    block = tune_block(selectors, '0.1.0', param_values=param_values)
+    assert "params {\n    cleanup_mem = 512\n    cpus = 3\n    mem = 2.5\n}" in block
+    assert "withName: 'cleanup' {\n        cpus = 1\n    }" in block
+    assert "withName: 'fastqc'" not in block
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import os
+import json
+from wfpm.package import Package
+from wfpm.validation import dep_of_include, validate_includes, validate_pkgs
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def test_validate_pkgs(tmp_path):
+    pkg_dir = os.path.join(str(tmp_path), 'demo')
+    write(os.path.join(pkg_dir, 'pkg.json'), json.dumps({
+        'name': 'demo',
+        'version': '0.2.0',
+        'main': 'main',
+        'repository': {'type': 'git', 'url': 'https://github.com/acct/repo.git'},
+        'dependencies': ['github.com/acct/repo/utils@1.0.0'],
+        'devDependencies': ['github.com/acct/repo/checks@1.0.0']
+    }))
+    write(os.path.join(pkg_dir, 'main.nf'), "\n".join([
+        "version = '0.1.0'",
+        "include { step } from './local_modules/step'",
+        "include { util; missing } from './wfpr_modules/github.com/acct/repo/utils@1.0.0/main'",
+        "include { check } from './wfpr_modules/github.com/acct/repo/checks@1.0.0/main'",
+        "workflow demo {}",
+    ]))
+    write(os.path.join(pkg_dir, 'local_modules', 'step.nf'), "include { gone } from './nope'\nprocess step {}\n")
+    write(os.path.join(pkg_dir, 'tests', 'checker.nf'), "\n".join([
+        "version = '0.2.0'",
+        "include { demo } from '../main'",
+        "include { check } from './wfpr_modules/github.com/acct/repo/checks@1.0.0/main'",
+    ]))
+    modules = os.path.join(pkg_dir, 'wfpr_modules', 'github.com', 'acct', 'repo')
+    write(os.path.join(modules, 'utils@1.0.0', 'main.nf'), "def util() {}\n")
+    write(os.path.join(modules, 'checks@1.0.0', 'main.nf'), "process check {}\n")
+    os.symlink(os.path.join('..', 'wfpr_modules'), os.path.join(pkg_dir, 'tests', 'wfpr_modules'))
+
+    pkg = Package(pkg_json=os.path.join(pkg_dir, 'pkg.json'))
+    graph = validate_includes(pkg)
+    assert len(graph.scripts) == 3
+
+    issues = validate_pkgs([pkg], ('github.com', 'acct', 'repo'), {'github.com/acct/repo/x@1.0.0'}, max_workers=2)
+    assert issues[pkg.pkg_path] == [
+        "Main script version '0.1.0' does not match version in pkg.json '0.2.0'",
+        "Dependencies declared in 'pkg.json', but not installed: 'github.com/acct/repo/utils@1.0.0'. "
+        "Please run 'wfpm install' command to install missing dependencies.",
+        "main.nf:3: 'missing' not defined in included script './wfpr_modules/github.com/acct/repo/utils@1.0.0/main'.",
+        "main.nf:4: includes from 'github.com/acct/repo/checks@1.0.0' which is not declared as a dependency in pkg.json.",
+        "local_modules/step.nf:1: included script './nope' not found.",
+    ]
+
+    # as 'wfpm test' takes them, issues of includes apart
+    include_warnings = dict()
+    issues = validate_pkgs([pkg], ('github.com', 'acct', 'repo'), {'github.com/acct/repo/x@1.0.0'},
+                           include_warnings=include_warnings)
+    assert len(issues[pkg.pkg_path]) == 2
+    assert include_warnings[pkg.pkg_path] == graph.issues and len(graph.issues) == 3
+
+
+def test_dep_of_include():
+    assert dep_of_include('./wfpr_modules/github.com/a/b/c@1.0.0/main') == 'github.com/a/b/c@1.0.0'
+    assert dep_of_include('../wfpr_modules/github.com/a/b/c@1.0.0/modules/x.nf') == 'github.com/a/b/c@1.0.0'
+    assert dep_of_include('./local_modules/x') is None
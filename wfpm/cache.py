@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+from fnmatch import fnmatch
+from typing import Iterable
+
+
+def cache_root() -> str:
+    """
+    User level cache dir, can be set by 'WFPM_CACHE_DIR', eg, to a dir shared by CI runners
+    """
+    if os.environ.get('WFPM_CACHE_DIR'):
+        return os.environ['WFPM_CACHE_DIR']
+
+    xdg_cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(xdg_cache_home, 'wfpm')
+
+
+def cache_dir(*parts) -> str:
+    path = os.path.join(cache_root(), *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def hash_file(path, digest=None) -> str:
+    h = digest or hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def path_excluded(rel_path, exclude: Iterable[str]) -> bool:
+    """
+    Whether a path relative to a dir being walked ('/' separated) matches any of the 'exclude'
+    patterns. As in '.gitignore', a pattern with a '/' is anchored at the dir being walked, others
+    match the name at any level
+    """
+    name = rel_path.rsplit('/', 1)[-1]
+    return any(fnmatch(rel_path, p.lstrip('/')) if '/' in p else fnmatch(name, p) for p in exclude)
+
+
+def hash_dir(path, exclude: Iterable[str] = ()) -> str:
+    """
+    Hash of relative paths and content of all files under a dir, entries matching any of the
+    'exclude' patterns (see 'path_excluded') are skipped. Symlinks are hashed by their targets
+    """
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        rel_root = os.path.relpath(root, path).replace(os.sep, '/')
+        rel_root = '' if rel_root == '.' else f"{rel_root}/"
+        dirs[:] = sorted(d for d in dirs if not path_excluded(f"{rel_root}{d}", exclude))
+        for name in sorted(files + [d for d in dirs if os.path.islink(os.path.join(root, d))]):
+            if path_excluded(f"{rel_root}{name}", exclude):
+                continue
+
+            file_path = os.path.join(root, name)
+            h.update(os.path.relpath(file_path, path).encode('utf-8') + b'\0')
+            if os.path.islink(file_path):
+                h.update(b'link:' + os.readlink(file_path).encode('utf-8'))
+            else:
+                h.update(hash_file(file_path).encode('utf-8'))
+            h.update(b'\0')
+
+    return h.hexdigest()
+
+
+def hash_str(*values) -> str:
+    return hashlib.sha256('\0'.join(str(v) for v in values).encode('utf-8')).hexdigest()
+
+
+def write_json_atomic(path, obj) -> None:
+    """
+    Write to a temp file in the same dir then rename, so concurrent readers never see partial content
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(obj, f, indent=2)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class TestCache(object):
+    """
+    Cache of passed test jobs, keyed by a hash of everything that may affect the test outcome
+    """
+    path: str = None
+
+    def __init__(self, path=None):
+        self.path = path or cache_dir('test-results')
+
+    def get(self, key):
+        record_file = os.path.join(self.path, f"{key}.json")
+        if not os.path.isfile(record_file):
+            return
+
+        try:
+            with open(record_file, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            return  # corrupted record is treated as a cache miss
+
+    def put(self, key, record):
+        write_json_atomic(os.path.join(self.path, f"{key}.json"), record)
+
+
+class AttestationCache(TestCache):
+    """
+    Outcome of tests of released packages, keyed by a hash of the package uri, the digest of the
+    downloaded tarball and the Nextflow version. A released package never changes, so tests passed
+    once do not need to run again for the same tarball
+    """
+    def __init__(self, path=None):
+        super().__init__(path=path or cache_dir('test-attestations'))
+
+    @staticmethod
+    def key(pkg_uri, tarball_sha256, nextflow_version) -> str:
+        return hash_str(pkg_uri, tarball_sha256, nextflow_version)
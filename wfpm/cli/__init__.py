@@ -23,7 +23,7 @@ import click
 import traceback
 from wfpm import __version__ as ver
 from .init_cmd import init_cmd
-from .new_cmd import new_cmd
+from .new_cmd import new_cmd, new_batch_cmd
 from .install_cmd import install_cmd
 from .list_cmd import list_cmd
 from .uninstall_cmd import uninstall_cmd
@@ -31,6 +31,14 @@ from .outdated_cmd import outdated_cmd
 from .test_cmd import test_cmd
 from .workon_cmd import workon_cmd
 from .nextver_cmd import nextver_cmd
+from .stub_cmd import stub_cmd
+from .perf_cmd import perf_diff_cmd
+from .tune_cmd import tune_cmd
+from .diff_cmd import diff_cmd
+from .validate_cmd import validate_cmd
+from .why_cmd import why_cmd
+from .dependents_cmd import dependents_cmd
+from .pack_cmd import pack_cmd
 from wfpm.project import Project
 
 
@@ -41,6 +49,20 @@ def print_version(ctx, param, value):
     ctx.exit()
 
 
+def parse_shard(ctx, param, value):
+    if value is None:
+        return
+
+    try:
+        index, count = [int(v) for v in value.split('/')]
+        if not 1 <= index <= count:
+            raise ValueError
+    except ValueError:
+        raise click.BadParameter("expected 'i/N' with 1 <= i <= N, eg, '2/4'")
+
+    return index, count
+
+
 @click.group()
 @click.option('--debug/--no-debug', '-d', is_flag=True, default=False,
               help='Show debug information in STDERR.')
@@ -77,14 +99,16 @@ def init(ctx, conf_json):
 
 @main.command()
 @click.argument(
-    'pkg_type', nargs=1,
+    'pkg_type', nargs=1, required=False,
     type=click.Choice(['tool', 'workflow', 'function'], case_sensitive=False)
 )
-@click.argument('pkg_name', nargs=1)
+@click.argument('pkg_name', nargs=1, required=False)
 @click.option('--conf-json', '-c', type=click.File('rb'),
               help='Optional config JSON with needed info to create a new package.')
+@click.option('--batch', '-b', type=click.File('rb'),
+              help='Manifest JSON listing packages to create at once, each on its own new branch.')
 @click.pass_context
-def new(ctx, pkg_type, pkg_name, conf_json):
+def new(ctx, pkg_type, pkg_name, conf_json, batch):
     """
     Start a new package with necessary scaffolds.
     """
@@ -93,6 +117,18 @@ def new(ctx, pkg_type, pkg_name, conf_json):
         click.echo("Not in a package project directory.")
         ctx.abort()
 
+    if batch:
+        if pkg_type or pkg_name or conf_json:
+            click.echo("'--batch' can not be used together with PKG_TYPE, PKG_NAME or '--conf-json'.")
+            ctx.abort()
+
+        new_batch_cmd(project, batch)
+        return
+
+    if not (pkg_type and pkg_name):
+        click.echo("Missing argument PKG_TYPE and PKG_NAME, or '--batch'.")
+        ctx.abort()
+
     new_cmd(project, pkg_type, pkg_name, conf_json)
 
 
@@ -100,17 +136,21 @@ def new(ctx, pkg_type, pkg_name, conf_json):
 # diable this for now ## @click.argument('pkgs', nargs=-1, required=False)
 @click.option('--force', '-f', is_flag=True, help='Force installation even already installed.')
 @click.option('--skip-tests', '-T', is_flag=True, help='Not to run tests after installation.')
+@click.option('--jobs', '-j', type=click.IntRange(min=1), default=1,
+              help='Number of installed packages to validate and test in parallel.')
+@click.option('--retest', is_flag=True,
+              help='Run tests of installed packages even if they passed before for the same package release.')
 @click.pass_context
-def install(ctx, force, skip_tests):
+def install(ctx, force, skip_tests, jobs, retest):
     """
-    Install dependencies for the package currently being worked on.
+    Install dependencies for the package being worked on.
     """
     project = ctx.obj.get('PROJECT')
     if not project.root:
         click.echo("Not in a package project directory.")
         ctx.abort()
 
-    install_cmd(project, force, skip_tests)
+    install_cmd(project, force, skip_tests, jobs=jobs, retest=retest)
 
 
 @main.command()
@@ -157,8 +197,48 @@ def outdated(ctx):
 
 @main.command()
 # TODO: add an optional argument to specify which package to test
+@click.option('--jobs', '-j', type=click.IntRange(min=1),
+              help="Number of test jobs to run in parallel, default: 1, unlimited with '--max-cpus' or '--max-memory'.")
+@click.option('--no-cache', is_flag=True, help='Run all tests, ignore results cached from previous runs.')
+@click.option('--changed', is_flag=True,
+              help='Only test packages changed since a git ref and local packages depending on them.')
+@click.option('--since', type=str,
+              help="Git ref to compare with when '--changed' is used, default: 'origin/main'.")
+@click.option('--report', '-r', 'reports', multiple=True,
+              help="Write test report to a file, JUnit XML if the file name ends with '.xml', JSON if '.json'.")
+@click.option('--slowest', is_flag=True, help='Show the slowest tests and their trend over recent runs, run no test.')
+@click.option('--batch', '-b', is_flag=True,
+              help='Run all test jobs of a package in a single Nextflow session to save start up time.')
+@click.option('--timeout', '-t', type=click.IntRange(min=1),
+              help='Seconds a test job may run, after that it is killed and reported as failed.')
+@click.option('--stream', is_flag=True, help='Show output of Nextflow runs as they go.')
+@click.option('--resume', is_flag=True,
+              help='Keep Nextflow work dir of each test job across runs, tasks not changed since the last run are skipped.')
+@click.option('--shard', type=str, callback=parse_shard,
+              help="Only run test jobs of one shard, given as 'i/N' for shard i of N, eg, '2/4'.")
+@click.option('--durations', type=click.Path(exists=True, dir_okay=False),
+              help="Balance shards by durations of test jobs in this file, written by 'wfpm test --list --json'. "
+                   "All shards must be given the same file.")
+@click.option('--list', 'list_only', is_flag=True, help='List the test jobs that would run, run no test.')
+@click.option('--json', 'as_json', is_flag=True, help="Output in JSON, used together with '--list'.")
+@click.option('--stub', is_flag=True,
+              help="Quick check of the wiring: run checkers with Nextflow '-stub-run', processes run their 'stub' blocks.")
+@click.option('--last-failed', '--lf', 'last_failed', is_flag=True,
+              help='Only run test jobs failed in their last run, run all if none failed.')
+@click.option('--failed-first', '--ff', 'failed_first', is_flag=True,
+              help='Run test jobs failed in their last run first, then the rest.')
+@click.option('--fail-fast', '-x', 'fail_fast', is_flag=True,
+              help='Stop starting new test jobs once one has failed, those not started are reported as skipped.')
+@click.option('--max-cpus', type=click.IntRange(min=1),
+              help='CPUs available to tests, test jobs run in parallel as long as their expected CPUs fit in.')
+@click.option('--max-memory', type=click.FloatRange(min=0.1),
+              help='Memory in GB available to tests, test jobs run in parallel as long as their expected memory fits in.')
+@click.option('--perf-threshold', type=click.FloatRange(min=0),
+              help='Fail when run time or peak memory of a process grows by more than this percentage over '
+                   'the previous package version tested.')
 @click.pass_context
-def test(ctx):
+def test(ctx, jobs, no_cache, changed, since, reports, slowest, batch, timeout, stream, resume, shard, durations,
+         list_only, as_json, stub, last_failed, failed_first, fail_fast, max_cpus, max_memory, perf_threshold):
     """
     Run tests.
     """
@@ -167,7 +247,26 @@ def test(ctx):
         click.echo("Not in a package project directory.")
         ctx.abort()
 
-    test_cmd(project)
+    if since and not changed:
+        click.echo("'--since' can only be used together with '--changed'.")
+        ctx.abort()
+
+    if as_json and not list_only:
+        click.echo("'--json' can only be used together with '--list'.")
+        ctx.abort()
+
+    if durations and not shard:
+        click.echo("'--durations' can only be used together with '--shard'.")
+        ctx.abort()
+
+    if perf_threshold is not None and stub:
+        click.echo("'--perf-threshold' can not be used together with '--stub'.")
+        ctx.abort()
+
+    test_cmd(project, jobs=jobs, no_cache=no_cache, changed=changed, since=since, reports=reports, slowest=slowest,
+             batch=batch, timeout=timeout, stream=stream, resume=resume, shard=shard, durations=durations,
+             list_only=list_only, as_json=as_json, stub=stub, last_failed=last_failed, failed_first=failed_first,
+             fail_fast=fail_fast, max_cpus=max_cpus, max_memory=max_memory, perf_threshold=perf_threshold)
 
 
 @main.command()
@@ -210,3 +309,148 @@ def nextver(ctx, pkg=None, version=False):
         pkg=pkg,
         version=version
     )
+
+
+@main.command()
+@click.argument('scripts', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.pass_context
+def stub(ctx, scripts):
+    """
+    Add 'stub' blocks to processes in Nextflow scripts.
+    """
+    project = ctx.obj.get('PROJECT')
+    if not project.root:
+        click.echo("Not in a package project directory.")
+        ctx.abort()
+
+    stub_cmd(project, scripts)
+
+
+@main.group()
+def perf():
+    """
+    Compare performance of package versions measured in tests.
+    """
+    pass
+
+
+@perf.command('diff')
+@click.argument('old', type=str, required=True)
+@click.argument('new', type=str, required=True)
+@click.option('--threshold', type=click.FloatRange(min=0),
+              help='Exit with error when run time or peak memory of a process grows by more than this percentage.')
+@click.pass_context
+def perf_diff(ctx, old, new, threshold):
+    """
+    Compare process metrics of two package versions, given as <pkg>@<version>.
+    """
+    project = ctx.obj.get('PROJECT')
+    if not project.root:
+        click.echo("Not in a package project directory.")
+        ctx.abort()
+
+    perf_diff_cmd(project, old, new, threshold=threshold)
+
+
+@main.command()
+@click.argument('pkg', type=str, required=True)
+@click.option('--percentile', '-p', 'pct', type=click.FloatRange(min=1, max=100), default=95, show_default=True,
+              help="Percentile of tasks' usage the recommended resources cover.")
+@click.option('--headroom', type=click.FloatRange(min=0), default=20, show_default=True,
+              help='Percentage of memory added on top of the observed usage.')
+@click.option('--dry-run', '-n', is_flag=True, help="Print the change to 'nextflow.config' as a patch, write nothing.")
+@click.pass_context
+def tune(ctx, pkg, pct, headroom, dry_run):
+    """
+    Set process resources in package config from test runs.
+    """
+    project = ctx.obj.get('PROJECT')
+    if not project.root:
+        click.echo("Not in a package project directory.")
+        ctx.abort()
+
+    tune_cmd(project, pkg, pct=pct, headroom=headroom, dry_run=dry_run)
+
+
+@main.command()
+@click.argument('output_file', type=click.Path(exists=True, dir_okay=False))
+@click.argument('expected', type=str)
+@click.option('--rule', '-e', 'rules', multiple=True,
+              help="Normalize each line of both files before comparing, as sed 's/pattern/replacement/[g]'.")
+@click.option('--hash', 'by_hash', is_flag=True,
+              help='Compare sha256 of the content, EXPECTED may then also be the sha256 itself.')
+def diff(output_file, expected, rules, by_hash):
+    """
+    Compare output file with expected, gzip is decompressed.
+    """
+    diff_cmd(output_file, expected, rules=rules, by_hash=by_hash)
+
+
+@main.command()
+@click.option('--all', '-a', 'all_pkgs', is_flag=True, help='Also validate installed packages.')
+@click.option('--json', 'as_json', is_flag=True, help='Output in JSON.')
+@click.option('--jobs', '-j', type=click.IntRange(min=1),
+              help='Number of packages to validate in parallel, default: number of CPUs.')
+@click.pass_context
+def validate(ctx, all_pkgs, as_json, jobs):
+    """
+    Validate packages and includes in their scripts.
+    """
+    project = ctx.obj.get('PROJECT')
+    if not project.root:
+        click.echo("Not in a package project directory.")
+        ctx.abort()
+
+    validate_cmd(project, all_pkgs=all_pkgs, as_json=as_json, max_workers=jobs)
+
+
+@main.command()
+@click.argument('pkg', type=str, required=True)
+@click.pass_context
+def why(ctx, pkg):
+    """
+    Show why a package is needed by local packages.
+    """
+    project = ctx.obj.get('PROJECT')
+    if not project.root:
+        click.echo("Not in a package project directory.")
+        ctx.abort()
+
+    why_cmd(project, pkg)
+
+
+@main.command()
+@click.argument('pkg', type=str, required=True)
+@click.option('--transitive', '-t', is_flag=True, help='Also list packages depending on it indirectly.')
+@click.pass_context
+def dependents(ctx, pkg, transitive):
+    """
+    List local and installed packages depending on a package.
+    """
+    project = ctx.obj.get('PROJECT')
+    if not project.root:
+        click.echo("Not in a package project directory.")
+        ctx.abort()
+
+    dependents_cmd(project, pkg, transitive=transitive)
+
+
+@main.command()
+@click.argument('pkg', type=str, required=True)
+@click.option('--output-dir', '-o', type=click.Path(file_okay=False),
+              help='Dir to write the tarball and pkg-release.json to, default: current dir.')
+@click.option('--jobs', '-j', type=click.IntRange(min=1),
+              help='Number of threads to compress with, default: number of CPUs.')
+@click.option('--split-tests', is_flag=True,
+              help="Also pack the 'tests' dir and the rest of the package into separate tarballs.")
+@click.pass_context
+def pack(ctx, pkg, output_dir, jobs, split_tests):
+    """
+    Build release tarball of a package reproducibly.
+    """
+    project = ctx.obj.get('PROJECT')
+    if not project.root:
+        click.echo("Not in a package project directory.")
+        ctx.abort()
+
+    pack_cmd(project, pkg, output_dir=output_dir, jobs=jobs, split_tests=split_tests)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+
+from click import echo
+from ..dependency import expand_pkg_uri
+
+
+def dependents_cmd(project, pkg, transitive=False):
+    index = project.dependents_index
+    pkg_uri = expand_pkg_uri(pkg, project.fullname).lower()
+    any_version = '@' not in pkg_uri
+
+    direct = index.direct_dependents(pkg_uri, any_version=any_version)
+    dependents = index.all_dependents(pkg_uri, any_version=any_version) if transitive else sorted(direct)
+    if not dependents:
+        echo(f"No package depends on '{pkg_uri}'.")
+        return
+
+    local_uris = set(index.local_pkg_uris)
+    for dependent in dependents:
+        labels = ['local' if dependent in local_uris else 'installed']
+        if dependent not in direct:
+            labels.append('indirect')
+        elif direct[dependent] == 'devDependencies':
+            labels.append('dev')
+        echo(f"{dependent} ({', '.join(labels)})")
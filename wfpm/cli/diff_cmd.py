@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import sys
+from click import echo
+from ..diff import compare_lines, compare_bytes, content_digest, is_digest
+
+
+def diff_cmd(output_file, expected, rules=(), by_hash=False):
+    # exit code as 'diff': 0 same, 1 different, 2 trouble
+    try:
+        if by_hash or is_digest(expected):
+            if rules:
+                echo("Normalization rules can not be used when comparing by content hash.", err=True)
+                sys.exit(2)
+
+            output_digest = content_digest(output_file)
+            expected_digest = expected if is_digest(expected) else content_digest(expected)
+            if output_digest == expected_digest:
+                echo(f"Files match, sha256: {output_digest}")
+                return
+
+            echo(f"Files differ, sha256: {output_digest} (output) vs {expected_digest} (expected)")
+            sys.exit(1)
+
+        mismatch = compare_lines(output_file, expected, rules) if rules else compare_bytes(output_file, expected)
+    except Exception as ex:  # eg, file not found, corrupted gzip, invalid rule
+        echo(f"Unable to compare: {ex}", err=True)
+        sys.exit(2)
+
+    if not mismatch:
+        echo("Files match.")
+        return
+
+    echo(f"Files differ, {mismatch}")
+    sys.exit(1)
@@ -24,17 +24,15 @@ import re
 import sys
 import json
 import tempfile
-import random
-import string
 import questionary
 import traceback
-from shutil import copytree
+from shutil import rmtree
 from click import echo
-from cookiecutter.main import cookiecutter
 from wfpm import PRJ_NAME_REGEX, GIT_ACCT_REGEX, __version__ as ver
 from wfpm.project import Project
 from ..pkg_templates import project_tmplt
 from ..utils import run_cmd, validate_project_name
+from ..scaffold import render_template, move_into_place
 
 
 def init_cmd(project=None, conf_json=None):
@@ -96,23 +94,16 @@ def gen_project(
     if "_copy_without_render" not in conf_dict:
         conf_dict["_copy_without_render"] = [".github"]
 
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        # copy template directory tree to under tmpdir so that we can replace cookiecutter.json when needed
-        dirname = ''.join(random.choice(string.ascii_letters) for i in range(20))
-        new_tmplt_dir = os.path.join(tmpdirname, dirname)
-        copytree(project_tmplt, new_tmplt_dir)
-
-        if conf_dict:
-            # replace the default cookiecutter.json with user supplied
-            with open(os.path.join(new_tmplt_dir, 'cookiecutter.json'), 'w') as j:
-                json.dump(conf_dict, j)
-
-        project_dir = cookiecutter(
-            new_tmplt_dir,
-            no_input=True if conf_dict else False
-        )
+    # rendered in a staging dir next to the destination, then moved into place in one rename
+    staging_dir = tempfile.mkdtemp(dir=os.getcwd(), prefix='.wfpm-init-')
+    try:
+        path = render_template(project_tmplt, conf_dict, staging_dir)
+        project_dir = os.path.join(os.getcwd(), os.path.basename(path))
+        move_into_place(path, project_dir)
+    finally:
+        rmtree(staging_dir, ignore_errors=True)
 
-        return project_dir
+    return project_dir
 
 
 def collect_project_init_info(project=None):
@@ -21,20 +21,35 @@
 
 import os
 import sys
+from datetime import datetime
 import networkx as nx
+from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from click import echo
 from wfpm.project import Project
 from wfpm.package import Package
 from wfpm.dependency import build_dep_graph
-from ..utils import test_package
+from wfpm import __version__ as ver
+from ..utils import run_cmd
+from ..cache import AttestationCache
+from ..testing import TestResult, collect_test_jobs, run_test_jobs, report_no_test, nextflow_version
 
 
 def install_cmd(
     project: Project = None,
     force=False,
     skip_tests=False,
-    pkg_json=None
+    pkg_json=None,
+    jobs=1,
+    retest=False,
+    install_dest=None,
+    skip_installed=False
 ):
+    """
+    Install dependencies of a package into 'wfpr_modules' of the project. 'install_dest' is the project
+    root, by default the one the package is in. With 'skip_installed', packages already installed there
+    are neither downloaded nor tested again, they are returned as installed
+    """
     if not pkg_json:
         if not project.pkg_workon:
             echo("Not working on any package. Run 'wfpm workon <pkg>' command to start working on a package.")
@@ -43,55 +58,204 @@ def install_cmd(
         install_dest = project.root
         pkg_json = os.path.join(project.root, project.pkg_workon.split('@')[0], 'pkg.json')
 
-    else:
+    elif not install_dest:
         install_dest = os.path.dirname(os.path.dirname(pkg_json))  # parent dir of where pkg.json is
 
     try:
         package = Package(pkg_json=pkg_json)
+    except Exception as ex:
+        echo(f"Unable to build package dependency graph: {ex}")
+        sys.exit(1)
+
+    return install_deps([package], install_dest, force=force, skip_tests=skip_tests, jobs=jobs, retest=retest,
+                        skip_installed=skip_installed)
+
+
+def install_deps(
+    pkgs: List[Package],
+    install_dest,
+    force=False,
+    skip_tests=False,
+    jobs=1,
+    retest=False,
+    skip_installed=False,
+    install_jobs=1
+) -> Tuple[List[Package], List[Package]]:
+    """
+    Install the union of dependencies of the packages, each resolved once. 'install_jobs' packages are
+    downloaded and unpacked at a time. Returns packages installed and those failed, the latter given
+    by their uri when they could not even be resolved
+    """
+    try:
         dep_graph = nx.DiGraph()
-        build_dep_graph(package, DG=dep_graph)
+        for package in pkgs:
+            build_dep_graph(package, DG=dep_graph, project_root=install_dest if skip_installed else None)
     except Exception as ex:
         echo(f"Unable to build package dependency graph: {ex}")
         sys.exit(1)
 
-    # exclude the first one which is the current package itself, it's important to reverse the order
-    dep_pkgs = list(reversed(list(nx.topological_sort(dep_graph))[1:]))
+    # exclude the packages themselves, it's important to reverse the order
+    pkg_uris = set(p.pkg_uri for p in pkgs)
+    dep_pkgs = [p for p in reversed(list(nx.topological_sort(dep_graph))) if p not in pkg_uris]
 
     if dep_pkgs:
         echo("Start dependency installation.")
     else:
         echo("No dependency defined, no installation needed.")
 
-    failed_pkgs = []
-    installed_pkgs = []
-    for dep_pkg_uri in dep_pkgs:
-        package = Package(pkg_uri=dep_pkg_uri)
-        installed = False
-
-        try:
-            path = package.install(
-                install_dest,
-                force=force
-            )
-            installed = True
-            installed_pkgs.append(package)
-            echo(f"Package installed in: {path.replace(os.path.join(os.getcwd(), ''), '')}")
-
-        except Exception as ex:
-            echo(f"{ex}")
-            failed_pkgs.append(package)
-
-        if not skip_tests and installed:
-            installed_pkg = Package(pkg_json=os.path.join(path, 'pkg.json'))
-            repo_server, repo_account, repo_name = path.split(os.sep)[-4:-1]
+    failed_pkgs = dict()  # by node of the graph, to report in its order whichever completes first
+    installed_pkgs = dict()
+    installed_paths = dict()  # of those newly installed, to be verified
+    verifications = dict()
+    settled = set()  # installed, reused or failed
+    ready = set()  # settled along with all its dependencies, direct or transitive
+    # installed packages are validated and tested on a separate pool while the rest are being installed,
+    # tests of a package run one at a time, so there are never more than 'jobs' Nextflow runs at once
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor, \
+            ThreadPoolExecutor(max_workers=max(1, install_jobs)) as installer:
+
+        def verify_ready():
+            # a package is tested only once its dependencies are in place, dependencies come first in 'dep_pkgs'
+            for uri in dep_pkgs:
+                if uri in ready or uri not in settled or any(d not in ready for d in dep_graph.successors(uri)):
+                    continue
+                ready.add(uri)
+                if uri in installed_paths and not skip_tests:
+                    package = dep_graph.nodes[uri]['pkg']
+                    verifications[uri] = executor.submit(
+                        verify_installed_pkg, installed_paths[uri], package.pkg_uri, package.tarball_sha256, retest
+                    )
+
+        installations = dict()
+        for dep_pkg_uri in dep_pkgs:
+            if 'pkg' not in dep_graph.nodes[dep_pkg_uri]:  # not resolved, warned when building the graph
+                failed_pkgs[dep_pkg_uri] = dep_pkg_uri
+                settled.add(dep_pkg_uri)
+                continue
+
+            package = dep_graph.nodes[dep_pkg_uri]['pkg']
+            if skip_installed and package.pkg_path:  # resolved from the installed copy
+                installed_pkgs[dep_pkg_uri] = package
+                settled.add(dep_pkg_uri)
+                echo(f"Package already installed: {package.pkg_path.replace(os.path.join(os.getcwd(), ''), '')}")
+                continue
+
+            installations[installer.submit(package.install, install_dest, force=force)] = dep_pkg_uri
+
+        verify_ready()
+        # each package is verified as soon as it and its dependencies are installed, not held up by others
+        for installation in as_completed(installations):
+            dep_pkg_uri = installations[installation]
+            package = dep_graph.nodes[dep_pkg_uri]['pkg']
+            settled.add(dep_pkg_uri)
+            try:
+                path = installation.result()
+                installed_pkgs[dep_pkg_uri] = package
+                installed_paths[dep_pkg_uri] = path
+                echo(f"Package installed in: {path.replace(os.path.join(os.getcwd(), ''), '')}")
+
+            except Exception as ex:
+                echo(f"{ex}")
+                failed_pkgs[dep_pkg_uri] = package
+
+            verify_ready()
+
+    if verifications:
+        report_verifications([verifications[uri].result() for uri in dep_pkgs if uri in verifications])
+
+    return [installed_pkgs[uri] for uri in dep_pkgs if uri in installed_pkgs], \
+        [failed_pkgs[uri] for uri in dep_pkgs if uri in failed_pkgs]
+
+
+def verify_installed_pkg(path, pkg_uri=None, tarball_sha256=None,
+                         retest=False) -> Tuple[List[str], List[str], List[TestResult]]:
+    """
+    Validate and test an installed package, returns report lines, package issues and test results.
+    Tests are skipped when they passed before for the same package tarball, unless 'retest'
+    """
+    lines = [f"Validating package: {path}"]
+    try:
+        installed_pkg = Package(pkg_json=os.path.join(path, 'pkg.json'))
+        repo_server, repo_account, repo_name = path.split(os.sep)[-4:-1]
+        pkg_issues = installed_pkg.validate(repo_server, repo_account, repo_name)
+    except Exception as ex:
+        pkg_issues = [f"Unable to validate package: {ex}"]
+
+    def report_issues():
+        lines.append("Package issues identified:")
+        for i in range(len(pkg_issues)):
+            lines.append(f"[{i+1}/{len(pkg_issues)}] {pkg_issues[i]}")
+        return lines, pkg_issues, []
+
+    if pkg_issues:
+        return report_issues()
+
+    lines.append("Package valid.")
+    test_jobs = collect_test_jobs(path)
+    if not test_jobs:
+        report_no_test(path, report=lines.append)
+        return lines, [], []
+
+    attestations = AttestationCache()
+    attestation_key = AttestationCache.key(pkg_uri, tarball_sha256, nextflow_version()) if tarball_sha256 else None
+    attestation = attestations.get(attestation_key) if attestation_key and not retest else None
+
+    if attestation and attestation.get('passed'):
+        lines.append(f"Testing package: {path}")
+        for i, job in enumerate(test_jobs):
+            lines.append(f"[{i+1}/{len(test_jobs)}] Testing: {job.job_file}. PASSED (recorded)")
+        # the git user is taken from the git config of whoever ran the tests, it is not verified
+        recorded_by = attestation.get('recorded_by') or attestation.get('signed_off_by')  # older records
+        lines.append(f"Tested package: {os.path.basename(path)}, PASSED: {len(test_jobs)}, FAILED: 0, "
+                     f"as recorded on {attestation.get('created')} by git user {recorded_by or 'unknown'}")
+        return lines, [], [TestResult(job=job, returncode=0, cached=True) for job in test_jobs]
+
+    try:
+        if installed_pkg.install_tests():
+            lines.append(f"Tests fetched for package: {path}")
+            # the checker and what it includes could not be validated before tests were fetched
             pkg_issues = installed_pkg.validate(repo_server, repo_account, repo_name)
-            if pkg_issues:
-                echo("Package issues identified:")
-                for i in range(len(pkg_issues)):
-                    echo(f"[{i+1}/{len(pkg_issues)}] {pkg_issues[i]}")
-            else:
-                echo("Package valid.")
-                echo(f"Testing package: {path}")
-                test_package(path)
-
-    return installed_pkgs, failed_pkgs
+    except Exception as ex:
+        lines.append(f"{ex}")
+        return lines, [f"{ex}"], []
+
+    if pkg_issues:
+        return report_issues()
+
+    results = run_test_jobs(test_jobs, use_cache=not retest, report=lines.append)
+
+    if attestation_key:
+        attestations.put(attestation_key, {
+            'pkg_uri': pkg_uri,
+            'tarball_sha256': tarball_sha256,
+            'nextflow_version': nextflow_version(),
+            'passed': all(r.passed for r in results),
+            'tests': len(results),
+            'duration': round(sum(r.duration for r in results), 3),
+            'created': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'recorded_by': git_user(),
+            'wfpm_version': ver
+        })
+
+    return lines, [], results
+
+
+def git_user() -> str:
+    name, _, ret = run_cmd(['git', 'config', 'user.name'])
+    email, _, _ = run_cmd(['git', 'config', 'user.email'])
+
+    return f"{name} <{email}>" if ret == 0 and name else ''
+
+
+def report_verifications(verifications) -> None:
+    invalid_pkg_count = 0
+    results = []
+    for lines, pkg_issues, pkg_results in verifications:
+        for line in lines:
+            echo(line)
+        invalid_pkg_count += 1 if pkg_issues else 0
+        results += pkg_results
+
+    failed_test_count = len([r for r in results if not r.passed])
+    echo(f"Verification summary: packages: {len(verifications)}, invalid packages: {invalid_pkg_count}, "
+         f"tests: {len(results)}, PASSED: {len(results) - failed_test_count}, FAILED: {failed_test_count}")
@@ -24,68 +24,35 @@ import re
 import sys
 import json
 import tempfile
-import random
-import string
 import questionary
+from glob import glob
 from pathlib import Path
-from typing import List
-from shutil import copytree, rmtree
+from typing import List, Set, Tuple
+from shutil import rmtree
 from collections import OrderedDict
 from click import echo
-from cookiecutter.main import cookiecutter
 from wfpm import PKG_NAME_REGEX, PKG_VER_REGEX, CONTAINER_REG_ACCT_REGEX, __version__ as ver
 from wfpm.project import Project
 from wfpm.package import Package
 from ..pkg_templates import tool_tmplt
 from ..pkg_templates import workflow_tmplt
 from ..pkg_templates import function_tmplt
-from ..utils import run_cmd
-from .install_cmd import install_cmd
+from ..scaffold import render_template, move_into_place
+from ..nf_script import parse_file
+from .install_cmd import install_cmd, install_deps
 
 
-def new_cmd(project, pkg_type, pkg_name, conf_json=None):
-    validate_input(project, pkg_name)
+# packages downloaded and unpacked at a time when creating packages in batch
+BATCH_INSTALL_JOBS = 8
 
-    name_parts = pkg_name.split('-')
-    workflow_name = ''.join([p.capitalize() for p in name_parts])  # workflow name starts with upper
-    process_name = workflow_name[0].lower() + workflow_name[1:]  # tool/function name starts with lower
 
-    license_text_short = 'Please add your license short form text here.'
-
-    # read from 'LICENSE-short' file if exists
-    license_short_file = os.path.join(project.root, 'LICENSE-short')
-    if os.path.isfile(license_short_file):
-        with open(license_short_file, 'r') as f:
-            license_text_short = ''
-            for line in f:
-                license_text_short += f"  {line}" if line.strip() else line
+def new_cmd(project, pkg_type, pkg_name, conf_json=None):
+    validate_input(project, pkg_name)
 
     if pkg_type == 'tool':
-        extra_context = {
-            '_pkg_name': pkg_name,
-            '_repo_type': project.repo_type,
-            '_repo_server': project.repo_server,
-            '_repo_account': project.repo_account,
-            '_repo_name': project.name,
-            '_license': project.license,
-            '_license_text_short': license_text_short,
-            '_name': process_name
-        }
-
         template = tool_tmplt
 
     elif pkg_type == 'workflow':
-        extra_context = {
-            '_pkg_name': pkg_name,
-            '_repo_type': project.repo_type,
-            '_repo_server': project.repo_server,
-            '_repo_account': project.repo_account,
-            '_repo_name': project.name,
-            '_license': project.license,
-            '_license_text_short': license_text_short,
-            '_name': workflow_name
-        }
-
         template = workflow_tmplt
 
     elif pkg_type == 'function':
@@ -94,6 +61,8 @@ def new_cmd(project, pkg_type, pkg_name, conf_json=None):
         echo("Not implemented yet")
         sys.exit(1)
 
+    extra_context = pkg_extra_context(project, pkg_type, pkg_name)
+
     path = gen_template(
             project,
             template=template,
@@ -102,62 +71,266 @@ def new_cmd(project, pkg_type, pkg_name, conf_json=None):
             conf_json=conf_json
         )
 
-    # create symlinks for 'wfpr_modules'
-    cmd = f"cd {path} && ln -s ../wfpr_modules && cd tests && ln -s ../wfpr_modules"
-    run_cmd(cmd)
+    link_wfpr_modules(path)
 
     new_pkg = Package(pkg_json=os.path.join(path, 'pkg.json'))
     project.git.cmd_new_branch(new_pkg.fullname)
     project = Project(project_root=project.root, debug=project.debug)
 
-    paths_to_add = f"{path} {os.path.join(project.root, 'wfpr_modules')}"
+    paths_to_add = [path, os.path.join(project.root, 'wfpr_modules')]
     project.git.cmd_add_and_commit(path=paths_to_add, message=f'[wfpm v{ver}] added starting template for {project.pkg_workon}')
 
     echo(f"New package created in: {os.path.basename(path)}. Starting template added and "
          "committed to git. Please update README.md and continue working on the package.")
 
 
+def link_wfpr_modules(path) -> None:
+    """
+    Symlink the package dir and its tests dir to 'wfpr_modules' of the level above
+    """
+    os.symlink(os.path.join('..', 'wfpr_modules'), os.path.join(path, 'wfpr_modules'))
+    os.symlink(os.path.join('..', 'wfpr_modules'), os.path.join(path, 'tests', 'wfpr_modules'))
+
+
+def pkg_extra_context(project, pkg_type, pkg_name) -> dict:
+    name_parts = pkg_name.split('-')
+    workflow_name = ''.join([p.capitalize() for p in name_parts])  # workflow name starts with upper
+    process_name = workflow_name[0].lower() + workflow_name[1:]  # tool/function name starts with lower
+
+    license_text_short = 'Please add your license short form text here.'
+
+    # read from 'LICENSE-short' file if exists
+    license_short_file = os.path.join(project.root, 'LICENSE-short')
+    if os.path.isfile(license_short_file):
+        with open(license_short_file, 'r') as f:
+            license_text_short = ''
+            for line in f:
+                license_text_short += f"  {line}" if line.strip() else line
+
+    return {
+        '_pkg_name': pkg_name,
+        '_repo_type': project.repo_type,
+        '_repo_server': project.repo_server,
+        '_repo_account': project.repo_account,
+        '_repo_name': project.name,
+        '_license': project.license,
+        '_license_text_short': license_text_short,
+        '_name': workflow_name if pkg_type == 'workflow' else process_name
+    }
+
+
+def new_batch_cmd(project, manifest_file):
+    """
+    Create all packages listed in a manifest: entries are validated upfront, the union of their
+    dependencies is resolved once and installed in parallel, then each package is committed to
+    its own new branch without switching branches
+    """
+    entries, issues = load_manifest(project, manifest_file)
+    issues = input_issues(project, [e['name'] for e in entries]) + issues
+    if issues:
+        echo("Unable to create packages:")
+        for i in range(len(issues)):
+            echo(f"[{i+1}/{len(issues)}] {issues[i]}")
+        sys.exit(1)
+
+    pre_installed = set(p.pkg_uri for p in project.installed_pkgs)
+    staging_dir = tempfile.mkdtemp(dir=project.root, prefix='.wfpm-new-')
+    new_installs = []
+    # installed packages to be replaced are set aside and put back, the current branch stays as it was
+    set_aside = set_aside_replaced(project, tempfile.mkdtemp(dir=staging_dir, prefix='replaced-'))
+    try:
+        # rendering changes the working dir, so packages are rendered one after another
+        paths = []
+        for entry in entries:
+            template = tool_tmplt if entry['type'] == 'tool' else workflow_tmplt
+            conf_dict = complete_conf(project, template, entry['conf'])
+            paths.append(render_pkg(
+                template, conf_dict, pkg_extra_context(project, entry['type'], entry['name']), staging_dir
+            ))
+
+        pkgs = [Package(pkg_json=os.path.join(path, 'pkg.json')) for path in paths]
+        installed_pkgs, failed_pkgs = install_deps(
+            pkgs, project.root, skip_installed=True, force=True, install_jobs=BATCH_INSTALL_JOBS
+        )
+        new_installs = [p for p in installed_pkgs if p.pkg_uri not in pre_installed]
+        if failed_pkgs:
+            echo(f"Failed to install dependencies: {', '.join([str(p) for p in failed_pkgs])}")
+            sys.exit(1)
+
+        installed = {p.pkg_uri: p for p in installed_pkgs}
+        branches = OrderedDict()
+        for entry, path, pkg in zip(entries, paths, pkgs):
+            complete_pkg(path, entry['type'], installed_pkgs, project.root)
+            link_wfpr_modules(path)
+
+            dep_paths = [
+                os.path.join('wfpr_modules', *uri.split('/')) for uri in sorted(dep_closure(pkg, installed))
+            ]
+            branches[pkg.fullname] = project.git.cmd_commit_tree(
+                paths=[(staging_dir, [pkg.name]), (project.root, dep_paths)],
+                message=f'[wfpm v{ver}] added starting template for {pkg.fullname}'
+            )
+
+        project.git.cmd_create_branches(branches)
+
+    finally:
+        # newly installed packages are committed in the new branches, keep the current branch clean
+        for pkg in new_installs:
+            rmtree(os.path.join(project.root, 'wfpr_modules', *pkg.pkg_uri.split('/')), ignore_errors=True)
+        put_back_replaced(set_aside)
+        rmtree(staging_dir, ignore_errors=True)
+
+    for branch in branches:
+        echo(f"New package created in branch: {branch}")
+    echo(f"{len(branches)} package(s) created, each with its starting template committed to its own branch. "
+         "Run 'wfpm workon <pkg>' to start working on one.")
+
+
+def load_manifest(project, manifest_file) -> Tuple[List[dict], List[str]]:
+    """
+    Entries of a batch manifest, a JSON list (or a dict with a 'packages' list) of entries like:
+    {"type": "tool", "name": "fastqc", "conf": {...}}, where 'conf' is the same as the config JSON of
+    'wfpm new' and can also be given as a path relative to the manifest. Returns entries and issues
+    """
+    try:
+        manifest = json.load(manifest_file)
+    except ValueError as ex:
+        return [], [f"Invalid manifest JSON: {ex}"]
+
+    if isinstance(manifest, dict):
+        manifest = manifest.get('packages')
+    if not isinstance(manifest, list) or not manifest:
+        return [], ["Manifest must list the packages to create."]
+
+    entries, issues = [], []
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_file.name))
+    for i, entry in enumerate(manifest):
+        if not isinstance(entry, dict) or not isinstance(entry.get('name'), str):
+            issues.append(f"Entry {i+1} of the manifest misses package 'name'.")
+            continue
+
+        if entry.get('type') not in ('tool', 'workflow'):
+            issues.append(f"Package '{entry['name']}' must be of type 'tool' or 'workflow'.")
+
+        conf = entry.get('conf')
+        if isinstance(conf, str):
+            try:
+                with open(os.path.join(manifest_dir, conf), 'r') as f:
+                    conf = json.load(f)
+            except (OSError, ValueError) as ex:
+                issues.append(f"Unable to read config of package '{entry['name']}': {ex}")
+        elif not isinstance(conf, dict):
+            issues.append(f"Package '{entry['name']}' misses its config 'conf'.")
+
+        if entry['name'] in [e['name'] for e in entries]:
+            issues.append(f"Package '{entry['name']}' is listed more than once.")
+
+        entries.append({'type': entry.get('type'), 'name': entry['name'], 'conf': conf})
+
+    return entries, issues
+
+
+def set_aside_replaced(project, aside_dir) -> dict:
+    """
+    Installed packages that are to be installed again, being incomplete, changed or not matching their
+    location, are moved into 'aside_dir' (on the same file system), so they can be put back however
+    the installation goes. Returns their path in the project by the path they are set aside to
+    """
+    modules_dir = os.path.join(project.root, 'wfpr_modules')
+    set_aside = dict()
+    for path in sorted(glob(os.path.join(modules_dir, 'github.com', '*', '*', '*@*'))):
+        pkg_uri = '/'.join(os.path.relpath(path, modules_dir).split(os.sep))
+        try:
+            pkg = Package(pkg_json=os.path.join(path, 'pkg.json'))
+            if pkg.pkg_uri.lower() == pkg_uri.lower() and not pkg.installation_issues():
+                continue  # to be reused
+        except Exception:
+            pass
+
+        aside_path = os.path.join(aside_dir, str(len(set_aside)))
+        os.rename(path, aside_path)
+        set_aside[aside_path] = path
+
+    return set_aside
+
+
+def put_back_replaced(set_aside: dict, keep_installed=False) -> None:
+    """
+    Put back packages set aside, with 'keep_installed' only those not installed again meanwhile
+    """
+    for aside_path, path in set_aside.items():
+        if os.path.lexists(path):
+            if keep_installed:
+                continue
+            rmtree(path, ignore_errors=True)
+        os.rename(aside_path, path)
+
+
+def dep_closure(pkg: Package, installed: dict) -> Set[str]:
+    """
+    Uris of the dependencies of a package, direct or transitive, among the installed packages
+    """
+    found = set()
+    to_visit = list(pkg.allDependencies)
+    while to_visit:
+        uri = to_visit.pop()
+        if uri not in found and uri in installed:
+            found.add(uri)
+            to_visit.extend(installed[uri].allDependencies)
+
+    return found
+
+
 def validate_input(project, pkg_name):
-    if not project.root:
-        echo("Not in a package project directory.")
+    issues = input_issues(project, [pkg_name])
+    if issues:
+        echo(issues[0])
         sys.exit(1)
 
+
+def input_issues(project, pkg_names) -> List[str]:
+    """
+    Reasons new packages with the given names can not be created in the project, in the order
+    they are checked
+    """
+    if not project.root:
+        return ["Not in a package project directory."]
+
+    issues = []
     if project.root != os.getcwd():
-        echo(f"Must run this command under the project root dir: {project.root}")
-        sys.exit(1)
+        issues.append(f"Must run this command under the project root dir: {project.root}")
 
     if not (project.git.user_name and project.git.user_email):
-        echo("Git not configured with 'user.name' and 'user.email', please set them using 'git config'.")
-        sys.exit(1)
+        issues.append("Git not configured with 'user.name' and 'user.email', please set them using 'git config'.")
 
     if project.pkg_workon:
-        echo(f"Must stop working on '{project.pkg_workon}' before creating a new package. "
-             "Please run: wfpm workon -s")
-        sys.exit(1)
+        issues.append(f"Must stop working on '{project.pkg_workon}' before creating a new package. "
+                      "Please run: wfpm workon -s")
 
-    if not re.match(PKG_NAME_REGEX, pkg_name):
-        echo(f"'{pkg_name}' is not a valid package name, expected name pattern: '{PKG_NAME_REGEX}'")
-        sys.exit(1)
+    for pkg_name in pkg_names:
+        if not re.match(PKG_NAME_REGEX, pkg_name):
+            issues.append(f"'{pkg_name}' is not a valid package name, expected name pattern: '{PKG_NAME_REGEX}'")
+            continue
 
-    if os.path.isdir(os.path.join(project.root, pkg_name)):
-        echo(f"Package '{ pkg_name }' already exists.")
-        sys.exit(1)
+        if os.path.isdir(os.path.join(project.root, pkg_name)):
+            issues.append(f"Package '{ pkg_name }' already exists.")
 
-    for pkg in project.pkgs_in_dev:
-        if pkg_name == pkg.split('@')[0]:
-            echo(f"Package '{pkg_name}' is already in development as '{pkg}'. "
-                 f"To continue work on it, run: wfpm workon {pkg}")
-            sys.exit(1)
+        for pkg in project.pkgs_in_dev:
+            if pkg_name == pkg.split('@')[0]:
+                issues.append(f"Package '{pkg_name}' is already in development as '{pkg}'. "
+                              f"To continue work on it, run: wfpm workon {pkg}")
+                break
 
-    for pkg in project.pkgs_released:
-        if pkg_name == pkg.split('@')[0]:
-            echo(f"Package '{pkg_name}' is already released as '{pkg}', not create.")
-            sys.exit(1)
+        for pkg in project.pkgs_released:
+            if pkg_name == pkg.split('@')[0]:
+                issues.append(f"Package '{pkg_name}' is already released as '{pkg}', not create.")
+                break
 
     if not project.git.branch_clean():
-        echo(f"Unable to create new package, git branch '{project.git.current_branch}' not clean. "
-             "Please complete current work and commit changes.")
-        sys.exit(1)
+        issues.append(f"Unable to create new package, git branch '{project.git.current_branch}' not clean. "
+                      "Please complete current work and commit changes.")
+
+    return issues
 
 
 def gen_template(
@@ -168,21 +341,67 @@ def gen_template(
     conf_json=None
 ):
     """
-    generate template in a temp dir by calling cookiecutter, then perform necessary post-gen
-    check and processing, finally copy the template into the current project root dir
+    generate template in a staging dir by rendering the cookiecutter template, install dependencies into
+    the project, then perform necessary post-gen processing, finally move the package into the current
+    project root dir. Dependencies newly installed are removed again when the package is not created
     """
-    pkg_type = os.path.basename(template)
-    conf_dict = {}
     if conf_json:
         conf_dict = json.load(conf_json)
         # TODO: validate of user supplied config JSON
-
-        if pkg_type == 'tool' and conf_dict.get("container_registry", "") == "ghcr.io":
-            conf_dict['registry_account'] = project.repo_account
-
     else:
         conf_dict = collect_new_pkg_info(project, template)
 
+    conf_dict = complete_conf(project, template, conf_dict, from_user=bool(conf_json))
+
+    # rendered and completed in a staging dir next to the destination, then moved into place
+    # in one rename, so a failure leaves no partial package behind
+    dest = os.path.join(os.getcwd(), pkg_name)
+    staging_dir = tempfile.mkdtemp(dir=os.getcwd(), prefix='.wfpm-new-')
+    pre_installed = set(p.pkg_uri for p in project.installed_pkgs)
+    new_installs = []
+    created = False
+    # installed packages to be replaced are set aside, put back unless the package is created
+    aside_dir = tempfile.mkdtemp(dir=project.root, prefix='.wfpm-replaced-')
+    set_aside = set_aside_replaced(project, aside_dir)
+    try:
+        path = render_pkg(template, conf_dict, extra_context, staging_dir)
+
+        # dependencies go into the project, those already installed are reused once verified intact
+        installed_pkgs, failed_pkgs = install_cmd(
+                                          pkg_json=os.path.join(path, 'pkg.json'),
+                                          install_dest=project.root,
+                                          skip_installed=True,
+                                          force=True  # replaces incomplete or changed installations
+                                      )
+        new_installs = [p for p in installed_pkgs if p.pkg_uri not in pre_installed]
+
+        if failed_pkgs:
+            echo(f"Failed to install dependencies: {', '.join([str(p) for p in failed_pkgs])}")
+            sys.exit(1)
+
+        complete_pkg(path, os.path.basename(template), installed_pkgs, project.root)
+
+        move_into_place(path, dest)
+        created = True
+
+    finally:
+        rmtree(staging_dir, ignore_errors=True)
+        if not created:  # roll back, leave the project as it was
+            for pkg in new_installs:
+                rmtree(os.path.join(project.root, 'wfpr_modules', *pkg.pkg_uri.split('/')), ignore_errors=True)
+        put_back_replaced(set_aside, keep_installed=created)
+        rmtree(aside_dir, ignore_errors=True)
+
+    return dest
+
+
+def complete_conf(project, template, conf_dict, from_user=True) -> dict:
+    """
+    Add the fields filled in from the project to the package config
+    """
+    if from_user and os.path.basename(template) == 'tool' and conf_dict.get("container_registry", "") == "ghcr.io":
+        conf_dict['registry_account'] = project.repo_account
+
     hidden_fields = {
         "_pkg_name": "{{ cookiecutter._pkg_name }}",
         "_repo_account": "{{ cookiecutter._repo_account }}",
@@ -195,101 +414,59 @@ def gen_template(
         "_copy_without_render": ["*.gz", "*.bam"]
     }
 
-    conf_dict = {**conf_dict, **hidden_fields}
-
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        # copy template directory tree to under tmpdir so that we can replace cookiecutter.json when needed
-        dirname = ''.join(random.choice(string.ascii_letters) for i in range(20))
-        new_tmplt_dir = os.path.join(tmpdirname, dirname)
-        copytree(template, new_tmplt_dir)
-
-        if conf_dict:
-            # replace the default cookiecutter.json with user supplied
-            with open(os.path.join(new_tmplt_dir, 'cookiecutter.json'), 'w') as j:
-                json.dump(conf_dict, j)
+    return {**conf_dict, **hidden_fields}
 
-        path = cookiecutter(
-                template=new_tmplt_dir,
-                extra_context=extra_context,
-                output_dir=tmpdirname,
-                no_input=True if conf_dict else False
-            )
-
-        # fix the list fields in pkg.json
-        pkg_dict = json.load(
-            open(os.path.join(path, 'pkg.json')),
-            object_pairs_hook=OrderedDict
-        )
-
-        pkg_dict['keywords'] = [
-            d.strip() for d in pkg_dict['keywords'] if d.strip()
-        ]
-
-        pkg_dict['dependencies'] = [
-            d.strip() for d in pkg_dict['dependencies'] if d.strip()
-        ]
 
-        pkg_dict['devDependencies'] = [
-            d.strip() for d in pkg_dict['devDependencies'] if d.strip()
-        ]
-
-        with open(os.path.join(path, 'pkg.json'), 'w') as p:
-            p.write(json.dumps(pkg_dict, indent=4))
-
-        installed_pkgs, failed_pkgs = install_cmd(
-                                          pkg_json=os.path.join(path, 'pkg.json')
-                                      )
-
-        if failed_pkgs:
-            echo(f"Failed to install dependencies: {', '.join(failed_pkgs)}")
-            sys.exit(1)
+def render_pkg(template, conf_dict, extra_context, staging_dir) -> str:
+    """
+    Render the package template under the staging dir and clean up pkg.json, returns the package path
+    """
+    path = render_template(template, conf_dict, staging_dir, extra_context=extra_context)
 
-        main_script_name = pkg_dict['main'] if pkg_dict['main'].endswith('.nf') else f"{pkg_dict['main']}.nf"
-        if pkg_type == 'workflow':
-            # update workflow main script with proper include/call/output
-            update_wf_pkg_scripts_nf(
-                main_script=os.path.join(path, main_script_name),
-                checker_script=os.path.join(path, 'tests', 'checker.nf'),
-                package=Package(pkg_json=os.path.join(path, 'pkg.json')),
-                deps=installed_pkgs,
-                deps_installed_dir=tmpdirname
-            )
-        elif pkg_type == 'tool':
-            # update tool main scripts, ie, process and wrapper python script
-            update_tool_pkg_scripts_nf(
-                main_script=os.path.join(path, main_script_name)
-            )
+    # fix the list fields in pkg.json
+    pkg_dict = json.load(
+        open(os.path.join(path, 'pkg.json')),
+        object_pairs_hook=OrderedDict
+    )
 
-        # copy generated new package dir
-        dest = os.path.join(os.getcwd(), pkg_name)
-        copytree(path, dest)
+    pkg_dict['keywords'] = [
+        d.strip() for d in pkg_dict['keywords'] if d.strip()
+    ]
 
-        # copy installed deps (skip those already installed)
-        for pkg in installed_pkgs:
-            pkg_uri = pkg.pkg_uri
-            dep_src = os.path.join(tmpdirname, 'wfpr_modules', *(pkg_uri.split('/')))
-            dep_dest = os.path.join(project.root, 'wfpr_modules', *(pkg_uri.split('/')))
+    pkg_dict['dependencies'] = [
+        d.strip() for d in pkg_dict['dependencies'] if d.strip()
+    ]
 
-            if os.path.exists(dep_dest):
-                # we could choose skipping for previously installed package, but let's
-                # remove and re-copying again, we may later let the user choose what to do
-                rmtree(dep_dest)
+    pkg_dict['devDependencies'] = [
+        d.strip() for d in pkg_dict['devDependencies'] if d.strip()
+    ]
 
-            # remove temp files created by tests
-            cmd = f"cd {dep_src}/tests && rm -fr work .nextflow* outdir"
-            # remove symlinks 'wfpr_modules'
-            cmd += f" && cd {dep_src} && rm -f wfpr_modules && cd tests && rm -f wfpr_modules"
-            run_cmd(cmd)
+    with open(os.path.join(path, 'pkg.json'), 'w') as p:
+        p.write(json.dumps(pkg_dict, indent=4))
 
-            echo(f"Copying dependency '{pkg_uri}' to: {os.path.join(project.root, 'wfpr_modules')}")
-            copytree(dep_src, dep_dest)
+    return path
 
-            # create symlinks 'wfpr_modules'
-            cmd = f"cd {dep_dest} && ln -s ../../../../../wfpr_modules . && " \
-                  "cd tests && ln -s ../wfpr_modules ."
-            run_cmd(cmd)
 
-    return dest
+def complete_pkg(path, pkg_type, installed_pkgs, deps_installed_dir) -> None:
+    """
+    Update scripts of a rendered package once its dependencies are installed
+    """
+    package = Package(pkg_json=os.path.join(path, 'pkg.json'))
+    main_script_name = package.main if package.main.endswith('.nf') else f"{package.main}.nf"
+    if pkg_type == 'workflow':
+        # update workflow main script with proper include/call/output
+        update_wf_pkg_scripts_nf(
+            main_script=os.path.join(path, main_script_name),
+            checker_script=os.path.join(path, 'tests', 'checker.nf'),
+            package=package,
+            deps=installed_pkgs,
+            deps_installed_dir=deps_installed_dir
+        )
+    elif pkg_type == 'tool':
+        # update tool main scripts, ie, process and wrapper python script
+        update_tool_pkg_scripts_nf(
+            main_script=os.path.join(path, main_script_name)
+        )
 
 
 def collect_new_pkg_info(project=None, template=None):
@@ -458,7 +635,6 @@ def update_wf_pkg_scripts_nf(
         import_script_file = os.path.join(deps_installed_dir, import_path)
 
         import_items = get_export_items(
-            pkg_name=dep.name,
             script_file=(import_script_file if import_script_file.endswith('.nf') else f"{import_script_file}.nf")
         )
 
@@ -571,29 +747,10 @@ def script_section_replacement(
     return updated_script_str.strip()
 
 
-def get_export_items(pkg_name=None, script_file=None):
-    export_items = []
-    # hardcode for demo-utils
-    if pkg_name == 'demo-utils':
-        # this is an imported (as opposite to defined) item in demo-utils.nf
-        export_items.append('cleanupWorkdir')
-
-    # this is a very rudimentary implementation of finding exportable names
-    with open(script_file, 'r') as f:
-        for line in f:
-            workflow_name = re.match(r'^workflow\s+([A-Z][0-9a-zA-Z]+)\s*\{', line)
-            if workflow_name:
-                export_items.append(workflow_name.groups()[0])
-
-            process_name = re.match(r'^process\s+([a-z][0-9a-zA-Z]+)\s*\{', line)
-            if process_name:
-                export_items.append(process_name.groups()[0])
-
-            function_name = re.match(r'^def\s+([a-z][0-9a-zA-Z]+)\s*\(', line)
-            if function_name:
-                export_items.append(function_name.groups()[0])
-
-    return export_items
+def get_export_items(script_file=None):
+    # workflows, processes and functions defined in the script, the main one first as it is what
+    # gets called, plus those it includes from its own local modules, eg, 'cleanupWorkdir' in demo-utils
+    return parse_file(script_file).exports
 
 
 def update_tool_pkg_scripts_nf(main_script=None):
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import os
+import sys
+from click import echo
+from ..pack import pack, RELEASE_JSON
+from ..utils import run_cmd
+
+
+def pack_cmd(project, pkg_name, output_dir=None, jobs=None, split_tests=False):
+    pkg = next((p for p in project.pkgs if p.name == pkg_name), None)
+    if not pkg:
+        echo(f"No package found as: '{pkg_name}'.")
+        sys.exit(1)
+
+    output_dir = output_dir or os.getcwd()
+    commit, _, ret = run_cmd(['git', 'rev-parse', 'HEAD'], cwd=project.root)
+    try:
+        release = pack(pkg, output_dir, jobs=jobs or os.cpu_count() or 1,
+                       commit=commit if ret == 0 else None, split_tests=split_tests)
+    except Exception as ex:
+        echo(f"Failed to pack '{pkg.fullname}': {ex}")
+        sys.exit(1)
+
+    for tarball in [a for a in release['_release']['assets'] if 'files' in a]:
+        content = f" ({tarball['content']})" if tarball.get('content') else ''
+        echo(f"Package tarball{content}: {os.path.relpath(os.path.join(output_dir, tarball['filename']))}")
+        echo(f"  files: {len(tarball['files'])}, size: {tarball['size']}, sha256: {tarball['checksum']}")
+    echo(f"Release JSON: {os.path.relpath(os.path.join(output_dir, RELEASE_JSON))}")
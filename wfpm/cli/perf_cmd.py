@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import sys
+from click import echo
+from ..trace import PerfStore, compare_metrics, format_metric
+
+
+def perf_diff_cmd(project, old, new, threshold=None):
+    store = PerfStore()
+    metrics = []
+    for pkg_ver in (old, new):
+        pkg_id, version = parse_pkg_version(project, pkg_ver)
+        recorded = store.get(pkg_id, version)
+        if not recorded:
+            echo(f"No performance metrics recorded for '{pkg_ver}', run its tests first.")
+            sys.exit(1)
+        metrics.append(recorded)
+
+    changes = compare_metrics(metrics[0]['processes'], metrics[1]['processes'],
+                              threshold / 100 if threshold is not None else None)
+    if not changes:
+        echo(f"No process in common between '{old}' and '{new}'.")
+        return
+
+    echo('\t'.join(['PROCESS', 'METRIC', old, new, 'CHANGE']))
+    for c in changes:
+        echo('\t'.join([
+            c['process'],
+            c['metric'],
+            format_metric(c['metric'], c['old']),
+            format_metric(c['metric'], c['new']),
+            f"{c['change']:+.0%}" if c['change'] is not None else 'n/a'
+        ]) + ('\tREGRESSED' if c['regressed'] else ''))
+
+    regressed = [c for c in changes if c['regressed']]
+    if regressed:
+        echo(f"Regressions beyond {threshold:g}%: {len(regressed)}")
+        sys.exit(1)
+
+
+def parse_pkg_version(project, pkg_ver):
+    """
+    Package id and version of '<pkg>@<version>', <pkg> is the name of a package in the project or
+    a full id, eg, 'github.com/icgc-argo/demo-wfpkgs/demo-utils'
+    """
+    if pkg_ver.count('@') != 1 or not all(pkg_ver.split('@')):
+        echo(f"Invalid package version '{pkg_ver}', expected: <pkg>@<version>")
+        sys.exit(1)
+
+    pkg, version = pkg_ver.split('@')
+    return (pkg if '/' in pkg else f"{project.fullname}/{pkg}"), version
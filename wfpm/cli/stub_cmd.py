@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import sys
+from click import echo
+from ..stub import add_stub_blocks
+
+
+def stub_cmd(project, scripts):
+    for script in scripts:
+        try:
+            with open(script, 'r') as f:
+                script_str = f.read()
+        except OSError as ex:
+            echo(f"Unable to read script: {ex}")
+            sys.exit(1)
+
+        script_str, updated = add_stub_blocks(script_str)
+        if not updated:
+            echo(f"No process without 'stub' block in: {script}")
+            continue
+
+        with open(script, 'w') as f:
+            f.write(script_str)
+
+        echo(f"Added 'stub' block to process(es) in {script}: {', '.join(updated)}")
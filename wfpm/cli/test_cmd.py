@@ -19,26 +19,61 @@
         Junjun Zhang <junjun.zhang@oicr.on.ca>
 """
 
+import os
 import sys
+import json
 from click import echo
-from ..utils import test_package
+from ..testing import RunOptions, collect_test_jobs, run_test_jobs, report_no_test, shard_test_jobs, \
+    load_durations, order_failed_first, job_resources, perf_regressions
+from ..history import TestHistory, TestStatus
+from ..report import write_report
+from ..trace import format_metric
+from ..validation import validate_pkgs
 
 
-def test_cmd(project):
-    pkg_count = 0
-    invalid_pkg_count = 0
-    failed_test_count = 0
-    for pkg in project.pkgs:
-        if project.current_pkg and project.current_pkg.name != pkg.name:
-            continue
+def test_cmd(project, jobs=None, no_cache=False, changed=False, since=None, reports=(), slowest=False,
+             batch=False, timeout=None, stream=False, resume=False, shard=None, durations=None, list_only=False,
+             as_json=False, stub=False, last_failed=False, failed_first=False, fail_fast=False, max_cpus=None, max_memory=None,
+             perf_threshold=None):
+    if slowest:
+        display_slowest(project)
+        return
+
+    selected_pkgs = None
+    if changed:
+        selected_pkgs = select_changed_pkgs(project, since, err=list_only)
+        if not selected_pkgs:
+            if as_json:
+                echo(json.dumps({'tests': []}))
+            else:
+                echo("No package to test.", err=list_only)
+            return
+
+    if list_only:
+        list_test_jobs(project, selected_pkgs, shard, as_json, last_failed, failed_first, durations)
+        return
+
+    pkgs = list(pkgs_to_test(project, selected_pkgs))
+    # issues of includes do not stop tests, Nextflow reports them too when it runs the scripts,
+    # they fail 'wfpm validate' instead
+    include_warnings = dict()
+    all_issues = validate_pkgs(
+        pkgs,
+        repo=(project.repo_server, project.repo_account, project.name),
+        installed_pkg_uris=set([p.pkg_uri for p in project.installed_pkgs]),
+        max_workers=os.cpu_count() or 1,
+        include_warnings=include_warnings
+    )
 
-        pkg_count += 1
+    pkg_count = len(pkgs)
+    invalid_pkg_count = 0
+    test_jobs = []
+    for pkg in pkgs:
         echo(f"Validating package: {pkg.pkg_path}")
-        pkg_issues = pkg.validate(
-            project.repo_server,
-            project.repo_account,
-            project.name,
-            project.installed_pkgs)
+        for warning in include_warnings[pkg.pkg_path]:
+            echo(f"Warning: {warning}")
+
+        pkg_issues = all_issues[pkg.pkg_path]
         if pkg_issues:
             echo("Package issues identified:")
             for i in range(len(pkg_issues)):
@@ -46,11 +81,167 @@ def test_cmd(project):
             invalid_pkg_count += 1
         else:
             echo("Package valid.")
-            echo(f"Testing package: {pkg.pkg_path}")
-            failed_test_count += test_package(pkg.pkg_path)
+            pkg_jobs = collect_test_jobs(pkg.pkg_path)
+            if pkg_jobs:
+                test_jobs += pkg_jobs
+            else:
+                report_no_test(pkg.pkg_path)
 
     if not pkg_count:
         echo("No package to test.")
 
-    if invalid_pkg_count or failed_test_count:
+    test_jobs = select_test_jobs(test_jobs, shard, last_failed, failed_first, durations=durations)
+
+    # all jobs from all valid packages are scheduled together
+    opts = RunOptions(timeout=timeout, stream=stream, resume=resume, stub=stub)
+    results = run_test_jobs(test_jobs, max_workers=jobs, use_cache=not no_cache, batch=batch, opts=opts,
+                            fail_fast=fail_fast, max_cpus=max_cpus, max_memory=max_memory)
+    failed_test_count = len([r for r in results if r.failed])
+    skipped_test_count = len([r for r in results if r.skipped])
+
+    regression_count = 0
+    if perf_threshold is not None:
+        regression_count = check_perf(results, perf_threshold)
+
+    for report in reports:
+        try:
+            write_report(results, report)
+            echo(f"Test report written to: {report}")
+        except Exception as ex:
+            echo(f"Failed to write test report: {ex}")
+            invalid_pkg_count += 1  # make sure the run is signaled as failed
+
+    if pkg_count:
+        echo(f"Test summary: packages: {pkg_count}, invalid packages: {invalid_pkg_count}, tests: {len(results)}, "
+             f"PASSED: {len(results) - failed_test_count - skipped_test_count}, FAILED: {failed_test_count}" +
+             (f", SKIPPED: {skipped_test_count}" if skipped_test_count else ''))
+
+    if invalid_pkg_count or failed_test_count or regression_count:
         sys.exit(1)  # signal failure
+
+
+def check_perf(results, perf_threshold) -> int:
+    regressions = perf_regressions(results, perf_threshold / 100)
+    if not regressions:
+        echo(f"No process run time or peak memory grew by more than {perf_threshold:g}% over previous versions.")
+        return 0
+
+    echo(f"Performance regressions beyond {perf_threshold:g}%:")
+    for r in regressions:
+        echo(f"{r['pkg_id'].split('/')[-1]}@{r['version']} {r['process']} {r['metric']}: "
+             f"{format_metric(r['metric'], r['old'])} ({r['baseline']}) -> {format_metric(r['metric'], r['new'])}, "
+             f"{r['change']:+.0%}")
+
+    return len(regressions)
+
+
+def pkgs_to_test(project, selected_pkgs=None):
+    for pkg in project.pkgs:
+        if selected_pkgs is not None:
+            if pkg.name not in selected_pkgs:
+                continue
+        elif project.current_pkg and project.current_pkg.name != pkg.name:
+            continue
+
+        yield pkg
+
+
+def select_test_jobs(test_jobs, shard=None, last_failed=False, failed_first=False, err=False, durations=None):
+    if shard:
+        try:
+            # shards are balanced only with durations all shards are given, local history differs between runners
+            job_durations = load_durations(durations) if durations else None
+        except Exception as ex:
+            echo(f"Unable to read durations of test jobs: {ex}", err=err)
+            sys.exit(1)
+        test_jobs = shard_test_jobs(test_jobs, *shard, durations=job_durations)
+        echo(f"Test jobs in shard {shard[0]}/{shard[1]}: {len(test_jobs)}", err=err)
+
+    if last_failed or failed_first:
+        failed_ids = TestStatus().failed()
+        if not failed_ids.intersection(j.id for j in test_jobs):
+            echo("No test job failed in previous runs.", err=err)
+        elif last_failed:
+            test_jobs = [j for j in test_jobs if j.id in failed_ids]
+            echo(f"Test jobs failed in previous runs: {len(test_jobs)}", err=err)
+        else:
+            test_jobs = order_failed_first(test_jobs, failed_ids)
+
+    return test_jobs
+
+
+def list_test_jobs(project, selected_pkgs=None, shard=None, as_json=False, last_failed=False, failed_first=False,
+                   durations=None):
+    test_jobs = []
+    for pkg in pkgs_to_test(project, selected_pkgs):
+        test_jobs += collect_test_jobs(pkg.pkg_path)
+    test_jobs = select_test_jobs(test_jobs, shard, last_failed, failed_first, err=True, durations=durations)
+
+    history = TestHistory()
+    tests = []
+    for job in test_jobs:
+        durations = history.durations(job.id)
+        cpus, memory = job_resources(job, history)
+        tests.append({
+            'id': job.id,
+            'package': job.pkg_name,
+            'job': job.name,
+            'job_file': os.path.relpath(job.job_file, project.root),
+            'duration': round(sum(durations) / len(durations), 3) if durations else None,
+            'cpus': cpus,
+            'memory': memory
+        })
+
+    if as_json:
+        echo(json.dumps({'tests': tests}, indent=2))
+        return
+
+    for t in tests:
+        echo(t['job_file'])
+
+
+def select_changed_pkgs(project, since=None, err=False):
+    """
+    Names of local packages changed since a git ref and those depending on them. By default compared
+    with where the current branch and 'origin/main' (or 'main' without remote) diverged, which on
+    'main' covers commits not pushed yet. All packages when the ref is not available, eg, in a shallow clone
+    """
+    if not since:
+        since = next((ref for ref in ('origin/main', 'main') if project.git.ref_exists(ref)), 'origin/main')
+
+    all_pkgs = set(pkg.name for pkg in project.pkgs)
+    if not project.git.ref_exists(since):
+        echo(f"Warning: unable to resolve git ref '{since}', testing all packages.", err=err)
+        return all_pkgs
+
+    try:
+        changed_pkgs = project.changed_pkgs(since)
+    except Exception as ex:
+        echo(f"Warning: unable to determine packages changed since '{since}', testing all packages. {ex}", err=err)
+        return all_pkgs
+
+    dependent_pkgs = project.local_dependents(changed_pkgs)
+
+    echo(f"Packages changed since '{since}': {', '.join(changed_pkgs) if changed_pkgs else '<none>'}", err=err)
+    if dependent_pkgs:
+        echo(f"Packages depending on changed packages: {', '.join(dependent_pkgs)}", err=err)
+
+    return set(changed_pkgs + dependent_pkgs)
+
+
+def display_slowest(project, top=10):
+    stats = TestHistory().slowest(id_prefix=f"{project.fullname}/", top=top)
+    if not stats:
+        echo("No test history recorded yet.")
+        return
+
+    echo('\t'.join(['TEST', 'LAST(s)', 'AVERAGE(s)', 'RUNS', 'TREND']))
+    for s in stats:
+        trend = f"{s['trend']:+.0%}" if s['trend'] is not None else 'n/a'
+        echo('\t'.join([
+            s['id'].replace(f"{project.fullname}/", '', 1),
+            f"{s['last']:.1f}",
+            f"{s['average']:.1f}",
+            str(s['runs']),
+            trend
+        ]))
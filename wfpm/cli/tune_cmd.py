@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import os
+import sys
+import difflib
+from click import echo
+from ..trace import PerfStore
+from ..tune import pkg_processes, pkg_resource_params, recommend, split_by_params, tune_block, update_config
+
+
+def tune_cmd(project, pkg_name, pct=95, headroom=20, dry_run=False):
+    pkg = next((p for p in project.pkgs if p.name == pkg_name), None)
+    if not pkg:
+        echo(f"No package found as: '{pkg_name}'.")
+        sys.exit(1)
+
+    store = PerfStore()
+    pkg_id = f"{project.fullname}/{pkg.name}"
+    recorded = store.get(pkg_id, pkg.version)
+    if not recorded and store.versions(pkg_id):  # fall back to the latest version tested
+        recorded = store.get(pkg_id, store.versions(pkg_id)[-1])
+    if not recorded:
+        echo(f"No performance metrics recorded for '{pkg.name}', run its tests first.")
+        sys.exit(1)
+
+    recommended = recommend(recorded['processes'], pkg_processes(pkg.pkg_path), pct, headroom)
+    if not recommended:
+        echo(f"No resource usage recorded for processes of '{pkg.name}', nothing to tune.")
+        sys.exit(1)
+
+    for name, r in recommended.items():
+        echo(f"{name}: cpus = {r['cpus']}, memory = '{r['memory']}' (from {r['tasks']} tasks)")
+
+    param_values, selectors = split_by_params(recommended, pkg_resource_params(pkg.pkg_path))
+    for name, value in sorted(param_values.items()):
+        echo(f"Default of params.{name} set to: {value}")
+
+    config_file = os.path.join(pkg.pkg_path, 'nextflow.config')
+    config_str = ''
+    if os.path.isfile(config_file):
+        with open(config_file, 'r') as f:
+            config_str = f.read()
+
+    block = tune_block(selectors, recorded['version'], pct, headroom, param_values=param_values)
+    new_config_str = update_config(config_str, block)
+    if new_config_str == config_str:
+        echo(f"Resources in {os.path.relpath(config_file)} are up to date.")
+        return
+
+    if dry_run:
+        rel_path = os.path.relpath(config_file, project.root)
+        echo(''.join(difflib.unified_diff(
+            config_str.splitlines(True), new_config_str.splitlines(True), f"a/{rel_path}", f"b/{rel_path}"
+        )), nl=False)
+        return
+
+    with open(config_file, 'w') as f:
+        f.write(new_config_str)
+
+    echo(f"Recommended resources written to: {os.path.relpath(config_file)}")
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+
+import os
+import sys
+import json
+from click import echo
+from ..validation import project_pkgs, validate_pkgs
+
+
+def validate_cmd(project, all_pkgs=False, as_json=False, max_workers=None):
+    pkgs = project_pkgs(project, installed=all_pkgs)
+    all_issues = validate_pkgs(
+        pkgs,
+        repo=(project.repo_server, project.repo_account, project.name),
+        installed_pkg_uris=set([p.pkg_uri for p in project.installed_pkgs]),
+        max_workers=max_workers or os.cpu_count() or 1
+    )
+
+    invalid_pkg_count = len([issues for issues in all_issues.values() if issues])
+    if as_json:
+        echo(json.dumps({
+            'packages': [{
+                'name': pkg.pkg_uri if 'wfpr_modules' in pkg.pkg_path else pkg.fullname,
+                'path': os.path.relpath(pkg.pkg_path, project.root),
+                'installed': 'wfpr_modules' in pkg.pkg_path,
+                'issues': all_issues[pkg.pkg_path]
+            } for pkg in pkgs]
+        }, indent=2))
+
+    else:
+        if not pkgs:
+            echo("No package found in the project.")
+
+        for pkg in pkgs:
+            issues = all_issues[pkg.pkg_path]
+            label = pkg.pkg_uri if 'wfpr_modules' in pkg.pkg_path else pkg.fullname
+            if not issues:
+                echo(f"{label}: valid")
+                continue
+
+            echo(f"{label}: {len(issues)} issue(s)")
+            for i in range(len(issues)):
+                echo(f"  [{i+1}/{len(issues)}] {issues[i]}")
+
+        if pkgs:
+            echo(f"Validation summary: packages: {len(pkgs)}, invalid packages: {invalid_pkg_count}")
+
+    if invalid_pkg_count:
+        sys.exit(1)
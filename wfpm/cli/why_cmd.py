@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+
+from click import echo
+from ..dependency import expand_pkg_uri
+
+
+def why_cmd(project, pkg):
+    index = project.dependents_index
+    pkg_uri = expand_pkg_uri(pkg, project.fullname).lower()
+    pkg_uris = [pkg_uri] if '@' in pkg_uri else sorted(index.versions.get(pkg_uri, []))
+
+    chains = [chain for uri in pkg_uris for chain in index.why(uri)]
+    if not chains:
+        echo(f"No local package depends on '{pkg_uri}'.")
+        return
+
+    for chain in chains:
+        steps = [chain[0]]
+        for dependent, dep in zip(chain, chain[1:]):
+            dev = ' (dev)' if index.dependents[dep][dependent] == 'devDependencies' else ''
+            steps.append(f"->{dev} {dep}")
+        echo(' '.join(steps))
@@ -19,16 +19,223 @@
         Junjun Zhang <junjun.zhang@oicr.on.ca>
 """
 
+import os
+import json
+import threading
 import networkx as nx
+from click import echo
+from glob import glob
+from typing import List, Dict
 from .package import Package
+from .cache import cache_dir, hash_str, write_json_atomic
 
 
-def build_dep_graph(start_pkg: Package = None, DG: nx.DiGraph = None):
+def build_dep_graph(start_pkg: Package = None, DG: nx.DiGraph = None, project_root=None):
+    """
+    Add dependencies of a package to the graph, recursively. Each package is resolved once and kept
+    as the 'pkg' attribute of its node, packages installed under 'project_root' are read from there
+    instead of being fetched. A package that can not be resolved is skipped with a warning, its node
+    gets the 'error' attribute instead
+    """
+    DG.add_node(start_pkg.pkg_uri, pkg=start_pkg)
     for dep in start_pkg.allDependencies:
         if dep == start_pkg.pkg_uri:
             raise Exception(f"Self dependency detected: {start_pkg.pkg_uri} -> {dep}")
 
+        resolved = dep in DG and 'pkg' in DG.nodes[dep]
         DG.add_edge(start_pkg.pkg_uri, dep)
+        if resolved:
+            continue
 
-        pkg = Package(pkg_uri=dep)
-        build_dep_graph(pkg, DG)
+        try:
+            pkg = (installed_package(dep, project_root) if project_root else None) or Package(pkg_uri=dep)
+        except Exception as ex:
+            echo(f"Warning: unable to resolve package '{dep}', skipped: {ex}")
+            DG.nodes[dep]['error'] = str(ex)
+            continue
+
+        build_dep_graph(pkg, DG, project_root)
+
+
+def installed_package(pkg_uri, project_root) -> Package:
+    """
+    Package installed under 'wfpr_modules' of the project, None if not installed, its pkg.json
+    does not match the uri or the installation is incomplete or changed
+    """
+    pkg_json = os.path.join(project_root, 'wfpr_modules', *pkg_uri.split('/'), 'pkg.json')
+    try:
+        pkg = Package(pkg_json=pkg_json)
+    except Exception:
+        return None
+
+    if pkg.pkg_uri.lower() != pkg_uri.lower():
+        return None
+
+    issues = pkg.installation_issues()
+    if issues:
+        echo(f"Warning: installed package '{pkg_uri}' not reused, to be installed again: {' '.join(issues)}")
+        return None
+
+    return pkg
+
+
+class DependentsIndex(object):
+    """
+    Reverse dependency index of a project: for each package uri, the local and installed packages
+    declaring it as a dependency or devDependency. Kept under the cache dir and refreshed
+    incrementally, only pkg.json files added, changed or removed since the last refresh are read
+    """
+    project_root: str = None
+    path: str = None
+    pkgs: dict = None  # pkg.json path relative to project root -> entry of the package
+    dependents: dict = None  # pkg uri (lower case) -> {dependent pkg uri: 'dependencies' or 'devDependencies'}
+    versions: dict = None  # pkg uri without version -> pkg uris of all versions depended on
+    _lock = threading.Lock()
+
+    def __init__(self, project_root, path=None):
+        self.project_root = os.path.realpath(project_root)
+        self.path = path or os.path.join(cache_dir('dependents'), f"{hash_str(self.project_root)}.json")
+        self._load()
+
+    def _load(self):
+        self.pkgs = dict()
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self.pkgs = json.load(f).get('pkgs', {})
+            except ValueError:
+                pass  # rebuilt from scratch when corrupted
+
+        self.dependents = dict()
+        self.versions = dict()
+        for entry in self.pkgs.values():
+            self._add_edges(entry)
+
+    def _add_edges(self, entry):
+        for dep_type in ('dependencies', 'devDependencies'):
+            for dep in entry[dep_type]:
+                self.dependents.setdefault(dep, {})[entry['pkg_uri']] = dep_type
+                self.versions.setdefault(dep.split('@')[0], set()).add(dep)
+
+    def _remove_edges(self, entry):
+        for dep in entry['dependencies'] + entry['devDependencies']:
+            self.dependents.get(dep, {}).pop(entry['pkg_uri'], None)
+            if not self.dependents.get(dep):
+                self.dependents.pop(dep, None)
+                self.versions.get(dep.split('@')[0], set()).discard(dep)
+
+    def pkg_jsons(self) -> List[str]:
+        return glob(os.path.join(self.project_root, '*', 'pkg.json')) + \
+            glob(os.path.join(self.project_root, 'wfpr_modules', 'github.com', '*', '*', '*', 'pkg.json'))
+
+    def refresh(self) -> bool:
+        """
+        Bring the index up to date with pkg.json files in the project, returns whether anything changed.
+        A pkg.json that can not be read is skipped with a warning and left out of the persisted index,
+        so it is read again on the next refresh
+        """
+        with self._lock:
+            seen = set()
+            changed = False
+            for pkg_json in self.pkg_jsons():
+                rel_path = os.path.relpath(pkg_json, self.project_root)
+                seen.add(rel_path)
+                stat = os.stat(pkg_json)
+                entry = self.pkgs.get(rel_path)
+                if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                    continue
+
+                if entry:
+                    self._remove_edges(self.pkgs.pop(rel_path))
+                    changed = True
+
+                try:
+                    pkg = Package(pkg_json=pkg_json)
+                except Exception as ex:
+                    echo(f"Warning: unable to read {rel_path}, skipped: {ex}")
+                    continue
+
+                entry = {
+                    'pkg_uri': pkg.pkg_uri.lower(),
+                    'local': not rel_path.startswith('wfpr_modules'),
+                    'mtime_ns': stat.st_mtime_ns,
+                    'size': stat.st_size,
+                    'dependencies': sorted(d.lower() for d in pkg.dependencies),
+                    'devDependencies': sorted(d.lower() for d in pkg.devDependencies)
+                }
+                self.pkgs[rel_path] = entry
+                self._add_edges(entry)
+                changed = True
+
+            for rel_path in set(self.pkgs) - seen:
+                self._remove_edges(self.pkgs.pop(rel_path))
+                changed = True
+
+            if changed:
+                write_json_atomic(self.path, {'project_root': self.project_root, 'pkgs': self.pkgs})
+
+            return changed
+
+    @property
+    def local_pkg_uris(self) -> List[str]:
+        return sorted(e['pkg_uri'] for e in self.pkgs.values() if e['local'])
+
+    def direct_dependents(self, pkg_uri, any_version=False) -> Dict[str, str]:
+        """
+        Packages declaring the given package as a dependency, with the type of dependency. With
+        'any_version', 'pkg_uri' has no version and dependents of all its versions are included.
+        Package uris are case insensitive
+        """
+        pkg_uri = pkg_uri.lower()
+        if not any_version:
+            return dict(self.dependents.get(pkg_uri, {}))
+
+        dependents = dict()
+        for versioned_uri in self.versions.get(pkg_uri, ()):
+            dependents.update(self.dependents.get(versioned_uri, {}))
+        return dependents
+
+    def all_dependents(self, pkg_uri, any_version=False) -> List[str]:
+        """
+        Packages depending on the given package directly or transitively
+        """
+        pkg_uri = pkg_uri.lower()
+        found = set()
+        to_visit = list(self.direct_dependents(pkg_uri, any_version))
+        while to_visit:
+            dependent = to_visit.pop()
+            if dependent not in found:
+                found.add(dependent)
+                to_visit.extend(self.direct_dependents(dependent))
+
+        return sorted(found - {pkg_uri})
+
+    def why(self, pkg_uri) -> List[List[str]]:
+        """
+        Dependency chains from local packages down to the given package, the shortest one from
+        each local package depending on it
+        """
+        pkg_uri = pkg_uri.lower()
+        local_uris = set(self.local_pkg_uris)
+        chains = []
+        paths = {pkg_uri: [pkg_uri]}
+        to_visit = [pkg_uri]
+        while to_visit:  # breadth first, so the first path reaching a package is a shortest one
+            current = to_visit.pop(0)
+            for dependent in sorted(self.direct_dependents(current)):
+                if dependent in paths:
+                    continue
+                paths[dependent] = [dependent] + paths[current]
+                to_visit.append(dependent)
+                if dependent in local_uris:
+                    chains.append(paths[dependent])
+
+        return chains
+
+
+def expand_pkg_uri(pkg, project_fullname) -> str:
+    """
+    Full uri of a package given by its uri or, for a package of the project, by its name with
+    or without version, eg, 'fastqc@0.2.0' to 'github.com/icgc-argo/demo-wfpkgs/fastqc@0.2.0'
+    """
+    return pkg if '/' in pkg else f"{project_fullname}/{pkg}"
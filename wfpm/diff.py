@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import os
+import re
+import gzip
+import hashlib
+from itertools import zip_longest
+from typing import List, Tuple, Pattern, BinaryIO
+
+
+CHUNK_SIZE = 1024 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+
+# longest part of a mismatched line shown around the first difference
+EXCERPT_WIDTH = 80
+
+
+class Mismatch(object):
+    """
+    Where two files first differ, 'line' and 'column' are 1-based, 'offset' is the 0-based byte
+    offset in the (decompressed) content. Excerpts show both lines around the difference
+    """
+    line: int = None
+    column: int = None
+    offset: int = None
+    output_excerpt: str = None
+    expected_excerpt: str = None
+
+    def __init__(self, line=None, column=None, offset=None, output_excerpt=None, expected_excerpt=None):
+        self.line = line
+        self.column = column
+        self.offset = offset
+        self.output_excerpt = output_excerpt
+        self.expected_excerpt = expected_excerpt
+
+    def __str__(self):
+        location = f"line {self.line}, column {self.column}"
+        if self.offset is not None:
+            location += f" (byte {self.offset})"
+
+        return f"first difference at {location}\n< {self.output_excerpt}\n> {self.expected_excerpt}"
+
+
+def excerpt(line: bytes, index: int, clipped=False) -> str:
+    """
+    Part of a line around position 'index', 'clipped' tells the line given misses its beginning
+    """
+    if line is None:
+        return '<end of file>'
+
+    line = line.rstrip(b'\r\n')
+    start = max(0, index - EXCERPT_WIDTH // 2)
+    text = line[start:start + EXCERPT_WIDTH].decode('utf-8', errors='replace')
+
+    return ('...' if start or clipped else '') + text + ('...' if start + EXCERPT_WIDTH < len(line) else '')
+
+
+def open_content(path) -> BinaryIO:
+    """
+    Open a file for reading its content, gzip (including BGZF, which is multi-member gzip) is
+    decompressed on the fly
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+
+    return gzip.open(path, 'rb') if magic == GZIP_MAGIC else open(path, 'rb', buffering=CHUNK_SIZE)
+
+
+def parse_rule(rule: str) -> Tuple[Pattern, bytes, int]:
+    """
+    Parse a sed style substitution, eg, 's#"header_filename">.*<br/>#"header_filename"><br/>#',
+    into a compiled pattern, its replacement and the number of substitutions (0 for all with 'g').
+    Patterns are Python regular expressions, '&' in the replacement is the whole match
+    """
+    if len(rule) < 4 or rule[0] != 's':
+        raise Exception(f"Invalid normalization rule, expected 's/pattern/replacement/[g]': {rule}")
+
+    delimiter = rule[1]
+    parts = re.split(r'(?<!\\)%s' % re.escape(delimiter), rule[2:])
+    if len(parts) != 3 or parts[2] not in ('', 'g'):
+        raise Exception(f"Invalid normalization rule, expected 's/pattern/replacement/[g]': {rule}")
+
+    pattern, replacement = (p.replace('\\' + delimiter, delimiter) for p in parts[:2])
+    replacement = re.sub(r'(?<!\\)&', r'\\g<0>', replacement)
+    try:
+        return re.compile(pattern.encode()), replacement.encode(), 0 if parts[2] == 'g' else 1
+    except re.error as ex:
+        raise Exception(f"Invalid pattern in normalization rule '{rule}': {ex}")
+
+
+def normalize(line: bytes, rules) -> bytes:
+    for pattern, replacement, count in rules:
+        line = pattern.sub(replacement, line, count=count)
+
+    return line
+
+
+def compare_lines(output_file, expected_file, rules: List[str]) -> Mismatch:
+    """
+    Compare line by line after normalizing each line with the rules, None when all lines match
+    """
+    rules = [parse_rule(r) for r in rules]
+    with open_content(output_file) as out, open_content(expected_file) as exp:
+        for line_no, (out_line, exp_line) in enumerate(zip_longest(out, exp), start=1):
+            if out_line is not None:
+                out_line = normalize(out_line, rules)
+            if exp_line is not None:
+                exp_line = normalize(exp_line, rules)
+
+            if out_line != exp_line:
+                i = first_difference(out_line or b'', exp_line or b'')
+                return Mismatch(
+                    line=line_no,
+                    column=i + 1,
+                    output_excerpt=excerpt(out_line, i),
+                    expected_excerpt=excerpt(exp_line, i)
+                )
+
+
+def first_difference(a: bytes, b: bytes) -> int:
+    for i, (x, y) in enumerate(zip(a, b)):
+        if x != y:
+            return i
+
+    return min(len(a), len(b))
+
+
+def compare_bytes(output_file, expected_file) -> Mismatch:
+    """
+    Compare content chunk by chunk without splitting it into lines, None when identical
+    """
+    # position in the current line, and its last bytes for the excerpt, carried over from chunk to chunk
+    offset, line_no, column, line_tail = 0, 1, 0, b''
+    with open_content(output_file) as out, open_content(expected_file) as exp:
+        while True:
+            out_chunk, exp_chunk = out.read(CHUNK_SIZE), exp.read(CHUNK_SIZE)
+            i = first_difference(out_chunk, exp_chunk) if out_chunk != exp_chunk else len(out_chunk)
+            same = out_chunk[:i]
+
+            line_no += same.count(b'\n')
+            if b'\n' in same:
+                line_tail = same.rsplit(b'\n', 1)[-1]
+                column = len(line_tail)
+            else:
+                line_tail += same
+                column += len(same)
+            line_tail = line_tail[-EXCERPT_WIDTH:]
+            offset += i
+
+            if out_chunk == exp_chunk:
+                if not out_chunk:
+                    return None
+                continue
+
+            clipped = column > len(line_tail)
+            return Mismatch(
+                line=line_no,
+                column=column + 1,
+                offset=offset,
+                output_excerpt=excerpt(line_tail + rest_of_line(out_chunk[i:], out), len(line_tail), clipped)
+                if i < len(out_chunk) else excerpt(None, 0),
+                expected_excerpt=excerpt(line_tail + rest_of_line(exp_chunk[i:], exp), len(line_tail), clipped)
+                if i < len(exp_chunk) else excerpt(None, 0)
+            )
+
+
+def rest_of_line(chunk: bytes, stream: BinaryIO) -> bytes:
+    if b'\n' not in chunk:
+        chunk += stream.readline(EXCERPT_WIDTH * 2)
+
+    return chunk.split(b'\n', 1)[0]
+
+
+def content_digest(path) -> str:
+    h = hashlib.sha256()
+    with open_content(path) as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def is_digest(value: str) -> bool:
+    return bool(re.match(r'^[0-9a-f]{64}$', value)) and not os.path.exists(value)
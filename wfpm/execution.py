@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import os
+import time
+import select
+import signal
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import Executor, Future
+from typing import List, Union, Callable
+from click import echo
+
+
+# time given to a process group to exit after SIGTERM before it gets SIGKILL, also the time given
+# to output readers to reach the end of the output once the process exited
+KILL_GRACE_PERIOD = 5
+
+# seconds an output reader waits for output before checking whether it is asked to stop
+PUMP_POLL_INTERVAL = 0.1
+
+
+class ProcessResult(object):
+    """
+    Outcome of a subprocess run. 'stdout' and 'stderr' keep only the last 'max_lines' lines of
+    the output when a limit is given, the full output goes to the log file if there is one
+    """
+    argv: Union[str, List[str]] = None
+    returncode: int = None
+    stdout: str = ''
+    stderr: str = ''
+    duration: float = 0.0  # wall time in seconds
+    max_rss: int = None  # peak resident set size in KB of the process and its waited-for descendants
+    timed_out: bool = False
+    truncated: bool = False  # output still held open by leftover processes was not read to the end
+    log_file: str = None
+
+    def __init__(self, argv=None, returncode=None, stdout='', stderr='', duration=0.0, max_rss=None,
+                 timed_out=False, truncated=False, log_file=None):
+        self.argv = argv
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+        self.max_rss = max_rss
+        self.timed_out = timed_out
+        self.truncated = truncated
+        self.log_file = log_file
+
+
+def _pump(stream, buffer: deque, log=None, log_lock=None, on_line: Callable = None, prefix='',
+          stop: threading.Event = None):
+    """
+    Read a stream line by line until its end, or until 'stop' is set
+    """
+    def take(raw_line):
+        line = raw_line.decode('utf-8', errors='replace')
+        buffer.append(line)
+        if log:
+            with log_lock:
+                log.write(prefix + line)
+                log.flush()
+        if on_line:
+            on_line(line.rstrip('\n'))
+
+    fd = stream.fileno()
+    pending = b''
+    while not (stop and stop.is_set()):
+        ready, _, _ = select.select([fd], [], [], PUMP_POLL_INTERVAL)
+        if not ready:
+            continue
+
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            break
+
+        *lines, pending = (pending + chunk).split(b'\n')
+        for raw_line in lines:
+            take(raw_line + b'\n')
+
+    if pending:
+        take(pending)
+
+
+def _kill_group(proc: subprocess.Popen, sig) -> None:
+    try:
+        os.killpg(proc.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass  # already gone
+
+
+def _feed(stream, data: bytes, stop: threading.Event) -> None:
+    """
+    Write 'data' to a stream and close it, giving up once 'stop' is set
+    """
+    fd = stream.fileno()
+    view = memoryview(data)
+    try:
+        while view and not stop.is_set():
+            _, ready, _ = select.select([], [fd], [], PUMP_POLL_INTERVAL)
+            if ready:  # there is room for at least PIPE_BUF bytes, writing as much does not block
+                view = view[os.write(fd, view[:select.PIPE_BUF]):]
+    except OSError:
+        pass  # the command exited or closed its stdin without reading it all
+    finally:
+        try:
+            stream.close()
+        except OSError:
+            pass
+
+
+def run_process(argv: Union[str, List[str]], cwd=None, env=None, timeout=None, shell=False, max_lines=None,
+                log_file=None, stream_prefix=None, input: str = None) -> ProcessResult:
+    """
+    Run a command given as an argv list, or as a string when 'shell' is True. 'input' is written
+    to its stdin, which is otherwise empty. Output is read line by line as it comes, kept in bounded
+    buffers, optionally appended to a log file and streamed to the console with 'stream_prefix'.
+    The command runs in its own process group, which is killed as a whole when 'timeout' (seconds)
+    is exceeded
+    """
+    start = time.monotonic()
+    try:
+        proc = subprocess.Popen(
+            argv,
+            shell=shell,
+            cwd=cwd,
+            env=env,
+            stdin=subprocess.DEVNULL if input is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True
+        )
+    except OSError as ex:  # eg, executable not found, cwd does not exist
+        return ProcessResult(argv=argv, returncode=127, stderr=str(ex), duration=time.monotonic() - start)
+
+    out_buffer, err_buffer = deque(maxlen=max_lines), deque(maxlen=max_lines)
+    log = open(log_file, 'a') if log_file else None
+    log_lock = threading.Lock()
+    on_line = (lambda line: echo(f"{stream_prefix}{line}")) if stream_prefix is not None else None
+    stop = threading.Event()
+
+    pumps = [
+        threading.Thread(target=_pump, args=(proc.stdout, out_buffer, log, log_lock, on_line, '', stop), daemon=True),
+        threading.Thread(target=_pump, args=(proc.stderr, err_buffer, log, log_lock, on_line, '[stderr] ', stop),
+                         daemon=True)
+    ]
+    for p in pumps:
+        p.start()
+
+    feeder = None
+    if input is not None:  # from a thread of its own, not to block on a full pipe while output is not read
+        feeder = threading.Thread(target=_feed, args=(proc.stdin, input.encode(), stop), daemon=True)
+        feeder.start()
+
+    # wait4 instead of Popen.wait to also get resource usage of the finished child
+    timed_out = False
+    kill_deadline = None
+    while True:
+        pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            break
+
+        now = time.monotonic()
+        if timeout and not timed_out and now - start > timeout:
+            timed_out = True
+            _kill_group(proc, signal.SIGTERM)
+            kill_deadline = now + KILL_GRACE_PERIOD
+        elif kill_deadline and now > kill_deadline:
+            _kill_group(proc, signal.SIGKILL)
+            kill_deadline = None
+
+        time.sleep(0.05)
+
+    proc.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    if timed_out:
+        _kill_group(proc, signal.SIGKILL)  # leftovers of the group may still hold the pipes
+
+    # processes left behind, eg, started in the background, may keep the pipes open after the
+    # command exited, in which case the readers are stopped and the output is marked as truncated
+    deadline = time.monotonic() + KILL_GRACE_PERIOD
+    for p in pumps:
+        p.join(timeout=max(0, deadline - time.monotonic()))
+    truncated = any(p.is_alive() for p in pumps)
+    stop.set()
+    for p in pumps:
+        p.join()
+    if feeder:
+        feeder.join()
+    proc.stdout.close()
+    proc.stderr.close()
+
+    if log:
+        if timed_out:
+            log.write(f"wfpm: command timed out after {timeout} seconds, killed\n")
+        if truncated:
+            log.write("wfpm: output held open by processes left behind, not read to the end\n")
+        log.close()
+
+    stderr = ''.join(err_buffer)
+    if timed_out:
+        stderr += f"\nCommand timed out after {timeout} seconds, killed."
+    if truncated:
+        stderr += "\nOutput truncated, it is held open by processes left behind by the command."
+
+    return ProcessResult(
+        argv=argv,
+        returncode=proc.returncode,
+        stdout=''.join(out_buffer),
+        stderr=stderr,
+        duration=time.monotonic() - start,
+        max_rss=rusage.ru_maxrss,
+        timed_out=timed_out,
+        truncated=truncated,
+        log_file=log_file
+    )
+
+
+class ResourceScheduler(object):
+    """
+    Starts tasks on an executor once the CPUs and memory (GB) they declare fit in what is left of
+    the budget. Tasks start in the order submitted, except that a later task that fits may go ahead
+    of one still waiting for resources. A task needing more than the whole budget runs when no other
+    task does. Futures of tasks not started yet can be cancelled
+    """
+    max_cpus: int = None
+    max_memory: float = None
+    used_cpus: int = 0
+    used_memory: float = 0.0
+    running: int = 0
+
+    def __init__(self, executor: Executor, max_cpus=None, max_memory=None):
+        self.executor = executor
+        self.max_cpus = max_cpus
+        self.max_memory = max_memory
+        self._pending = []
+        self._cond = threading.Condition()
+        self._dispatcher = None
+
+    def submit(self, cpus, memory, fn: Callable, *args, **kwargs) -> Future:
+        future = Future()
+        with self._cond:
+            self._pending.append((future, cpus, memory, fn, args, kwargs))
+            if not self._dispatcher:
+                self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+                self._dispatcher.start()
+            self._cond.notify_all()
+
+        return future
+
+    def _fits(self, cpus, memory) -> bool:
+        if not self.running:
+            return True
+
+        return (self.max_cpus is None or self.used_cpus + cpus <= self.max_cpus) and \
+            (self.max_memory is None or self.used_memory + memory <= self.max_memory)
+
+    def _dispatch(self):
+        with self._cond:
+            while self._pending:
+                for task in list(self._pending):
+                    future, cpus, memory, fn, args, kwargs = task
+                    if not future.cancelled() and not self._fits(cpus, memory):
+                        continue
+
+                    self._pending.remove(task)
+                    if not future.set_running_or_notify_cancel():
+                        continue
+
+                    self.used_cpus += cpus
+                    self.used_memory += memory
+                    self.running += 1
+                    self.executor.submit(self._run, future, cpus, memory, fn, args, kwargs)
+
+                if self._pending:
+                    # cancelling a future does not notify, so check back every now and then
+                    self._cond.wait(timeout=1)
+
+            self._dispatcher = None
+
+    def _run(self, future: Future, cpus, memory, fn: Callable, args, kwargs):
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as ex:
+            future.set_exception(ex)
+        else:
+            # done callbacks run before resources are released, they may still cancel tasks not started
+            future.set_result(result)
+        finally:
+            with self._cond:
+                self.used_cpus -= cpus
+                self.used_memory -= memory
+                self.running -= 1
+                self._cond.notify_all()
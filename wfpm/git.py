@@ -22,11 +22,17 @@
 import os
 import re
 import logging
+import tempfile
 from click import echo
 from typing import List, Dict
 from functools import lru_cache
 from distutils.version import LooseVersion
 from .utils import run_cmd
+from .execution import run_process
+
+
+# seconds allowed for git commands talking to the remote
+GIT_NETWORK_TIMEOUT = 300
 
 
 class Git(object):
@@ -50,7 +56,7 @@ class Git(object):
         self._get_git_info()
 
     def _get_git_info(self):
-        stdout, stderr, ret = run_cmd('git --version')
+        stdout, stderr, ret = run_cmd(['git', '--version'])
         if ret != 0:  # error out, git not available
             return
 
@@ -60,16 +66,18 @@ class Git(object):
         else:
             return  # git version too low or unable to determine version
 
-        git_user_info_str, stderr, ret = run_cmd('git config --list | grep user')
+        git_user_info_str, stderr, ret = run_cmd(['git', 'config', '--list'])
         if ret == 0:  # cmd success
             for info in git_user_info_str.split("\n"):
-                key, value = info.split('=')
+                if not info.startswith('user.') or '=' not in info:
+                    continue
+                key, value = info.split('=', 1)
                 if key.strip() == 'user.name':
                     self.user_name = value.strip()
                 elif key.strip() == 'user.email':
                     self.user_email = value.strip()
 
-        branch_info_str, stderr, ret = run_cmd('git branch -a')
+        branch_info_str, stderr, ret = run_cmd(['git', 'branch', '-a'])
         if ret == 0:
             for branch in branch_info_str.split('\n'):
                 branch = branch.strip()
@@ -84,7 +92,7 @@ class Git(object):
                 else:
                     self.local_branches.append(branch)
 
-        tag_info_str, stderr, ret = run_cmd('git tag -l')
+        tag_info_str, stderr, ret = run_cmd(['git', 'tag', '-l'])
         if ret == 0:
             for tag in tag_info_str.split('\n'):
                 if len(tag) > 0:
@@ -153,10 +161,13 @@ class Git(object):
             # that prevents branch switching from being started
             paths_to_cleanup.append(self.current_branch.split('@')[0])
 
-        cmd = f'cd $(git rev-parse --show-toplevel) && git checkout {branch}' + \
-              f' && git clean -xdf {" ".join(paths_to_cleanup)}'
+        stdout = ''
+        toplevel, stderr, ret = run_cmd(['git', 'rev-parse', '--show-toplevel'])
+        if ret == 0:
+            stdout, stderr, ret = run_cmd(['git', 'checkout', branch], cwd=toplevel)
+        if ret == 0:
+            stdout, stderr, ret = run_cmd(['git', 'clean', '-xdf'] + paths_to_cleanup, cwd=toplevel)
 
-        stdout, stderr, ret = run_cmd(cmd)
         if ret != 0:
             raise Exception(f"Failed to switch to '{branch}'.\nSTDOUT: {stdout}\nSTDERR: {stderr}")
         else:
@@ -166,7 +177,7 @@ class Git(object):
         if not branch:
             raise Exception("Error: must specify a new branch name.")
 
-        stdout, stderr, ret = run_cmd(f'git checkout -b {branch}')
+        stdout, stderr, ret = run_cmd(['git', 'checkout', '-b', branch])
         if ret != 0:
             raise Exception(f"Failed to create new branch '{branch}'.\nSTDOUT: {stdout}\nSTDERR: {stderr}")
         else:
@@ -181,7 +192,7 @@ class Git(object):
 
         self.cmd_checkout_branch('main')  # first switch to 'main' branch which always exists
 
-        stdout, stderr, ret = run_cmd(f'git branch -D {branch}')
+        stdout, stderr, ret = run_cmd(['git', 'branch', '-D', branch])
         if ret != 0:
             raise Exception(f"Failed to remove branch '{branch}'.\nSTDOUT: {stdout}\nSTDERR: {stderr}")
 
@@ -189,7 +200,7 @@ class Git(object):
         if not tag or not branch:
             raise Exception("Error: must specify both the tag and new branch name.")
 
-        stdout, stderr, ret = run_cmd(f'git checkout tags/{tag} -b {branch}')
+        stdout, stderr, ret = run_cmd(['git', 'checkout', f'tags/{tag}', '-b', branch])
         if ret != 0:
             raise Exception(f"Failed to create new branch '{branch}' from tag '{tag}'.\nSTDOUT: {stdout}\nSTDERR: {stderr}")
         else:
@@ -199,32 +210,111 @@ class Git(object):
         if not (path and message):
             raise Exception("Error: must specify path to add and commit message.")
 
-        cmd = f"git add {path} && git commit -m '{message}'"
-        stdout, stderr, ret = run_cmd(cmd)
+        paths = [path] if isinstance(path, str) else list(path)
+        for cmd in (['git', 'add'] + paths, ['git', 'commit', '-m', message]):
+            stdout, stderr, ret = run_cmd(cmd)
+            if ret != 0:
+                raise Exception(f"Failed to execute: {' '.join(cmd)}.\nSTDOUT: {stdout}\nSTDERR: {stderr}")
+
+    def cmd_commit_tree(self, paths, message, parent='HEAD') -> str:
+        """
+        Create a commit on top of 'parent' with the given paths added, without touching the current
+        branch, its index or the working tree. 'paths' are (work_tree, [path, ...]) pairs, each path
+        relative to its work tree, the usual ignore rules apply as found under each work tree. Returns
+        id of the new commit
+        """
+        git_dir, stderr, ret = run_cmd(['git', 'rev-parse', '--absolute-git-dir'])
+        if ret != 0:
+            raise Exception(f"Not in a git repository.\nSTDERR: {stderr}")
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            env = {**os.environ, 'GIT_INDEX_FILE': os.path.join(tmpdirname, 'index')}
+            cmds = [(['git', 'read-tree', parent], None)]
+            for work_tree, work_tree_paths in paths:
+                if work_tree_paths:
+                    cmds.append((
+                        ['git', f'--git-dir={git_dir}', f'--work-tree={work_tree}', 'add', '--'] + list(work_tree_paths),
+                        work_tree
+                    ))
+            cmds.append((['git', 'write-tree'], None))
+
+            for cmd, cwd in cmds:
+                result = run_process(cmd, cwd=cwd, env=env)
+                if result.returncode != 0:
+                    raise Exception(f"Failed to execute: {' '.join(cmd)}.\n"
+                                    f"STDOUT: {result.stdout.strip()}\nSTDERR: {result.stderr.strip()}")
+
+        tree = result.stdout.strip()
+        commit, stderr, ret = run_cmd(['git', 'commit-tree', tree, '-p', parent, '-m', message])
+        if ret != 0:
+            raise Exception(f"Failed to commit tree '{tree}'.\nSTDERR: {stderr}")
+
+        return commit
+
+    def cmd_create_branches(self, branches: Dict[str, str]) -> None:
+        """
+        Create branches pointing to the given commits, all in a single transaction
+        """
+        refs = ''.join(f"create refs/heads/{branch} {commit}\n" for branch, commit in branches.items())
+        result = run_process(['git', 'update-ref', '--stdin'], input=refs)
+        stderr, ret = result.stderr.strip(), result.returncode
+
         if ret != 0:
-            raise Exception(f"Failed to execute: {cmd}.\nSTDOUT: {stdout}\nSTDERR: {stderr}")
+            raise Exception(f"Failed to create branches: {', '.join(branches)}.\nSTDERR: {stderr}")
+
+        self.local_branches.extend(branches)
 
     def branch_clean(self):
-        stdout, stderr, ret = run_cmd('git status')
+        stdout, stderr, ret = run_cmd(['git', 'status'])
         if 'working tree clean' in stdout or 'working directory clean' in stdout:
             return True
         return False
 
     def fetch_and_housekeeping(self) -> bool:
-        cmd = 'git fetch --all --tags'
+        cmds = [['git', 'fetch', '--all', '--tags']]
         # if currently on main branch, we can prune local branches that reference to deleted remote branch
         if self.current_branch == 'main':
-            cmd += ' && git remote prune origin'
+            cmds.append(['git', 'remote', 'prune', 'origin'])
 
-        stdout, stderr, ret = run_cmd(cmd)
-        if ret == 0:
-            return True
-        else:
-            echo(f"Info: failed to perform '{cmd}'.\nSTDOUT: {stdout}\nSTDERR: {stderr}")
-            return False
+        for cmd in cmds:
+            stdout, stderr, ret = run_cmd(cmd, timeout=GIT_NETWORK_TIMEOUT)
+            if ret != 0:
+                echo(f"Info: failed to perform '{' '.join(cmd)}'.\nSTDOUT: {stdout}\nSTDERR: {stderr}")
+                return False
+
+        return True
+
+    def ref_exists(self, ref) -> bool:
+        _, _, ret = run_cmd(['git', 'rev-parse', '--verify', '--quiet', f"{ref}^{{commit}}"])
+        return ret == 0
+
+    def changed_files(self, since=None) -> List[str]:
+        """
+        Files changed since the merge base of 'since' and HEAD, including uncommitted and untracked
+        changes. Returned paths are absolute
+        """
+        if not since:
+            raise Exception("Error: must specify a git ref to compare with.")
+
+        toplevel, stderr, ret = run_cmd(['git', 'rev-parse', '--show-toplevel'])
+        if ret != 0:
+            raise Exception(f"Not in a git repository.\nSTDERR: {stderr}")
+
+        merge_base, stderr, ret = run_cmd(['git', 'merge-base', since, 'HEAD'])
+        if ret != 0:
+            raise Exception(f"Unable to find common ancestor of '{since}' and HEAD.\nSTDERR: {stderr}")
+
+        files = set()
+        for cmd in (['git', 'diff', '--name-only', merge_base], ['git', 'ls-files', '--others', '--exclude-standard']):
+            stdout, stderr, ret = run_cmd(cmd, cwd=toplevel)
+            if ret != 0:
+                raise Exception(f"Failed to execute: {' '.join(cmd)}.\nSTDOUT: {stdout}\nSTDERR: {stderr}")
+            files.update(os.path.join(toplevel, f) for f in stdout.split('\n') if f.strip())
+
+        return sorted(files)
 
     def get_status(self):
-        stdout, stderr, ret = run_cmd('git status')
+        stdout, stderr, ret = run_cmd(['git', 'status'])
         if ret == 0:
             if 'branch is behind ' in stdout and ('working tree clean' in stdout or 'working directory clean' in stdout):
                 return 'behind-clean'
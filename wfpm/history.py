@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import os
+import json
+import threading
+from datetime import datetime
+from typing import List, Set, Tuple
+from .cache import cache_dir, write_json_atomic
+
+
+class TestHistory(object):
+    """
+    Local store of recent test job runs, keyed by job id which stays the same across package versions
+    """
+    max_runs: int = 20
+    path: str = None
+    runs: dict = None
+    _lock = threading.Lock()  # tests may finish and get recorded concurrently
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(cache_dir(), 'test-history.json')
+        self._load()
+
+    def _load(self):
+        self.runs = dict()
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self.runs = json.load(f)
+            except ValueError:
+                pass  # start over when history is corrupted
+
+    def record(self, results) -> None:
+        with self._lock:
+            self._load()  # pick up runs recorded since this was loaded
+            self._record(results)
+
+    def _record(self, results) -> None:
+        now = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        for result in results:
+            if result.cached or result.skipped:  # no run, nothing to learn from
+                continue
+
+            runs = self.runs.setdefault(result.job.id, [])
+            runs.append({
+                'time': now,
+                'pkg_version': result.job.pkg_version,
+                'passed': result.passed,
+                'exit_code': result.returncode,
+                # a batched job's share of its session is not known when not in the trace
+                'duration': round(result.duration, 3) if result.duration_measured else None,
+                'run_name': result.run_name,
+                'max_rss': result.max_rss,
+                'cpus': result.cpus,
+                'memory': result.memory
+            })
+            del runs[:-self.max_runs]
+
+        write_json_atomic(self.path, self.runs)
+
+    def durations(self, job_id) -> List[float]:
+        return [r['duration'] for r in self.runs.get(job_id, []) if r.get('duration') is not None]
+
+    def resource_usage(self, job_id) -> Tuple[int, float]:
+        """
+        Peak CPUs and memory (GB) used by a job over its recent runs, None where never measured
+        """
+        runs = self.runs.get(job_id, [])
+        cpus = [r['cpus'] for r in runs if r.get('cpus')]
+        memory = [r['memory'] for r in runs if r.get('memory')]
+
+        return max(cpus) if cpus else None, max(memory) if memory else None
+
+    def slowest(self, id_prefix='', top=10) -> List[dict]:
+        """
+        Jobs ranked by their average duration over recent runs, the trend compares the average
+        of the latest 3 runs with the 3 runs before
+        """
+        stats = []
+        for job_id in self.runs:
+            if not job_id.startswith(id_prefix):
+                continue
+
+            durations = self.durations(job_id)
+            if not durations:
+                continue
+
+            latest, previous = durations[-3:], durations[-6:-3]
+            trend = None
+            if previous and sum(previous):
+                trend = (sum(latest) / len(latest)) / (sum(previous) / len(previous)) - 1
+
+            stats.append({
+                'id': job_id,
+                'last': durations[-1],
+                'average': sum(durations) / len(durations),
+                'runs': len(durations),
+                'trend': trend
+            })
+
+        return sorted(stats, key=lambda s: (-s['average'], s['id']))[:top]
+
+
+class TestStatus(object):
+    """
+    Outcome of the latest run of each test job, including those passed from the cache, used to
+    find test jobs that failed last time
+    """
+    path: str = None
+    status: dict = None
+    _lock = threading.Lock()
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(cache_dir(), 'test-status.json')
+        self._load()
+
+    def _load(self):
+        self.status = dict()
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self.status = json.load(f)
+            except ValueError:
+                pass
+
+    def update(self, results) -> None:
+        now = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        with self._lock:
+            self._load()
+            for result in results:
+                if result.skipped:
+                    continue
+                self.status[result.job.id] = {'time': now, 'passed': result.passed}
+
+            write_json_atomic(self.path, self.status)
+
+    def failed(self) -> Set[str]:
+        return set(job_id for job_id, s in self.status.items() if not s.get('passed'))
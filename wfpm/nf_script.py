@@ -0,0 +1,547 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
+
+# token kinds
+NAME, STRING, NUMBER, OP, NEWLINE = 'NAME', 'STRING', 'NUMBER', 'OP', 'NEWLINE'
+
+# after any of these a '/' starts a slashy string (regex) rather than being a division
+SLASHY_PRECEDERS = set('(,=~:[{!&|?;') | {None}
+
+PROCESS_SECTIONS = ('input', 'output', 'when', 'script', 'shell', 'exec', 'stub')
+WORKFLOW_SECTIONS = ('take', 'main', 'emit')
+
+# everything but strings and operators, '\' at the end of a line is a line continuation
+_TOKEN_RE = re.compile(
+    r'(?P<newline>\n)|(?P<space>[ \t\r\f\\]+)|(?P<comment>//[^\n]*)|(?P<block_comment>/\*.*?(?:\*/|\Z))'
+    r'|(?P<name>[A-Za-z_$][0-9A-Za-z_$]*)|(?P<number>[0-9][0-9_]*(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?[A-Za-z]*)',
+    re.S
+)
+
+# parsed scripts by content hash, bounded as it is only meant to avoid parsing the same script twice
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+CACHE_SIZE = 1024
+
+
+class Token(object):
+    kind: str = None
+    value: str = None
+    start: int = None  # offset in the script
+    end: int = None
+    line: int = None  # 1-based
+
+    def __init__(self, kind, value, start, end, line):
+        self.kind = kind
+        self.value = value
+        self.start = start
+        self.end = end
+        self.line = line
+
+    def __repr__(self):
+        return f"{self.kind}({self.value!r})"
+
+
+class Include(object):
+    items: List[Tuple[str, str]] = None  # (name, alias), alias is the name when not aliased
+    source: str = None
+    line: int = None
+
+    def __init__(self, items=None, source=None, line=None):
+        self.items = items or []
+        self.source = source
+        self.line = line
+
+
+class Declaration(object):
+    """
+    An input or output declaration of a process, eg, 'path "output_dir/*", emit: output_file'
+    """
+    qualifier: str = None
+    text: str = None
+    emit: str = None
+
+    def __init__(self, qualifier=None, text=None, emit=None):
+        self.qualifier = qualifier
+        self.text = text
+        self.emit = emit
+
+
+class Param(object):
+    """
+    A top level 'params.<name> = <value>' statement, 'value' is the source text of the value
+    """
+    name: str = None
+    value: str = None
+    tokens: List[Token] = None
+    line: int = None
+    start: int = None  # offsets of the statement
+    end: int = None
+
+    def __init__(self, name=None, value=None, tokens=None, line=None, start=None, end=None):
+        self.name = name
+        self.value = value
+        self.tokens = tokens or []
+        self.line = line
+        self.start = start
+        self.end = end
+
+
+class Block(object):
+    """
+    A named (or, for the entry workflow, unnamed) block. 'start' is the offset of its keyword,
+    'body_start' and 'end' those right after the opening brace and of the closing brace
+    """
+    kind: str = None  # 'workflow' or 'process'
+    name: str = None
+    line: int = None
+    start: int = None
+    body_start: int = None
+    end: int = None
+    take: List[str] = None  # workflow only
+    emit: List[str] = None  # workflow only
+    inputs: List[Declaration] = None  # process only
+    outputs: List[Declaration] = None  # process only
+    sections: dict = None  # offset of the label of each section, eg, 'script:'
+    directives: dict = None  # process only, source text of the value of each directive, eg, 'cpus'
+    calls: List[str] = None  # workflow only, names called in its body
+
+    def __init__(self, kind, name=None, line=None, start=None):
+        self.kind = kind
+        self.name = name
+        self.line = line
+        self.start = start
+        self.take, self.emit, self.inputs, self.outputs = [], [], [], []
+        self.sections = OrderedDict()
+        self.directives = OrderedDict()
+        self.calls = []
+
+
+class ScriptSymbols(object):
+    """
+    Symbols defined in a Nextflow DSL2 script
+    """
+    workflows: List[Block] = None
+    processes: List[Block] = None
+    functions: List[str] = None
+    includes: List[Include] = None
+    params: List[Param] = None  # top level defaults of params
+    version: str = None
+
+    def __init__(self):
+        self.workflows, self.processes, self.functions, self.includes, self.params = [], [], [], [], []
+
+    @property
+    def entry_workflow(self) -> Block:
+        return next((w for w in self.workflows if w.name is None), None)
+
+    @property
+    def defined_names(self) -> List[str]:
+        return [w.name for w in self.workflows if w.name] + [p.name for p in self.processes] + self.functions
+
+    @property
+    def main_name(self) -> str:
+        """
+        Name of what the script offers in the first place: the named workflow not called by another
+        one, or the first process when there is no named workflow, eg, in a tool package
+        """
+        workflows = [w for w in self.workflows if w.name]
+        called = set(c for w in workflows for c in w.calls)
+        main = next((w for w in workflows if w.name not in called), workflows[0] if workflows else None)
+        if main:
+            return main.name
+        return self.processes[0].name if self.processes else None
+
+    @property
+    def exports(self) -> List[str]:
+        """
+        Names other scripts can include: the main one first (see 'main_name'), then the other defined
+        workflows, processes and functions, plus names included from the package's own local scripts,
+        which are part of what it offers
+        """
+        main_names = [self.main_name] if self.main_name else []
+        defined = main_names + [n for n in self.defined_names if n not in main_names]
+        included = [
+            alias for i in self.includes if i.source and 'wfpr_modules' not in i.source for _, alias in i.items
+        ]
+        return defined + [n for n in included if n not in defined]
+
+
+def tokenize(script: str) -> List[Token]:
+    """
+    Split a script into names, strings, numbers, operators (one char each) and newlines, comments
+    and other white space are dropped. Strings are kept as one token, including GString and
+    slashy strings, so that braces in them do not count as blocks
+    """
+    tokens = []
+    i, line, n = 0, 1, len(script)
+    prev = None  # value of the previous significant token, to tell a slashy string from a division
+    while i < n:
+        c = script[i]
+        m = None if c in '\'"' else _TOKEN_RE.match(script, i)
+        kind = m.lastgroup if m else None
+        if c in '\'"' or (c == '/' and prev in SLASHY_PRECEDERS and kind != 'comment' and kind != 'block_comment'):
+            end = _string_end(script, i)
+            tokens.append(Token(STRING, script[i:end], i, end, line))
+            line += script.count('\n', i, end)
+            i = end
+        elif kind == 'newline':
+            tokens.append(Token(NEWLINE, '\n', i, i + 1, line))
+            line += 1
+            i += 1
+            continue
+        elif kind in ('space', 'comment', 'block_comment'):
+            line += script.count('\n', i, m.end()) if kind == 'block_comment' else 0
+            i = m.end()
+            continue
+        elif kind in ('name', 'number'):
+            tokens.append(Token(NAME if kind == 'name' else NUMBER, m.group(), i, m.end(), line))
+            i = m.end()
+        else:
+            tokens.append(Token(OP, c, i, i + 1, line))
+            i += 1
+
+        prev = tokens[-1].value if tokens[-1].kind == OP else tokens[-1].kind
+
+    return tokens
+
+
+def _string_end(script: str, start: int) -> int:
+    """
+    Offset right after the string starting at 'start', the end of the script if not closed
+    """
+    n = len(script)
+    quote = script[start]
+    if quote != '/' and script.startswith(quote * 3, start):
+        quote *= 3
+
+    interpolated = quote[0] in '"/'
+    i = start + len(quote)
+    while i < n:
+        if script[i] == '\\':
+            i += 2
+        elif script.startswith(quote, i):
+            return i + len(quote)
+        elif quote in ('"', "'", '/') and script[i] == '\n':
+            return i  # unterminated single line string, do not let it swallow the rest
+        elif interpolated and script.startswith('${', i):
+            i = _expression_end(script, i + 2)
+        else:
+            i += 1
+
+    return n
+
+
+def _expression_end(script: str, start: int) -> int:
+    """
+    Offset right after the '}' closing a '${' expression, strings in it may have braces of their own
+    """
+    depth, i, n = 1, start, len(script)
+    while i < n:
+        c = script[i]
+        if c in '\'"':
+            i = _string_end(script, i)
+            continue
+        if c == '{':
+            depth += 1
+        elif c == '}':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+
+    return n
+
+
+def string_value(token: Token) -> str:
+    quote = token.value[:3] if token.value[:3] in ('"""', "'''") else token.value[:1]
+    return token.value[len(quote):len(token.value) - len(quote)]
+
+
+def literal_value(tokens: List[Token]) -> Tuple[bool, object]:
+    """
+    Value of a simple Groovy literal: a string with no interpolation or escapes, a number, 'true',
+    'false' or 'null'. Returns whether the tokens are such a literal, and its value
+    """
+    sign = 1
+    if len(tokens) == 2 and tokens[0].value == '-' and tokens[1].kind == NUMBER:
+        sign, tokens = -1, tokens[1:]
+    if len(tokens) != 1:
+        return False, None
+
+    t = tokens[0]
+    if t.kind == STRING and t.value[:1] in '\'"' and t.value[:3] not in ('"""', "'''") and '\\' not in t.value \
+            and not (t.value[0] == '"' and '$' in t.value) and len(t.value) > 1 and t.value[-1] == t.value[0]:
+        return sign == 1, string_value(t) if sign == 1 else None
+    if t.kind == NUMBER and re.match(r'^[0-9]+$', t.value):
+        return True, sign * int(t.value)
+    if t.kind == NUMBER and re.match(r'^[0-9]+\.[0-9]+(?:[eE][+-]?[0-9]+)?$', t.value):
+        return True, sign * float(t.value)
+    if t.kind == NAME and sign == 1 and t.value in ('true', 'false', 'null'):
+        return True, {'true': True, 'false': False, 'null': None}[t.value]
+
+    return False, None
+
+
+def parse(script: str) -> ScriptSymbols:
+    """
+    Symbols of a script in one pass over its tokens. Results are cached by the script's content hash
+    """
+    key = hashlib.sha256(script.encode()).hexdigest()
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    symbols = _parse(script, tokenize(script))
+    with _cache_lock:
+        _cache[key] = symbols
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return symbols
+
+
+def parse_file(script_file) -> ScriptSymbols:
+    with open(script_file, 'r') as f:
+        return parse(f.read())
+
+
+def _at_statement_start(tokens: List[Token], i: int) -> bool:
+    return i == 0 or tokens[i - 1].kind == NEWLINE or tokens[i - 1].value in (';', '{', '}')
+
+
+def _next_significant(tokens: List[Token], i: int) -> int:
+    while i < len(tokens) and tokens[i].kind == NEWLINE:
+        i += 1
+    return i
+
+
+def _closing(tokens: List[Token], i: int) -> int:
+    """
+    Index of the bracket closing the one at 'i', or the end of the tokens
+    """
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j].value in ('{', '(', '['):
+            depth += 1
+        elif tokens[j].value in ('}', ')', ']'):
+            depth -= 1
+            if depth == 0:
+                return j
+    return len(tokens)
+
+
+def _parse(script: str, tokens: List[Token]) -> ScriptSymbols:
+    symbols = ScriptSymbols()
+    depth = 0
+    i, n = 0, len(tokens)
+    while i < n:
+        t = tokens[i]
+        if t.kind == OP:
+            depth += {'{': 1, '}': -1}.get(t.value, 0)
+            i += 1
+            continue
+
+        if depth != 0 or t.kind != NAME or not _at_statement_start(tokens, i):
+            i += 1
+            continue
+
+        if t.value == 'include':
+            i = _parse_include(tokens, i, symbols)
+        elif t.value in ('workflow', 'process'):
+            i = _parse_block(script, tokens, i, symbols)
+        elif t.value == 'def':
+            # 'def name(' or 'def Type name(', not 'def name = ...'
+            j = i + 1
+            while j < n and tokens[j].kind == NAME:
+                j += 1
+            if j < n and tokens[j].value == '(' and j - 1 > i:
+                symbols.functions.append(tokens[j - 1].value)
+            i = j
+        elif t.value == 'params' and i + 4 < n and tokens[i + 1].value == '.' and tokens[i + 2].kind == NAME \
+                and tokens[i + 3].value == '=' and tokens[i + 4].value != '=':
+            i = _parse_param(script, tokens, i, symbols)
+        elif t.value == 'version' and i + 2 < n and tokens[i + 1].value == '=' and tokens[i + 2].kind == STRING:
+            if symbols.version is None:
+                symbols.version = string_value(tokens[i + 2])
+            i += 3
+        elif i + 2 < n and tokens[i + 1].kind == NAME and tokens[i + 2].value == '(' and \
+                t.value not in ('return', 'else', 'new', 'throw'):
+            # function with a return type, eg, 'String name(...) {', not a call like 'println name(...)'
+            j = _next_significant(tokens, _closing(tokens, i + 2) + 1)
+            if j < n and tokens[j].value == '{':
+                symbols.functions.append(tokens[i + 1].value)
+            i += 3
+        else:
+            i += 1
+
+    return symbols
+
+
+def _parse_include(tokens: List[Token], i: int, symbols: ScriptSymbols) -> int:
+    n = len(tokens)
+    include = Include(line=tokens[i].line)
+    j = _next_significant(tokens, i + 1)
+    if j >= n or tokens[j].value != '{':
+        return i + 1
+
+    names = []
+    j += 1
+    while j < n and tokens[j].value != '}':
+        if tokens[j].kind == NAME:
+            names.append(tokens[j].value)
+        elif tokens[j].value == ';' or tokens[j].kind == NEWLINE:
+            names.append(None)  # item separator
+        j += 1
+
+    item = []
+    for name in names + [None]:
+        if name is not None:
+            item.append(name)
+            continue
+        if item:
+            # 'name' or 'name as alias'
+            include.items.append((item[0], item[2] if len(item) == 3 and item[1] == 'as' else item[0]))
+        item = []
+
+    j = _next_significant(tokens, j + 1)
+    if j + 1 < n and tokens[j].value == 'from':
+        k = _next_significant(tokens, j + 1)
+        if k < n and tokens[k].kind == STRING:
+            include.source = string_value(tokens[k])
+            j = k + 1
+
+    symbols.includes.append(include)
+    return j
+
+
+def _parse_param(script: str, tokens: List[Token], i: int, symbols: ScriptSymbols) -> int:
+    """
+    'params.<name> = <value>', the value ends at a newline or ';' outside of brackets
+    """
+    n = len(tokens)
+    j = i + 4
+    depth = 0
+    while j < n:
+        t = tokens[j]
+        if depth == 0 and (t.kind == NEWLINE or t.value in (';', '}')):
+            break
+        if t.value in ('{', '(', '['):
+            depth += 1
+        elif t.value in ('}', ')', ']'):
+            depth -= 1
+        j += 1
+
+    value_tokens = tokens[i + 4:j]
+    if value_tokens:
+        symbols.params.append(Param(
+            name=tokens[i + 2].value,
+            value=script[value_tokens[0].start:value_tokens[-1].end],
+            tokens=value_tokens,
+            line=tokens[i].line,
+            start=tokens[i].start,
+            end=value_tokens[-1].end
+        ))
+
+    return j
+
+
+def _parse_block(script: str, tokens: List[Token], i: int, symbols: ScriptSymbols) -> int:
+    n = len(tokens)
+    block = Block(tokens[i].value, line=tokens[i].line, start=tokens[i].start)
+    j = i + 1
+    if j < n and tokens[j].kind == NAME:
+        block.name = tokens[j].value
+        j += 1
+    j = _next_significant(tokens, j)
+    if j >= n or tokens[j].value != '{' or (block.kind == 'process' and not block.name):
+        return i + 1
+
+    block.body_start = tokens[j].end
+    sections = WORKFLOW_SECTIONS if block.kind == 'workflow' else PROCESS_SECTIONS
+    section = None
+    statement = []  # tokens of the current statement at the block's top level
+    depth = 1
+    j += 1
+    while j < n and depth:
+        t = tokens[j]
+        if t.value in ('{', '(', '['):
+            depth += 1
+        elif t.value in ('}', ')', ']'):
+            depth -= 1
+            if depth == 0:
+                break
+
+        if depth == 1 and t.kind == NAME and t.value in sections and j + 1 < n and tokens[j + 1].value == ':' \
+                and not statement:
+            section = t.value
+            block.sections.setdefault(section, t.start)
+            j += 2
+            continue
+
+        if block.kind == 'workflow' and t.kind == NAME and j + 1 < n and tokens[j + 1].value == '(':
+            block.calls.append(t.value)
+
+        if depth == 1 and (t.kind == NEWLINE or t.value == ';'):
+            if statement:
+                _add_statement(script, block, section, statement)
+            statement = []
+        else:
+            statement.append(t)
+        j += 1
+
+    if statement:
+        _add_statement(script, block, section, statement)
+
+    block.end = tokens[j].start if j < n else len(script)
+    (symbols.workflows if block.kind == 'workflow' else symbols.processes).append(block)
+    return j + 1
+
+
+def _add_statement(script: str, block: Block, section: str, statement: List[Token]) -> None:
+    first = statement[0]
+    if block.kind == 'workflow':
+        if section == 'take' and first.kind == NAME:
+            block.take.append(first.value)
+        elif section == 'emit' and first.kind == NAME and (len(statement) == 1 or statement[1].value == '='):
+            block.emit.append(first.value)
+        return
+
+    if section is None and first.kind == NAME and len(statement) > 1:
+        block.directives.setdefault(first.value, script[statement[1].start:statement[-1].end])
+        return
+
+    if section in ('input', 'output') and first.kind == NAME:
+        text = script[first.start:statement[-1].end]
+        emit = None
+        for k in range(len(statement) - 2):
+            if statement[k].value == 'emit' and statement[k + 1].value == ':' and statement[k + 2].kind == NAME:
+                emit = statement[k + 2].value
+        (block.inputs if section == 'input' else block.outputs).append(
+            Declaration(qualifier=first.value, text=text, emit=emit)
+        )
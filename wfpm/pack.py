@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import os
+import json
+import zlib
+import tarfile
+import hashlib
+import tempfile
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+from wfpm import __version__ as wfpm_ver
+from .package import Package, TESTS_DIR
+from .cache import path_excluded
+from .testing import NF_RUN_ARTIFACTS, TEST_LOG_FILE
+from .trace import TRACE_FILE
+
+
+RELEASE_JSON = 'pkg-release.json'
+
+# entries left out of a release tarball, same as what the release CI job leaves out, at any level
+# except for those of Nextflow runs (see 'cache.path_excluded')
+PACK_EXCLUDE = ('wfpr_modules', '__pycache__', '*.pyc', '.DS_Store', TEST_LOG_FILE, TRACE_FILE) + NF_RUN_ARTIFACTS
+
+# uncompressed bytes per gzip member, members are compressed in parallel then concatenated
+GZIP_CHUNK_SIZE = 1024 * 1024
+GZIP_LEVEL = 6  # same as 'tar -z'
+
+READ_SIZE = 1024 * 1024
+
+
+def source_date_epoch() -> int:
+    """
+    Timestamp stamped into a release, 'SOURCE_DATE_EPOCH' when set to rebuild an earlier release
+    """
+    return int(os.environ.get('SOURCE_DATE_EPOCH', 0))
+
+
+def pkg_files(pkg_path, exclude=PACK_EXCLUDE) -> List[Tuple[str, str]]:
+    """
+    Relative path and path of all dirs and files under a package dir in sorted order, symlinks
+    are followed
+    """
+    entries = []
+    for root, dirs, files in os.walk(pkg_path, followlinks=True):
+        rel_root = os.path.relpath(root, pkg_path).replace(os.sep, '/')
+        rel_root = '' if rel_root == '.' else f"{rel_root}/"
+        dirs[:] = [d for d in dirs if not path_excluded(f"{rel_root}{d}", exclude)]
+        for name in dirs + [f for f in files if not path_excluded(f"{rel_root}{f}", exclude)]:
+            path = os.path.join(root, name)
+            if not os.path.exists(path):
+                raise Exception(f"Broken symlink in package: {path}")
+            entries.append((os.path.relpath(path, pkg_path), path))
+
+    return sorted(entries, key=lambda e: e[0].split(os.sep))
+
+
+class HashingReader(object):
+    """
+    File object wrapper updating a digest with all bytes read
+    """
+    def __init__(self, f, digest):
+        self.f = f
+        self.digest = digest
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.digest.update(data)
+        return data
+
+
+def write_tar(pkg_path, entries: List[Tuple[str, str]], fileobj, root_entry=True) -> List[dict]:
+    """
+    Write an uncompressed tarball of 'entries' of a package dir with normalized order, mtime, owner
+    and mode, so the same content always gives the same bytes. Return the manifest of files written.
+    Without 'root_entry' there is no '.' entry, so extracting it into an existing package dir leaves
+    the mode and mtime of that dir alone
+    """
+    mtime = source_date_epoch()
+    manifest = []
+    with tarfile.open(fileobj=fileobj, mode='w', format=tarfile.GNU_FORMAT) as tar:
+        for rel_path, path in ([('.', pkg_path)] if root_entry else []) + entries:
+            info = tarfile.TarInfo('./' + rel_path.replace(os.sep, '/') if rel_path != '.' else '.')
+            info.mtime = mtime
+            info.uid = info.gid = 0
+            info.uname = info.gname = ''
+
+            if os.path.isdir(path):
+                info.type, info.mode = tarfile.DIRTYPE, 0o755
+                tar.addfile(info)
+                continue
+
+            st = os.stat(path)
+            info.size = st.st_size
+            info.mode = 0o755 if st.st_mode & 0o111 else 0o644
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                tar.addfile(info, HashingReader(f, digest))
+            manifest.append({
+                'path': rel_path.replace(os.sep, '/'),
+                'size': st.st_size,
+                'checksum': digest.hexdigest()
+            })
+
+    return manifest
+
+
+def gzip_member(data: bytes, level=GZIP_LEVEL) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip header with mtime 0
+    member = bytearray(compressor.compress(data) + compressor.flush())
+    member[9] = 3  # OS field, set by zlib per platform
+    return bytes(member)
+
+
+def gzip_parallel(src, dst, jobs=1, level=GZIP_LEVEL) -> Tuple[str, int, str]:
+    """
+    Gzip 'src' into 'dst' as concatenated members compressed on 'jobs' threads, any gzip reader
+    decompresses it as a whole. Return sha256 and size of the output, and sha256 of the input
+    """
+    digest, content_digest, size = hashlib.sha256(), hashlib.sha256(), 0
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+
+        def write_next():
+            nonlocal size
+            member = pending.popleft().result()
+            dst.write(member)
+            digest.update(member)
+            size += len(member)
+
+        for chunk in iter(lambda: src.read(GZIP_CHUNK_SIZE), b''):
+            content_digest.update(chunk)
+            pending.append(executor.submit(gzip_member, chunk, level))
+            if len(pending) > jobs * 2:  # keep a bounded number of chunks in memory
+                write_next()
+
+        while pending:
+            write_next()
+
+    return digest.hexdigest(), size, content_digest.hexdigest()
+
+
+def write_tarball(pkg_path, entries: List[Tuple[str, str]], tarball, jobs=1, root_entry=True) -> dict:
+    """
+    Write a gzipped tarball of 'entries' of a package dir, return it as a release asset
+    """
+    with tempfile.TemporaryFile() as tar_file:
+        manifest = write_tar(pkg_path, entries, tar_file, root_entry=root_entry)
+        tar_file.seek(0)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(tarball), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                checksum, size, content_checksum = gzip_parallel(tar_file, f, jobs=jobs)
+            os.replace(tmp_path, tarball)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    return {
+        'filename': os.path.basename(tarball),
+        'checksum': checksum,
+        'checksum_type': 'sha256',
+        'size': size,
+        'content_checksum': content_checksum,
+        'files': manifest
+    }
+
+
+def pack(pkg: Package, output_dir, jobs=1, commit=None, split_tests=False) -> dict:
+    """
+    Build the release tarball of a local package and its 'pkg-release.json' under 'output_dir'.
+    Given the same package content the tarball is byte for byte the same, as long as the same zlib
+    is used, the 'content_checksum' of the uncompressed tarball is the same regardless.
+
+    With 'split_tests', the package is also packed as a 'core' tarball without the 'tests' dir plus
+    a 'tests' tarball of the 'tests' dir, so installations can skip tests data until tests are run
+    """
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    entries = pkg_files(pkg.pkg_path)
+    tarballs = [(None, f"{pkg.release_tag}.tar.gz", entries)]
+    core_entries = [e for e in entries if e[0].split(os.sep)[0] != TESTS_DIR]
+    if split_tests and len(core_entries) < len(entries):
+        tarballs += [
+            ('core', f"{pkg.release_tag}.core.tar.gz", core_entries),
+            ('tests', f"{pkg.release_tag}.tests.tar.gz", [e for e in entries if e[0].split(os.sep)[0] == TESTS_DIR])
+        ]
+
+    release_url = f"https://{pkg.project_fullname}/releases/download/{pkg.release_tag}"
+    assets = []
+    for content, filename, tarball_entries in tarballs:
+        # the tests tarball is extracted into the installed package dir, so it has no entry of its own for it
+        asset = write_tarball(pkg.pkg_path, tarball_entries, os.path.join(output_dir, filename), jobs=jobs,
+                              root_entry=content != 'tests')
+        asset['download_url'] = f"{release_url}/{filename}"
+        if content:
+            asset['content'] = content
+        assets.append(asset)
+
+    with open(os.path.join(pkg.pkg_path, 'pkg.json'), 'r') as f:
+        release = json.load(f)
+
+    created = datetime.utcfromtimestamp(source_date_epoch()) if 'SOURCE_DATE_EPOCH' in os.environ \
+        else datetime.utcnow()
+    release['_release'] = {
+        'created': created.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'hash': {
+            'checksum_type': 'sha1',
+            'checksum': commit
+        },
+        'tag': pkg.release_tag,
+        'assets': assets + [
+            {
+                '_NOTE_': 'this file',
+                'filename': RELEASE_JSON,
+                'download_url': f"{release_url}/{RELEASE_JSON}",
+                'checksum': None,
+                'checksum_type': None,
+                'size': None
+            }
+        ]
+    }
+    release['_wfpm_ver'] = wfpm_ver
+
+    with open(os.path.join(output_dir, RELEASE_JSON), 'w') as f:
+        f.write(json.dumps(release, indent=4, sort_keys=True))
+
+    return release
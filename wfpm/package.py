@@ -21,17 +21,60 @@
 
 import os
 import json
+import uuid
+import shutil
+import hashlib
 import requests
 import tempfile
-from typing import Set
+from fnmatch import fnmatch
+from typing import List, Set
+from .cache import cache_dir, hash_file
 from .utils import run_cmd, pkg_uri_parser, pkg_asset_download_urls, extract_version_str
 
 
+# seconds allowed to unpack a downloaded package
+TAR_TIMEOUT = 600
+
+TESTS_DIR = 'tests'
+
+# content of pkg-release.json kept in the dir of an installed package
+INSTALLED_RELEASE_JSON = '.pkg-release.json'
+
+
+def replace_dir(path, dest) -> None:
+    """
+    Put dir 'path' in place of 'dest' by renames on the same file system, an existing 'dest' is
+    moved aside first and only removed once 'path' is in place, it is put back if that fails
+    """
+    old_path = None
+    if os.path.lexists(dest):
+        old_path = os.path.join(os.path.dirname(dest), f".old-{uuid.uuid4().hex}")
+        try:
+            os.rename(dest, old_path)
+        except OSError as ex:
+            raise Exception(f"Unable to replace previously installed package: {ex}")
+
+    try:
+        os.rename(path, dest)
+    except OSError as ex:
+        if old_path:
+            os.rename(old_path, dest)
+        raise Exception(f"Unable to install package: {ex}")
+
+    if old_path:
+        if os.path.isdir(old_path) and not os.path.islink(old_path):
+            shutil.rmtree(old_path, ignore_errors=True)
+        else:
+            os.remove(old_path)
+
+
 class Package(object):
     name: str = None
     version: str = None
     main: str = None
     pkg_path: str = None  # optional, available when a Package is initiated via local pkg.json file
+    tarball_sha256: str = None  # available after the package is downloaded and installed
+    release: dict = None  # content of pkg-release.json, available for released or installed packages
 
     repo_type: str = 'git'  # hardcode for now
     repo_server: str = None
@@ -79,6 +122,7 @@ class Package(object):
                             f"not been released: {self.pkg_uri}.")
 
         self._init_by_json(pkg_json_str=pkg_json_str)
+        self.release = json.loads(pkg_json_str)
 
     def _init_by_json(self, pkg_json=None, pkg_json_str=None):
         if pkg_json:
@@ -86,6 +130,11 @@ class Package(object):
                 pkg_dict = json.load(f)
             self.pkg_path = os.path.dirname(os.path.realpath(pkg_json))
 
+            release_json = os.path.join(self.pkg_path, INSTALLED_RELEASE_JSON)
+            if os.path.isfile(release_json):
+                with open(release_json, 'r') as f:
+                    self.release = json.load(f)
+
         elif pkg_json_str:
             pkg_dict = json.loads(pkg_json_str)
         else:
@@ -131,6 +180,64 @@ class Package(object):
     def pkg_json_url(self):
         return f"https://{self.project_fullname}/releases/download/{self.release_tag}/pkg-release.json"
 
+    def release_asset(self, content) -> dict:
+        """
+        Release asset with the given 'content', 'core' or 'tests', None when not released separately
+        """
+        assets = (self.release or {}).get('_release', {}).get('assets', [])
+        return next((a for a in assets if a.get('content') == content), None)
+
+    @property
+    def tests_pending(self) -> bool:
+        """
+        Whether this is an installed package of which tests are in a tests asset not fetched yet
+        """
+        return bool(self.pkg_path and self.release_asset('tests') and
+                    not os.path.isdir(os.path.join(self.pkg_path, TESTS_DIR)))
+
+    def pending_test_job_files(self) -> List[str]:
+        """
+        Paths test job files will be at once tests of the package are fetched
+        """
+        files = self.release_asset('tests').get('files', []) if self.tests_pending else []
+        return sorted(
+            os.path.join(self.pkg_path, *f['path'].split('/')) for f in files
+            if os.path.dirname(f['path']) == TESTS_DIR and fnmatch(os.path.basename(f['path']), 'test-*.json')
+        )
+
+    def installation_issues(self) -> List[str]:
+        """
+        Check an installed package is complete and unchanged against the manifest of the release asset
+        it was installed from: each file is there with the same size, files outside of the tests dir
+        also with the same checksum. Return the issues found. A package is installed in full or not at
+        all, so one without '.pkg-release.json' was installed by an earlier wfpm and is taken as is
+        """
+        if not self.pkg_path:
+            return ["Package is not installed."]
+
+        if not self.release:  # installed before release manifests were kept, nothing to check against
+            return []
+
+        issues = []
+        if not os.path.isdir(os.path.join(self.pkg_path, 'wfpr_modules')):
+            issues.append("Symlink 'wfpr_modules' is missing or broken.")
+
+        assets = [self.release_asset('core') or next(
+            (a for a in self.release.get('_release', {}).get('assets', []) if a.get('files')), {}
+        )]
+        if self.release_asset('tests') and os.path.isdir(os.path.join(self.pkg_path, TESTS_DIR)):
+            assets.append(self.release_asset('tests'))
+
+        for entry in [f for a in assets for f in a.get('files', [])]:
+            path = os.path.join(self.pkg_path, *entry['path'].split('/'))
+            if not os.path.isfile(path):
+                issues.append(f"File missing: {entry['path']}")
+            elif os.path.getsize(path) != entry['size'] or \
+                    (entry['path'].split('/')[0] != TESTS_DIR and hash_file(path) != entry['checksum']):
+                issues.append(f"File changed: {entry['path']}")
+
+        return issues
+
     def install(self, target_project_root, force=False):
         target_path = os.path.join(
             target_project_root,
@@ -145,14 +252,10 @@ class Package(object):
             raise Exception(f"Package already installed: {target_path.replace(os.path.join(os.getcwd(), ''), '')}, "
                             "skip unless force option is specified.")
 
-        if force:
-            out, err, ret = run_cmd(f"rm -fr {target_path}")  # remove possible previous installation
-            if ret != 0:
-                raise Exception(f"Unable to remove previously installed package: {err}")
-
         return self._download_and_install(target_path)
 
-    def validate(self, repo_server=None, repo_account=None, repo_name=None, installed_pkgs=list()):
+    def validate(self, repo_server=None, repo_account=None, repo_name=None, installed_pkgs=list(),
+                 installed_pkg_uris: Set[str] = None):
         """
         Perform integrity validation on the package
 
@@ -160,37 +263,34 @@ class Package(object):
         - pkg_name, package name matches name of the containing folder
         - main, package main points to workflow script that exists
         - version, package version matches what's in the main and checker scripts
+
+        When validating many packages, pass 'installed_pkg_uris' computed once instead of 'installed_pkgs'
         """
         if not self.pkg_path:
             raise Exception(f"{self.name} is not a local package, can not run validate.")
 
-        pkg_json = os.path.join(self.pkg_path, 'pkg.json')
-        with open(pkg_json, 'r') as j:
-            pkg_dict = json.load(j)
-
         issues = []
         # for local package
-        if 'wfpr_modules' not in self.pkg_path and pkg_dict['name'] != os.path.basename(self.pkg_path):
+        if 'wfpr_modules' not in self.pkg_path and self.name != os.path.basename(self.pkg_path):
             issues.append(
-                f"The name '{pkg_dict['name']}' in pkg.json does not match the name of the package "
+                f"The name '{self.name}' in pkg.json does not match the name of the package "
                 f"containing folder '{os.path.basename(self.pkg_path)}'."
             )
 
         # for installed package
-        if 'wfpr_modules' in self.pkg_path and \
-                f"{pkg_dict['name']}@{pkg_dict['version']}" != os.path.basename(self.pkg_path):
+        if 'wfpr_modules' in self.pkg_path and self.fullname != os.path.basename(self.pkg_path):
             issues.append(
-                f"Combination of name '{pkg_dict['name']}' and version '{pkg_dict['version']}' in pkg.json does not match "
+                f"Combination of name '{self.name}' and version '{self.version}' in pkg.json does not match "
                 f"the package containing folder name '{os.path.basename(self.pkg_path)}'."
             )
 
-        main_script = os.path.join(self.pkg_path, pkg_dict['main'])
+        main_script = os.path.join(self.pkg_path, self.main)
         if not main_script.endswith('.nf'):
             main_script = f"{main_script}.nf"
 
         if not os.path.isfile(main_script):
             issues.append(
-                f"Main script '{pkg_dict['main']}' specified in the pkg.json does not exist."
+                f"Main script '{self.main}' specified in the pkg.json does not exist."
             )
         else:
             version_in_main = extract_version_str(main_script)
@@ -198,21 +298,23 @@ class Package(object):
                 issues.append(
                     f"Main script '{main_script}' misses required 'version' variable."
                 )
-            elif pkg_dict['version'] != version_in_main:
+            elif self.version != version_in_main:
                 issues.append(
-                    f"Main script version '{version_in_main}' does not match version in pkg.json '{pkg_dict['version']}'"
+                    f"Main script version '{version_in_main}' does not match version in pkg.json '{self.version}'"
                 )
 
-        checker_script = os.path.join(self.pkg_path, 'tests', 'checker.nf')
-        if not os.path.isfile(checker_script):
+        checker_script = os.path.join(self.pkg_path, TESTS_DIR, 'checker.nf')
+        if self.tests_pending:
+            pass  # checked once tests are fetched to run
+        elif not os.path.isfile(checker_script):
             issues.append(
                 "Missing required checker.nf script to run tests."
             )
         else:
             version_in_checker = extract_version_str(checker_script)
-            if version_in_checker and pkg_dict['version'] != version_in_checker:
+            if version_in_checker and self.version != version_in_checker:
                 issues.append(
-                    f"Checker script version '{version_in_checker}' does not match version in pkg.json '{pkg_dict['version']}'"
+                    f"Checker script version '{version_in_checker}' does not match version in pkg.json '{self.version}'"
                 )
 
         # repo_server, repo_account, repo_name
@@ -237,8 +339,10 @@ class Package(object):
                 f"Package path: {self.pkg_path}"
             )
 
-        uninstalled_deps = self.dependencies - set([str(p) for p in installed_pkgs])
-        if installed_pkgs and uninstalled_deps:
+        if installed_pkg_uris is None:
+            installed_pkg_uris = set([str(p) for p in installed_pkgs])
+        uninstalled_deps = self.dependencies - installed_pkg_uris
+        if installed_pkg_uris and uninstalled_deps:
             issues.append(
                 f"Dependencies declared in 'pkg.json', but not installed: '{', '.join(uninstalled_deps)}'. "
                 f"Please run 'wfpm install' command to install missing dependencies."
@@ -273,37 +377,110 @@ class Package(object):
         # TODO
         pass
 
-    def _download_and_install(self, target_path=None):
-        success = False
-        for download_url in pkg_asset_download_urls(self.pkg_tar_url):
+    def _download(self, url, local_path) -> str:
+        """
+        Download a release asset, return its sha256, None if not available
+        """
+        for download_url in pkg_asset_download_urls(url):
             response = requests.get(download_url, stream=True)
-            if response.status_code == 200:
-                success = True
-                break
+            if response.status_code != 200:
+                continue
 
-        if success:
-            with tempfile.TemporaryDirectory() as tmpdirname:
-                local_tar_path = os.path.join(tmpdirname, os.path.basename(self.pkg_tar_url))
+            digest = hashlib.sha256()
+            with open(local_path, 'wb') as f:
+                for chunk in response.raw.stream(1024, decode_content=False):
+                    if chunk:
+                        f.write(chunk)
+                        digest.update(chunk)
+            return digest.hexdigest()
 
-                with open(local_tar_path, 'wb') as f:
-                    for chunk in response.raw.stream(1024, decode_content=False):
-                        if chunk:
-                            f.write(chunk)
+    def _download_and_install(self, target_path=None):
+        core_asset = self.release_asset('core')  # tests are fetched when they are run
+        tar_url = core_asset['download_url'] if core_asset else self.pkg_tar_url
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            local_tar_path = os.path.join(tmpdirname, os.path.basename(tar_url))
+            self.tarball_sha256 = self._download(tar_url, local_tar_path)
+            if not self.tarball_sha256:
+                raise Exception(f"Looks like this package has not been released: {self.pkg_uri}")
+            if core_asset and core_asset.get('checksum') not in (None, self.tarball_sha256):
+                raise Exception(f"Checksum of downloaded package does not match its release: {tar_url}")
+
+            # unpacked next to the target then renamed into place, a previous installation is only
+            # removed once the new one is complete, and no partial installation is ever left at the target
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            staged_path = os.path.join(os.path.dirname(target_path), f".tmp-{uuid.uuid4().hex}")
+            os.mkdir(staged_path)  # not mkdtemp, permissions of the installed dir follow the umask
+            try:
+                self._unpack(local_tar_path, staged_path)
+                replace_dir(staged_path, target_path)
+            finally:
+                shutil.rmtree(staged_path, ignore_errors=True)
 
-                cmd = f"mkdir -p {target_path} && " \
-                      f"tar -xzf {local_tar_path} -C {target_path} && " \
-                      f"cd {target_path} && ln -s ../../../../../wfpr_modules . && " \
-                      "cd tests && ln -s ../wfpr_modules ."
+            return target_path  # return the path the package was installed
 
-                out, err, ret = run_cmd(cmd)
-                if ret != 0:
-                    run_cmd(f"rm -fr {target_path}")  # undo partial installation
-                    raise Exception(f"Package downloaded but installation failed: {err}")
+    def _unpack(self, tar_path, path) -> None:
+        out, err, ret = run_cmd(['tar', '-xzf', tar_path, '-C', path], timeout=TAR_TIMEOUT)
+        if ret == 0:
+            try:
+                # relative links, the staging dir is at the same depth as the target
+                os.symlink(os.path.join('..', '..', '..', '..', '..', 'wfpr_modules'), os.path.join(path, 'wfpr_modules'))
+                if os.path.isdir(os.path.join(path, TESTS_DIR)):
+                    os.symlink(os.path.join('..', 'wfpr_modules'), os.path.join(path, TESTS_DIR, 'wfpr_modules'))
+                if self.release:
+                    with open(os.path.join(path, INSTALLED_RELEASE_JSON), 'w') as f:
+                        f.write(json.dumps(self.release, indent=4, sort_keys=True))
+            except OSError as ex:
+                err, ret = str(ex), 1
+
+        if ret == 0:
+            try:
+                issues = Package(pkg_json=os.path.join(path, 'pkg.json')).installation_issues()
+            except Exception as ex:
+                issues = [f"{ex}"]
+            if issues:
+                err, ret = ' '.join(issues), 1
 
-                return target_path  # return the path the package was installed
+        if ret != 0:
+            raise Exception(f"Package downloaded but installation failed: {err}")
 
-        else:
-            raise Exception(f"Looks like this package has not been released: {self.pkg_uri}")
+    def install_tests(self) -> bool:
+        """
+        Fetch tests of an installed package released with a separate tests asset. The asset is
+        cached by its checksum, so it is downloaded once for all projects. Return whether tests
+        were fetched
+        """
+        if not self.tests_pending:
+            return False
+
+        asset = self.release_asset('tests')
+        cached_tar_path = os.path.join(cache_dir('release-assets'), f"{asset['checksum']}.tar.gz")
+        if not os.path.isfile(cached_tar_path):
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cached_tar_path), prefix='.tmp-')
+            os.close(fd)
+            try:
+                checksum = self._download(asset['download_url'], tmp_path)
+                if checksum != asset['checksum']:
+                    raise Exception(f"Failed to download tests of package: {self.pkg_uri}, "
+                                    f"{'checksum does not match its release' if checksum else 'not available'}.")
+                os.replace(tmp_path, cached_tar_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        tests_path = os.path.join(self.pkg_path, TESTS_DIR)
+        out, err, ret = run_cmd(['tar', '-xzf', cached_tar_path, '-C', self.pkg_path], timeout=TAR_TIMEOUT)
+        if ret == 0:
+            try:
+                os.symlink(os.path.join('..', 'wfpr_modules'), os.path.join(tests_path, 'wfpr_modules'))
+            except OSError as ex:
+                err, ret = str(ex), 1
+
+        if ret != 0:
+            shutil.rmtree(tests_path, ignore_errors=True)
+            raise Exception(f"Tests of package downloaded but installation failed: {err}")
+
+        return True
 
     def __repr__(self):
         return self.pkg_uri
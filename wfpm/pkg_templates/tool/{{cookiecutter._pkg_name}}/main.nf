@@ -58,6 +58,12 @@ process {{ cookiecutter._name }} {
       -o output_dir
 
     """
+
+  stub:  // used by 'wfpm test --stub' for a quick wiring check, create placeholders of the outputs
+    """
+    mkdir -p output_dir
+    touch output_dir/${input_file.name}.stub
+    """
 }
 
 
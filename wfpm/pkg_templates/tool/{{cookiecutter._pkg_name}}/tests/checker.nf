@@ -51,14 +51,34 @@ process file_smart_diff {
     # in this example, we need to remove date field before comparison eg, <div id="header_filename">Tue 19 Jan 2021<br/>test_rg_3.bam</div>
     # sed -e 's#"header_filename">.*<br/>test_rg_3.bam#"header_filename"><br/>test_rg_3.bam</div>#'
 
-    cat ${output_file[0]} \
-      | sed -e 's#"header_filename">.*<br/>#"header_filename"><br/>#' > normalized_output
-
-    ([[ '${expected_file}' == *.gz ]] && gunzip -c ${expected_file} || cat ${expected_file}) \
-      | sed -e 's#"header_filename">.*<br/>#"header_filename"><br/>#' > normalized_expected
+    # 'wfpm diff' streams both files, decompressing gzip on the fly, normalizes each line with the
+    # '-e' rules and stops at the first difference. Where wfpm is not available, eg, in a container,
+    # normalized copies of both files are compared with 'diff' instead
+    if command -v wfpm > /dev/null; then
+      wfpm diff -e 's#"header_filename">.*<br/>#"header_filename"><br/>#' ${output_file[0]} ${expected_file} \
+        && ret=0 || ret=\$?
+    else
+      (set -o pipefail
+        cat ${output_file[0]} \
+          | sed -e 's#"header_filename">.*<br/>#"header_filename"><br/>#' > normalized_output \
+        && ([[ '${expected_file}' == *.gz ]] && gunzip -c ${expected_file} || cat ${expected_file}) \
+          | sed -e 's#"header_filename">.*<br/>#"header_filename"><br/>#' > normalized_expected) \
+        && { diff normalized_output normalized_expected && ret=0 || ret=\$?; } || ret=2
+    fi
+
+    # exit code 1 means the files differ, others that they could not be compared
+    if [ \$ret -eq 0 ]; then
+      echo "Test PASSED"
+    elif [ \$ret -eq 1 ]; then
+      echo "Test FAILED, output file mismatch." && exit 1
+    else
+      echo "Test FAILED, unable to compare output with expected file, exit code: \$ret." >&2 && exit \$ret
+    fi
+    """
 
-    diff normalized_output normalized_expected \
-      && ( echo "Test PASSED" && exit 0 ) || ( echo "Test FAILED, output file mismatch." && exit 1 )
+  stub:  // with 'wfpm test --stub' outputs are placeholders, nothing to compare
+    """
+    echo "Test PASSED (stub run, output not compared)"
     """
 }
 
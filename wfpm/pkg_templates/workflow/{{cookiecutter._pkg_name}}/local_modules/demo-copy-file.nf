@@ -26,4 +26,10 @@ process demoCopyFile {
     mkdir output_dir
     cp ${input_file} output_dir/
     """
+
+  stub:
+    """
+    mkdir output_dir
+    touch output_dir/${input_file.name}
+    """
 }
@@ -30,6 +30,7 @@ from click import echo
 from functools import lru_cache
 from .git import Git
 from .package import Package
+from .dependency import DependentsIndex
 from .utils import locate_nearest_parent_dir_with_file
 
 
@@ -148,6 +149,49 @@ class Project(object):
 
         return installed_pkgs
 
+    def local_dependents(self, pkg_names) -> List[str]:
+        """
+        Names of local packages that depend, directly or transitively, on any of the given local
+        packages. Only dependencies pointing to packages in this project are followed
+        """
+        index = self.dependents_index
+        project_prefix = f"{self.fullname.lower()}/"
+        local_names = {
+            e['pkg_uri']: e['pkg_uri'][len(project_prefix):].split('@')[0]
+            for e in index.pkgs.values() if e['local'] and e['pkg_uri'].startswith(project_prefix)
+        }
+
+        found = set()
+        to_visit = list(pkg_names)
+        while to_visit:
+            dependents = index.direct_dependents(f"{project_prefix}{to_visit.pop()}", any_version=True)
+            for dependent in [local_names[d] for d in dependents if d in local_names]:
+                if dependent not in found:
+                    found.add(dependent)
+                    to_visit.append(dependent)
+
+        return sorted(found - set(pkg_names))
+
+    @property
+    @lru_cache()
+    def dependents_index(self):
+        index = DependentsIndex(self.root)
+        index.refresh()
+        return index
+
+    def changed_pkgs(self, since=None) -> List[str]:
+        """
+        Names of local packages with files changed since the given git ref
+        """
+        pkg_dirs = {os.path.join(pkg.pkg_path, ''): pkg.name for pkg in self.pkgs}
+        changed = set()
+        for f in self.git.changed_files(since):
+            for pkg_dir in pkg_dirs:
+                if f.startswith(pkg_dir):
+                    changed.add(pkg_dirs[pkg_dir])
+
+        return sorted(changed)
+
     def _populate_pkg_status(self):
         rel_cans = self.git.rel_candidates
         pkgs_in_dev = OrderedDict()
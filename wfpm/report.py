@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import json
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from itertools import groupby
+
+
+def write_report(results, report_file) -> None:
+    if report_file.endswith('.xml'):
+        write_junit_xml(results, report_file)
+    elif report_file.endswith('.json'):
+        write_json_report(results, report_file)
+    else:
+        raise Exception(f"Unknown report format: {report_file}, expected file name ending with '.xml' or '.json'")
+
+
+def result_to_dict(result) -> dict:
+    return {
+        'id': result.job.id,
+        'package': result.job.pkg_name,
+        'pkg_path': result.job.pkg_path,
+        'job': result.job.name,
+        'job_file': result.job.job_file,
+        'passed': result.passed,
+        'cached': result.cached,
+        'skipped': result.skipped,
+        'exit_code': result.returncode,
+        'duration': round(result.duration, 3),
+        'run_name': result.run_name,
+        'max_rss': result.max_rss,
+        'timed_out': result.timed_out,
+        'stdout': result.stdout,
+        'stderr': result.stderr
+    }
+
+
+def write_json_report(results, report_file) -> None:
+    failed_count = len([r for r in results if r.failed])
+    skipped_count = len([r for r in results if r.skipped])
+    report = {
+        'created': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'summary': {
+            'tests': len(results),
+            'passed': len(results) - failed_count - skipped_count,
+            'failed': failed_count,
+            'skipped': skipped_count,
+            'cached': len([r for r in results if r.cached]),
+            'duration': round(sum(r.duration for r in results), 3)
+        },
+        'tests': [result_to_dict(r) for r in results]
+    }
+
+    with open(report_file, 'w') as f:
+        f.write(json.dumps(report, indent=4))
+
+
+def write_junit_xml(results, report_file) -> None:
+    testsuites = ET.Element('testsuites', {
+        'tests': str(len(results)),
+        'failures': str(len([r for r in results if r.failed])),
+        'skipped': str(len([r for r in results if r.skipped])),
+        'time': f"{sum(r.duration for r in results):.3f}"
+    })
+
+    for pkg_name, pkg_results in groupby(results, key=lambda r: r.job.pkg_name):
+        pkg_results = list(pkg_results)
+        testsuite = ET.SubElement(testsuites, 'testsuite', {
+            'name': pkg_name,
+            'tests': str(len(pkg_results)),
+            'failures': str(len([r for r in pkg_results if r.failed])),
+            'skipped': str(len([r for r in pkg_results if r.skipped])),
+            'time': f"{sum(r.duration for r in pkg_results):.3f}"
+        })
+
+        for result in pkg_results:
+            testcase = ET.SubElement(testsuite, 'testcase', {
+                'classname': pkg_name,
+                'name': result.job.name,
+                'file': result.job.job_file,
+                'time': f"{result.duration:.3f}"
+            })
+
+            if result.run_name:
+                properties = ET.SubElement(testcase, 'properties')
+                ET.SubElement(properties, 'property', {'name': 'run_name', 'value': result.run_name})
+
+            if result.cached:
+                ET.SubElement(testcase, 'system-out').text = 'Passed in a previous run with identical inputs (cached).'
+                continue
+
+            if result.skipped:
+                ET.SubElement(testcase, 'skipped', {'message': 'Not run after an earlier failure (fail fast).'})
+                continue
+
+            if not result.passed:
+                ET.SubElement(testcase, 'failure', {
+                    'message': f"Checker exited with code {result.returncode}"
+                })
+
+            ET.SubElement(testcase, 'system-out').text = result.stdout
+            ET.SubElement(testcase, 'system-err').text = result.stderr
+
+    ET.ElementTree(testsuites).write(report_file, encoding='utf-8', xml_declaration=True)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import os
+from collections import OrderedDict
+from cookiecutter.generate import generate_files
+from cookiecutter.prompt import prompt_for_config
+
+
+def render_template(template, context: dict, output_dir, extra_context: dict = None) -> str:
+    """
+    Render a cookiecutter template under 'output_dir' with 'context' used in place of the template's
+    cookiecutter.json, returns path of the rendered dir. The template is read where it is, files
+    are written once to the output
+    """
+    cookiecutter_context = {'cookiecutter': OrderedDict({**context, **(extra_context or {})})}
+    cookiecutter_context['cookiecutter'] = prompt_for_config(cookiecutter_context, no_input=True)
+    cookiecutter_context['cookiecutter']['_template'] = template
+    cookiecutter_context['cookiecutter']['_output_dir'] = os.path.abspath(output_dir)
+
+    return generate_files(repo_dir=template, context=cookiecutter_context, output_dir=output_dir)
+
+
+def move_into_place(path, dest) -> None:
+    """
+    Move a dir rendered in a staging dir on the same file system to its destination in a single
+    rename, so the destination either does not exist or is complete
+    """
+    if os.path.lexists(dest):
+        raise Exception(f"Destination already exists: {dest}")
+
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.rename(path, dest)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import re
+import posixpath
+from typing import List, Tuple
+from .nf_script import NAME, STRING, Declaration, parse, string_value, tokenize
+
+
+def line_indent(script_str: str, offset: int) -> str:
+    """
+    White space from the start of the line to 'offset', None if there is anything else before it
+    """
+    line_start = script_str.rfind('\n', 0, offset) + 1
+    indent = script_str[line_start:offset]
+    return indent if not indent.strip() else None
+
+
+def output_paths(outputs: List[Declaration]) -> List[str]:
+    """
+    Paths of outputs declared with a string literal, eg, 'path "out/*.bam"' or 'tuple val(id), path("x.txt")'
+    """
+    paths = []
+    for declaration in outputs:
+        tokens = tokenize(declaration.text)
+        for i, t in enumerate(tokens):
+            if t.kind != NAME or t.value not in ('path', 'file'):
+                continue
+            j = i + 2 if i + 1 < len(tokens) and tokens[i + 1].value == '(' else i + 1
+            if j < len(tokens) and tokens[j].kind == STRING and tokens[j].value[:1] in '\'"':
+                paths.append(string_value(tokens[j]))
+
+    return paths
+
+
+def stub_commands(paths: List[str]) -> List[str]:
+    """
+    Shell commands creating placeholders for output paths, wildcards are replaced by 'stub'
+    """
+    commands = []
+    for path in paths:
+        # wildcards in the path, not those in a '${...}' expression
+        path = re.sub(r'\*(?![^{]*\})', 'stub', path)
+        if path.endswith('/'):
+            commands.append(f'mkdir -p "{path}"')
+            continue
+
+        if posixpath.dirname(path):
+            commands.append(f'mkdir -p "{posixpath.dirname(path)}"')
+        commands.append(f'touch "{path}"')
+
+    return commands
+
+
+def add_stub_blocks(script_str: str) -> Tuple[str, List[str]]:
+    """
+    Add a 'stub' block to each process without one, the stub creates empty placeholders of the
+    declared outputs. Returns the updated script and names of the processes updated
+    """
+    updated = []
+    # from the last process to the first so that offsets of the ones before stay valid
+    for process in reversed(parse(script_str).processes):
+        if 'stub' in process.sections or process.end is None:
+            continue
+
+        indent = None
+        for label in ('script', 'shell', 'exec', 'output'):
+            if label in process.sections:
+                indent = line_indent(script_str, process.sections[label])
+                break
+        indent = indent or '  '
+        commands = stub_commands(output_paths(process.outputs))
+
+        stub_lines = ['', f"{indent}stub:", f'{indent}  """'] + \
+            [f"{indent}  {c}" for c in commands or [': # no output file to create']] + \
+            [f'{indent}  """', '']
+
+        body = script_str[:process.end].rstrip()
+        script_str = body + '\n' + '\n'.join(stub_lines) + script_str[process.end:]
+        updated.insert(0, process.name)
+
+    return script_str, updated
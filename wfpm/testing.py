@@ -0,0 +1,876 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import tempfile
+from datetime import datetime
+from glob import glob
+from itertools import groupby
+from functools import lru_cache
+from typing import Dict, List, Tuple, Callable
+from concurrent.futures import ThreadPoolExecutor, Future
+from click import echo
+from wfpm import __version__ as ver
+from .utils import run_cmd
+from .execution import run_process, ResourceScheduler
+from .package import Package
+from .cache import TestCache, cache_dir, hash_dir, hash_file, hash_str
+from .history import TestHistory, TestStatus
+from .nf_script import parse, literal_value
+from .trace import TRACE_FILE, PerfStore, read_trace, task_alias, tasks_span, resource_usage, process_metrics, \
+    merge_metrics, compare_metrics
+
+
+# files and dirs under 'tests' that are created by Nextflow runs, never to be linked into a launch dir
+NF_RUN_ARTIFACT_NAMES = ('work', 'outdir', '.nextflow', '.nextflow.log*')
+
+# the same, where Nextflow writes them when run from the package dir or its 'tests' dir, anchored
+# there so that package content of the same name deeper down is kept (see 'cache.path_excluded')
+NF_RUN_ARTIFACTS = tuple(f"{d}/{n}" for d in ('', 'tests') for n in NF_RUN_ARTIFACT_NAMES)
+
+# lines of Nextflow output kept in memory per test run, the full output is in the run's log file
+OUTPUT_TAIL_LINES = 200
+TEST_LOG_FILE = 'wfpm-test.log'
+
+# limits of the launch dirs kept for '--resume', beyond these the least recently used ones are removed
+RESUME_MAX_AGE_DAYS = float(os.environ.get('WFPM_RESUME_MAX_AGE_DAYS', 14))
+RESUME_MAX_SIZE_GB = float(os.environ.get('WFPM_RESUME_MAX_SIZE_GB', 20))
+
+# resources declared per test job file name, in the package's 'tests' dir
+RESOURCES_FILE = 'resources.json'
+# resources assumed for a test job with neither declared nor recorded usage
+DEFAULT_JOB_CPUS = 1
+DEFAULT_JOB_MEMORY_GB = 1.0
+
+
+class TestJob(object):
+    """
+    TestJob is one run of a package's 'tests/checker.nf' with one 'tests/test-*.json' params file
+    """
+    pkg_path: str = None
+    pkg_id: str = None  # <repo_server>/<repo_account>/<repo_name>/<pkg_name>, same across versions
+    pkg_version: str = None
+    job_file: str = None
+
+    def __init__(self, pkg_path=None, job_file=None, pkg_id=None, pkg_version=None):
+        self.pkg_path = pkg_path
+        self.job_file = os.path.abspath(job_file)
+        self.pkg_id = pkg_id or self.pkg_name
+        self.pkg_version = pkg_version
+
+    @property
+    def id(self):
+        return f"{self.pkg_id}/{self.name}"
+
+    @property
+    def pkg_name(self):
+        return os.path.basename(self.pkg_path)
+
+    @property
+    def name(self):
+        return os.path.basename(self.job_file)
+
+    @property
+    def test_path(self):
+        return os.path.join(self.pkg_path, 'tests')
+
+    @property
+    def checker(self):
+        return os.path.join(self.test_path, 'checker.nf')
+
+    def __repr__(self):
+        return f"{self.pkg_name}/{self.name}"
+
+
+class RunOptions(object):
+    """
+    How Nextflow is run for test jobs
+    """
+    timeout: int = None  # seconds per test job
+    stream: bool = False  # show Nextflow output as it comes
+    resume: bool = False  # keep launch dirs across runs and resume Nextflow sessions
+    stub: bool = False  # run process stubs instead of the real scripts
+
+    def __init__(self, timeout=None, stream=False, resume=False, stub=False):
+        self.timeout = timeout
+        self.stream = stream
+        self.resume = resume
+        self.stub = stub
+
+    @property
+    def nextflow_args(self) -> List[str]:
+        return (['-resume'] if self.resume else []) + (['-stub-run'] if self.stub else [])
+
+
+class TestResult(object):
+    job: TestJob = None
+    returncode: int = None
+    stdout: str = ''
+    stderr: str = ''
+    launch_dir: str = None
+    cached: bool = False
+    duration: float = 0.0  # wall time in seconds
+    run_name: str = None  # Nextflow run name
+    max_rss: int = None  # peak RSS in KB of the Nextflow run
+    timed_out: bool = False
+    skipped: bool = False  # not run because of an earlier failure with 'fail_fast'
+    cpus: int = None  # CPUs used by the most demanding task, from the Nextflow trace
+    memory: float = None  # peak RSS in GB of the most demanding task, from the Nextflow trace
+    processes: dict = None  # peak metrics of each process, from the Nextflow trace
+    duration_measured: bool = True  # False when a batched job's own duration is not known
+
+    def __init__(self, job=None, returncode=None, stdout='', stderr='', launch_dir=None, cached=False,
+                 duration=0.0, max_rss=None, timed_out=False, skipped=False, cpus=None, memory=None,
+                 processes=None, duration_measured=True):
+        self.job = job
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.launch_dir = launch_dir
+        self.cached = cached
+        self.duration = duration
+        self.max_rss = max_rss
+        self.timed_out = timed_out
+        self.skipped = skipped
+        self.cpus = cpus
+        self.memory = memory
+        self.processes = processes
+        self.duration_measured = duration_measured
+
+        m = re.search(r'Launching `[^`]+` \[([^\]]+)\]', stdout)
+        self.run_name = m.group(1) if m else None
+
+    @property
+    def passed(self):
+        return self.returncode == 0
+
+    @property
+    def failed(self):
+        return not self.passed and not self.skipped
+
+
+def collect_test_jobs(pkg_path) -> List[TestJob]:
+    """
+    Test jobs of a package, for an installed package of which tests are not fetched yet, the jobs
+    listed in its tests asset
+    """
+    pkg, pkg_id, pkg_version = None, None, None
+    try:
+        pkg = Package(pkg_json=os.path.join(pkg_path, 'pkg.json'))
+        pkg_id, pkg_version = f"{pkg.project_fullname}/{pkg.name}", pkg.version
+    except Exception:
+        pass  # the id then falls back to the package dir name
+
+    if pkg and pkg.tests_pending:
+        job_files = pkg.pending_test_job_files()
+    else:
+        job_files = sorted(glob(os.path.join(pkg_path, 'tests', 'test-*.json')))
+
+    return [
+        TestJob(pkg_path=pkg_path, job_file=job_file, pkg_id=pkg_id, pkg_version=pkg_version)
+        for job_file in job_files
+    ]
+
+
+def load_durations(path) -> Dict[str, float]:
+    """
+    Durations in seconds of test jobs by job id, from a JSON file as written by 'wfpm test --list --json'
+    (or a plain mapping of job id to seconds). Jobs without a duration are left out
+    """
+    with open(path, 'r') as f:
+        content = json.load(f)
+
+    if isinstance(content, dict) and isinstance(content.get('tests'), list):
+        content = {t.get('id'): t.get('duration') for t in content['tests'] if isinstance(t, dict)}
+    if not isinstance(content, dict):
+        raise Exception(f"Invalid durations file: {path}, expected the output of 'wfpm test --list --json'.")
+
+    return {k: float(v) for k, v in content.items() if isinstance(k, str) and isinstance(v, (int, float))}
+
+
+def shard_test_jobs(jobs: List[TestJob], index: int, count: int, durations: Dict[str, float] = None) -> List[TestJob]:
+    """
+    Test jobs of shard 'index' (1-based) out of 'count' shards. Shards are computed from what all shards
+    share, never from the local test history which differs from one runner to another. With 'durations'
+    (by job id, see 'load_durations'), jobs are packed longest first onto the shard with the least total
+    duration so far, jobs not in it are estimated with the average duration of the others. Otherwise
+    jobs are assigned by a hash of their ids
+    """
+    durations = {job.id: durations[job.id] for job in jobs if job.id in (durations or {})}
+    if not durations:
+        return [job for job in jobs if int(hash_str(job.id), 16) % count == index - 1]
+
+    default_duration = sum(durations.values()) / len(durations)
+    loads = [0.0] * count
+    selected = set()
+    for job in sorted(jobs, key=lambda j: (-durations.get(j.id, default_duration), j.id)):
+        shard = loads.index(min(loads))
+        loads[shard] += durations.get(job.id, default_duration)
+        if shard == index - 1:
+            selected.add(job.id)
+
+    return [job for job in jobs if job.id in selected]
+
+
+@lru_cache()
+def nextflow_version():
+    out, err, ret = run_cmd(['nextflow', '-version'], timeout=120)
+    m = re.search(r'version\s+([0-9][^\s]*)', out)
+    if ret == 0 and m:
+        return m.group(1)
+
+
+def job_resources(job: TestJob, history: TestHistory = None) -> Tuple[int, float]:
+    """
+    CPUs and memory (GB) a test job is expected to take. Declared in 'tests/resources.json' keyed by
+    job file name, or as 'cpus' and 'mem' params in the job file. Otherwise the peak usage recorded
+    in recent runs of the job, or the defaults when the job has never run
+    """
+    declared = {}
+    for source in (job.job_file, os.path.join(job.test_path, RESOURCES_FILE)):
+        try:
+            with open(source, 'r') as f:
+                values = json.load(f)
+            values = values.get(job.name, {}) if source != job.job_file else values
+            declared.update({k: values[k] for k in ('cpus', 'mem') if isinstance(values.get(k), (int, float))})
+        except (OSError, ValueError, AttributeError):
+            pass  # nothing declared there
+
+    recorded_cpus, recorded_memory = (history or TestHistory()).resource_usage(job.id)
+    cpus = declared.get('cpus') or recorded_cpus or DEFAULT_JOB_CPUS
+    memory = declared.get('mem') or recorded_memory or DEFAULT_JOB_MEMORY_GB
+
+    return max(1, int(cpus)), float(memory)
+
+
+def installed_deps(pkg_path) -> List[str]:
+    """
+    pkg_uris of all dependencies (including transitive ones) installed for a package, as seen
+    through the package's 'wfpr_modules'
+    """
+    resolved = set()
+    to_resolve = [pkg_path]
+    while to_resolve:
+        pkg_json = os.path.join(to_resolve.pop(), 'pkg.json')
+        if not os.path.isfile(pkg_json):
+            continue
+
+        with open(pkg_json, 'r') as f:
+            pkg_dict = json.load(f)
+
+        for dep in pkg_dict.get('dependencies', []) + pkg_dict.get('devDependencies', []):
+            if dep in resolved:
+                continue
+
+            dep_path = os.path.join(pkg_path, 'wfpr_modules', *dep.split('/'))
+            resolved.add(dep if os.path.isdir(dep_path) else f"{dep} (not installed)")
+            to_resolve.append(dep_path)
+
+    return sorted(resolved)
+
+
+def test_job_cache_keys(jobs: List[TestJob], stub=False) -> List[str]:
+    """
+    Cache key of a test job covers the package content, installed dependencies, params file,
+    and Nextflow and wfpm versions. Stub runs have keys of their own
+    """
+    pkg_hashes = {}
+    keys = []
+    for job in jobs:
+        if job.pkg_path not in pkg_hashes:
+            pkg_hashes[job.pkg_path] = hash_str(
+                hash_dir(job.pkg_path, exclude=NF_RUN_ARTIFACTS + ('wfpr_modules',)),
+                *installed_deps(job.pkg_path)
+            )
+
+        key_parts = [pkg_hashes[job.pkg_path], job.name, hash_file(job.job_file), nextflow_version(), ver]
+        if stub:
+            key_parts.append('stub')
+        keys.append(hash_str(*key_parts))
+
+    return keys
+
+
+def launch_dir_of(launch_root: str, pkg_path: str, name: str, opts: RunOptions = None) -> str:
+    if opts and opts.stub:
+        name = f"{name}.stub"
+
+    if opts and opts.resume:  # the same dir for every run of the job in this package checkout
+        return os.path.join(launch_root, f"{os.path.basename(pkg_path)}.{name}.{hash_str(pkg_path, name)[:12]}")
+
+    return os.path.join(launch_root, os.path.basename(pkg_path), name)
+
+
+def prepare_launch_dir(test_path: str, launch_dir: str, reuse=False) -> str:
+    """
+    Each job gets its own launch dir so that concurrent Nextflow runs do not share '.nextflow'
+    session state, work dir or published outputs. Entries of the 'tests' dir are symlinked into
+    the launch dir, this way relative paths used in the params file still resolve as before.
+    A reused launch dir keeps its Nextflow session and work dir, only the symlinks are renewed
+    """
+    if reuse and os.path.isdir(launch_dir):
+        for entry in os.listdir(launch_dir):
+            if os.path.islink(os.path.join(launch_dir, entry)):
+                os.remove(os.path.join(launch_dir, entry))
+        os.utime(launch_dir)  # last used time, see 'gc_resume_dirs'
+    else:
+        os.makedirs(launch_dir)
+
+    artifacts = set()
+    for pattern in NF_RUN_ARTIFACT_NAMES:
+        artifacts.update(os.path.basename(p) for p in glob(os.path.join(test_path, pattern)))
+
+    for entry in os.listdir(test_path):
+        # nextflow.config is picked up from the checker's own dir, it must not be linked as the
+        # relative 'includeConfig' in it would then resolve from the launch dir
+        if entry in artifacts or entry == 'nextflow.config':
+            continue
+        os.symlink(os.path.join(test_path, entry), os.path.join(launch_dir, entry))
+
+    return launch_dir
+
+
+BATCH_SCRIPT = 'wfpm-batch.nf'
+BATCH_CONFIG = 'wfpm-batch.config'
+BATCH_TRACE_FILE = 'wfpm-batch.trace.txt'
+BATCH_PARAMS_FILE = 'wfpm-batch.params.json'
+
+
+def checker_entry_workflow(checker) -> Tuple[List[str], str]:
+    """
+    Names of processes, workflows and functions defined in a checker script, and the body of its
+    entry (unnamed) workflow. The body is None when there is no entry workflow
+    """
+    with open(checker, 'r') as f:
+        script_str = f.read()
+
+    symbols = parse(script_str)
+    entry = symbols.entry_workflow
+    if not entry or entry.end is None:
+        return symbols.defined_names, None
+
+    return symbols.defined_names, script_str[entry.body_start:entry.end]
+
+
+def checker_defaults(checker) -> Tuple[dict, List[str]]:
+    """
+    Top level params defaults of a checker script. Those with a literal value as a dict, the
+    statements of the others (eg, '"${params.dir}/out"') as they are in the script
+    """
+    with open(checker, 'r') as f:
+        script_str = f.read()
+
+    literals, statements = {}, []
+    for param in parse(script_str).params:
+        is_literal, value = literal_value(param.tokens)
+        if is_literal:
+            literals[param.name] = value
+        else:
+            statements.append(script_str[param.start:param.end])
+
+    return literals, statements
+
+
+def job_params(jobs: List[TestJob]) -> List[dict]:
+    """
+    Params of each test job, the job's params file over the literal defaults of its checker
+    """
+    defaults, _ = checker_defaults(jobs[0].checker)
+    params = []
+    for job in jobs:
+        with open(job.job_file, 'r') as f:
+            params.append({**defaults, **json.load(f)})
+
+    return params
+
+
+def config_param_names(config_file, seen=None) -> set:
+    """
+    Names of params referred to in a Nextflow config file and the config files it includes
+    """
+    seen = seen if seen is not None else set()
+    config_file = os.path.realpath(config_file)
+    if config_file in seen or not os.path.isfile(config_file):
+        return set()
+    seen.add(config_file)
+
+    with open(config_file, 'r') as f:
+        config_str = f.read()
+
+    names = set(re.findall(r'\bparams\.([A-Za-z_][0-9A-Za-z_]*)', config_str))
+    for included in re.findall(r'\bincludeConfig\s+[\'"]([^\'"$]+)[\'"]', config_str):
+        names |= config_param_names(os.path.join(os.path.dirname(config_file), included), seen)
+
+    return names
+
+
+def groovy_str(value: str) -> str:
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def gen_batch_wrapper(jobs: List[TestJob], launch_dir: str) -> List[str]:
+    """
+    Generate in the launch dir a wrapper script that runs the checker once per test job in a
+    single Nextflow session. Each job gets a module with a workflow of its own, made of the
+    checker's entry workflow as it is, and included with the job's params (over the checker's
+    defaults) via 'addParams'. Params the jobs have in common are also in the session's params
+    file, so that config files see them. Returns names of the workflows of the jobs, needed to
+    map tasks in the trace back to jobs
+    """
+    names, entry_body = checker_entry_workflow(jobs[0].checker)
+    if entry_body is None:
+        raise Exception(f"No entry workflow found in: {jobs[0].checker}")
+
+    called_names = [n for n in names if re.search(r'\b%s\s*\(' % n, entry_body)]
+    _, default_statements = checker_defaults(jobs[0].checker)
+    all_params = job_params(jobs)
+
+    include_lines = []
+    entry_lines = []
+    workflow_names = []
+    for i, (job, params) in enumerate(zip(jobs, all_params), start=1):
+        workflow_name = f"job_{i}"
+        workflow_names.append(workflow_name)
+
+        with open(os.path.join(launch_dir, f"wfpm-batch-{i}.params.json"), 'w') as f:
+            json.dump(params, f, indent=2)
+
+        with open(os.path.join(launch_dir, f"wfpm-batch-{i}.nf"), 'w') as f:
+            f.write(f"// auto-generated by wfpm for {job.name}, do NOT modify\n\n")
+            f.write("nextflow.enable.dsl = 2\n\n")
+            if default_statements:  # params the job sets take precedence over these
+                f.write('\n'.join(default_statements) + "\n\n")
+            if called_names:
+                f.write("include { " + '; '.join(called_names) + " } from " +
+                        groovy_str(os.path.splitext(job.checker)[0]) + "\n\n")
+            f.write(f"workflow {workflow_name} {{{entry_body.rstrip()}\n}}\n")
+
+        params_file = os.path.join(launch_dir, f"wfpm-batch-{i}.params.json")
+        include_lines.append(f"p_{i} = new groovy.json.JsonSlurper().parse(new File({groovy_str(params_file)}))")
+        include_lines.append(f"include {{ {workflow_name} }} from './wfpm-batch-{i}' addParams(p_{i})")
+        entry_lines.append(f"  {workflow_name}()  // {job.name}")
+
+    common = {k: v for k, v in all_params[0].items() if all(k in p and p[k] == v for p in all_params[1:])}
+    with open(os.path.join(launch_dir, BATCH_PARAMS_FILE), 'w') as f:
+        json.dump(common, f, indent=2)
+
+    with open(os.path.join(launch_dir, BATCH_SCRIPT), 'w') as f:
+        f.write("#!/usr/bin/env nextflow\n\n// auto-generated by wfpm, do NOT modify\n\n")
+        f.write("nextflow.enable.dsl = 2\n\n")
+        f.write('\n'.join(include_lines) + "\n\n")
+        f.write("workflow {\n" + '\n'.join(entry_lines) + "\n}\n")
+
+    # a failed task must not stop tasks of other jobs, failures are picked up from the trace instead
+    with open(os.path.join(launch_dir, BATCH_CONFIG), 'w') as f:
+        f.write("process.errorStrategy = 'ignore'\n")
+        f.write(f"trace {{\n  enabled = true\n  file = '{BATCH_TRACE_FILE}'\n"
+                "  fields = 'task_id,name,status,exit,submit,complete,realtime,%cpu,peak_rss,rchar,wchar'\n}\n")
+
+    return workflow_names
+
+
+def batchable(jobs: List[TestJob]) -> bool:
+    """
+    Whether test jobs can run in one session: params that differ between the jobs must not be
+    used in config files, as a session has only one config
+    """
+    all_params = job_params(jobs)
+    differ = set()
+    for params in all_params[1:]:
+        differ |= set(k for k in set(params) | set(all_params[0]) if params.get(k) != all_params[0].get(k))
+
+    return not differ.intersection(config_param_names(os.path.join(jobs[0].test_path, 'nextflow.config')))
+
+
+def failed_tasks_by_alias(tasks: List[dict]) -> Tuple[set, set]:
+    """
+    Top level workflow/process names (aliases) of all tasks in a trace, and of those that did not succeed
+    """
+    seen, failed = set(), set()
+    for task in tasks:
+        alias = task_alias(task)
+        seen.add(alias)
+        if task.get('status') not in ('COMPLETED', 'CACHED'):
+            failed.add(alias)
+
+    return seen, failed
+
+
+def run_nextflow(argv: List[str], launch_dir: str, opts: RunOptions, label='', timeout=None):
+    for left_over in (TEST_LOG_FILE, TRACE_FILE):  # from a previous run in a reused launch dir
+        if os.path.exists(os.path.join(launch_dir, left_over)):
+            os.remove(os.path.join(launch_dir, left_over))
+
+    return run_process(
+        argv + opts.nextflow_args,
+        cwd=launch_dir,
+        timeout=timeout or opts.timeout,
+        max_lines=OUTPUT_TAIL_LINES,
+        log_file=os.path.join(launch_dir, TEST_LOG_FILE),
+        stream_prefix=f"[{label}] " if opts.stream else None
+    )
+
+
+def run_test_job(job: TestJob, launch_root: str, opts: RunOptions) -> TestResult:
+    try:
+        launch_dir = prepare_launch_dir(
+            job.test_path,
+            launch_dir_of(launch_root, job.pkg_path, os.path.splitext(job.name)[0], opts),
+            reuse=opts.resume
+        )
+    except Exception as ex:
+        return TestResult(job=job, returncode=1, stderr=f"Unable to prepare launch dir: {ex}")
+
+    proc = run_nextflow(['nextflow', 'run', job.checker, '-params-file', job.job_file, '-with-trace', TRACE_FILE],
+                        launch_dir, opts, label=repr(job))
+    tasks = read_trace(os.path.join(launch_dir, TRACE_FILE))
+    cpus, memory = resource_usage(tasks)
+
+    return TestResult(job=job, returncode=proc.returncode, stdout=proc.stdout, stderr=proc.stderr,
+                      launch_dir=launch_dir, duration=proc.duration, max_rss=proc.max_rss, timed_out=proc.timed_out,
+                      cpus=cpus, memory=memory, processes=process_metrics(tasks))
+
+
+def run_test_batch(jobs: List[TestJob], launch_root: str, opts: RunOptions) -> List[TestResult]:
+    """
+    Run all test jobs of a package in one Nextflow session to pay JVM and Nextflow start up only
+    once, then map the outcome of each task back to the job it belongs to. Jobs that can not share
+    a session (see 'batchable') are run one after another instead
+    """
+    try:
+        if not batchable(jobs):
+            return [run_test_job(job, launch_root, opts) for job in jobs]
+
+        launch_dir = prepare_launch_dir(
+            jobs[0].test_path,
+            launch_dir_of(launch_root, jobs[0].pkg_path, 'batch', opts),
+            reuse=opts.resume
+        )
+        workflow_names = gen_batch_wrapper(jobs, launch_dir)
+        trace_file = os.path.join(launch_dir, BATCH_TRACE_FILE)
+        if os.path.exists(trace_file):
+            os.remove(trace_file)
+    except Exception as ex:
+        return [TestResult(job=job, returncode=1, stderr=f"Unable to prepare batch run: {ex}") for job in jobs]
+
+    argv = ['nextflow', 'run', BATCH_SCRIPT, '-params-file', BATCH_PARAMS_FILE, '-c', BATCH_CONFIG]
+    if os.path.isfile(os.path.join(jobs[0].test_path, 'nextflow.config')):  # not picked up from the launch dir
+        argv[-2:-2] = ['-c', os.path.join(jobs[0].test_path, 'nextflow.config')]
+
+    # the time limit is per test job, a batch gets the sum of those of its jobs
+    proc = run_nextflow(argv, launch_dir, opts, label=f"{jobs[0].pkg_name}/batch",
+                        timeout=opts.timeout * len(jobs) if opts.timeout else None)
+    ret = proc.returncode
+
+    tasks = read_trace(trace_file)
+    seen, failed = failed_tasks_by_alias(tasks)
+    # start up and shut down of the session, which a job run on its own would take as well
+    overhead = max(0.0, proc.duration - (tasks_span(tasks) or 0.0))
+
+    results = []
+    for job, workflow_name in zip(jobs, workflow_names):
+        # a job passes when the session succeeded, its tasks ran and none of them failed
+        passed = ret == 0 and workflow_name in seen and workflow_name not in failed
+        # tasks of the job named as in a run of the job on its own, without the job's workflow
+        job_tasks = [dict(t, name=t['name'].split(':', 1)[1]) for t in tasks
+                     if task_alias(t) == workflow_name and ':' in t.get('name', '')]
+        span = tasks_span(job_tasks)
+        cpus, memory = resource_usage(job_tasks)
+        results.append(TestResult(
+            job=job,
+            returncode=0 if passed else (ret or 1),
+            stdout=proc.stdout,
+            stderr=proc.stderr,
+            launch_dir=launch_dir,
+            duration=span + overhead if span is not None else proc.duration,
+            duration_measured=span is not None,
+            max_rss=proc.max_rss,
+            timed_out=proc.timed_out,
+            cpus=cpus,
+            memory=memory,
+            processes=process_metrics(job_tasks)
+        ))
+
+    return results
+
+
+def run_test_jobs(jobs: List[TestJob], max_workers=None, use_cache=True, batch=False, opts: RunOptions = None,
+                  fail_fast=False, max_cpus=None, max_memory=None, report: Callable = echo) -> List[TestResult]:
+    """
+    Run test jobs on a pool of workers, results are reported in the order of the jobs (grouped
+    by package) regardless of the order in which they complete. Jobs that passed before with
+    exactly the same inputs are reported from the cache without running. With 'opts.resume',
+    each job keeps its launch dir under the user cache so that Nextflow can skip unchanged tasks.
+    With 'fail_fast', jobs not yet started when one fails are skipped. With 'max_cpus' and/or
+    'max_memory' (GB), jobs are started as long as their expected resources (see 'job_resources')
+    fit in the budget, the number of workers is then unlimited unless given. Report lines are
+    passed to 'report', which prints them by default
+    """
+    if not jobs:
+        return []
+
+    budgeted = max_cpus is not None or max_memory is not None
+    if not max_workers:
+        max_workers = len(jobs) if budgeted else 1
+
+    opts = opts or RunOptions()
+    test_cache = TestCache()
+    cache_keys = test_job_cache_keys(jobs, stub=opts.stub) if use_cache else [None] * len(jobs)
+
+    launch_root = cache_dir('test-runs') if opts.resume else tempfile.mkdtemp(prefix='wfpm-test-')
+    results = []
+    history = TestHistory()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # each job is a Nextflow run in its own subprocess, threads are all we need to drive them
+        scheduler = ResourceScheduler(executor, max_cpus=max_cpus, max_memory=max_memory) if budgeted else None
+
+        def submit(resources, fn, *args):
+            if not scheduler:
+                return executor.submit(fn, *args)
+            return scheduler.submit(*resources, fn, *args)
+
+        # for each job: the future and, when run in a batch, the position of its result in the batch
+        futures = []
+        to_batch = []
+        for job, key in zip(jobs, cache_keys):
+            if key and test_cache.get(key):
+                future = Future()
+                future.set_result(TestResult(job=job, returncode=0, cached=True))
+                futures.append((future, None))
+            elif batch:
+                futures.append(None)
+                to_batch.append((len(futures) - 1, job))
+            else:
+                futures.append((submit(job_resources(job, history), run_test_job, job, launch_root, opts), None))
+
+        for pkg_path, pkg_batch in groupby(to_batch, key=lambda j: j[1].pkg_path):
+            pkg_batch = list(pkg_batch)
+            # jobs of a batch run side by side in one session, it takes what they take together
+            batch_resources = [job_resources(job, history) for _, job in pkg_batch]
+            batch_future = submit(
+                (sum(r[0] for r in batch_resources), sum(r[1] for r in batch_resources)),
+                run_test_batch, [job for _, job in pkg_batch], launch_root, opts
+            )
+            for n, (i, _) in enumerate(pkg_batch):
+                futures[i] = (batch_future, n)
+
+        if fail_fast:
+            cancel_on_failure(set(f for f, _ in futures))
+
+        futures = iter(futures)
+
+        for pkg_path, pkg_jobs in groupby(jobs, key=lambda j: j.pkg_path):
+            pkg_jobs = list(pkg_jobs)
+            report(f"Testing package: {pkg_path}")
+
+            failed_count, skipped_count = 0, 0
+            for i in range(len(pkg_jobs)):
+                future, n = next(futures)
+                if future.cancelled():
+                    result = TestResult(job=pkg_jobs[i], skipped=True)
+                else:
+                    result = future.result() if n is None else future.result()[n]
+                results.append(result)
+
+                testing = f"[{i+1}/{len(pkg_jobs)}] Testing: {pkg_jobs[i].job_file}."
+                if result.passed:
+                    report(f"{testing} {'PASSED (cached)' if result.cached else 'PASSED'}")
+                elif result.skipped:
+                    skipped_count += 1
+                    report(f"{testing} SKIPPED (fail fast)")
+                else:
+                    failed_count += 1
+                    report(f"{testing} {'FAILED (timed out)' if result.timed_out else 'FAILED'}")
+                    report(f"STDOUT: {result.stdout}")
+                    report(f"STDERR: {result.stderr}")
+
+            report(f"Tested package: {os.path.basename(pkg_path)}, "
+                   f"PASSED: {len(pkg_jobs) - failed_count - skipped_count}, FAILED: {failed_count}" +
+                   (f", SKIPPED: {skipped_count}" if skipped_count else ''))
+
+    for result, key in zip(results, cache_keys):
+        if key and result.passed and not result.cached:
+            test_cache.put(key, {
+                'job': repr(result.job),
+                'passed': True,
+                'created': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+            })
+
+    if not opts.stub:  # durations of stub runs tell nothing about the real tests
+        history.record(results)
+        TestStatus().update(results)
+        record_perf(results)
+
+    # keep launch dirs of failed jobs for inspection
+    failed_launch_dirs = set(r.launch_dir for r in results if r.failed and r.launch_dir)
+    if opts.resume:
+        gc_resume_dirs(launch_root, keep=set(r.launch_dir for r in results if r.launch_dir))
+    else:
+        for result in results:
+            if result.launch_dir and result.launch_dir not in failed_launch_dirs:
+                shutil.rmtree(result.launch_dir, ignore_errors=True)
+
+    if failed_launch_dirs:
+        report(f"Work dirs of failed tests kept under: {launch_root}")
+    elif not opts.resume:
+        shutil.rmtree(launch_root, ignore_errors=True)
+
+    return results
+
+
+def measured_versions(results: List[TestResult]) -> dict:
+    """
+    Process metrics of each package version, merged over its test jobs that ran and passed
+    """
+    measured = {}
+    for result in results:
+        if result.passed and not result.cached and result.processes and result.job.pkg_version:
+            key = (result.job.pkg_id, result.job.pkg_version)
+            measured[key] = merge_metrics(measured.get(key, {}), result.processes)
+
+    return measured
+
+
+def record_perf(results: List[TestResult], store: PerfStore = None) -> None:
+    """
+    Store process metrics of the package versions tested. Processes not run this time, eg, as
+    their test jobs passed from the cache, keep the metrics recorded before
+    """
+    store = store or PerfStore()
+    for (pkg_id, version), processes in measured_versions(results).items():
+        previous = store.get(pkg_id, version)
+        store.put(pkg_id, version, {**(previous or {}).get('processes', {}), **processes},
+                  nextflow_version=nextflow_version())
+
+
+def perf_regressions(results: List[TestResult], threshold: float, store: PerfStore = None) -> List[dict]:
+    """
+    Gated process metrics of the package versions tested that grew beyond 'threshold' (eg, 0.2
+    for 20%) compared with the latest older version recorded of the same package
+    """
+    store = store or PerfStore()
+    regressions = []
+    for (pkg_id, version), processes in measured_versions(results).items():
+        baseline = store.baseline(pkg_id, version)
+        if not baseline:
+            continue
+
+        for change in compare_metrics(baseline['processes'], processes, threshold):
+            if change['regressed']:
+                regressions.append(dict(change, pkg_id=pkg_id, version=version, baseline=baseline['version']))
+
+    return regressions
+
+
+def dir_size(path) -> int:
+    size = 0
+    for root, dirs, files in os.walk(path):  # symlinks are not followed
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+
+    return size
+
+
+def gc_resume_dirs(launch_root, keep=(), max_age_days=None, max_size_gb=None) -> List[str]:
+    """
+    Remove launch dirs kept for '--resume' that have not been used for 'max_age_days', then remove
+    the least recently used ones until all left take no more than 'max_size_gb'. Dirs in 'keep'
+    are never removed. Returns the removed dirs
+    """
+    max_age_days = RESUME_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    max_size_gb = RESUME_MAX_SIZE_GB if max_size_gb is None else max_size_gb
+
+    launch_dirs = []
+    for entry in os.listdir(launch_root):
+        path = os.path.join(launch_root, entry)
+        if os.path.isdir(path) and not os.path.islink(path):
+            launch_dirs.append((os.path.getmtime(path), path))
+
+    removed = []
+    total_size = 0
+    now = time.time()
+    for last_used, path in sorted(launch_dirs, reverse=True):  # most recently used first
+        size = dir_size(path)
+        if path not in keep and (
+            now - last_used > max_age_days * 86400 or total_size + size > max_size_gb * 1024 ** 3
+        ):
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+        else:
+            total_size += size
+
+    return removed
+
+
+def cancel_on_failure(futures) -> None:
+    """
+    Once any of the futures has a failed result, cancel all of them that have not started yet
+    """
+    def on_done(future):
+        if future.cancelled():
+            return
+
+        result = future.result()
+        if any(r.failed for r in (result if isinstance(result, list) else [result])):
+            for f in futures:
+                f.cancel()
+
+    for future in futures:
+        future.add_done_callback(on_done)
+
+
+def order_failed_first(jobs: List[TestJob], failed_ids) -> List[TestJob]:
+    """
+    Packages with failed jobs go first, within a package the failed jobs go first, otherwise
+    the order is kept
+    """
+    failed_pkgs = set(j.pkg_path for j in jobs if j.id in failed_ids)
+    pkg_order = {}
+    for job in jobs:
+        pkg_order.setdefault(job.pkg_path, len(pkg_order))
+
+    return sorted(jobs, key=lambda j: (j.pkg_path not in failed_pkgs, pkg_order[j.pkg_path], j.id not in failed_ids))
+
+
+def report_no_test(pkg_path, report: Callable = echo):
+    report(f"Testing package: {pkg_path}")
+    report("No test to run.")
+    report(f"Tested package: {os.path.basename(pkg_path)}, PASSED: 0, FAILED: 0")
+
+
+def test_package(pkg_path, max_workers=None, use_cache=True, batch=False, opts: RunOptions = None,
+                 report: Callable = echo):
+    jobs = collect_test_jobs(pkg_path)
+    if not jobs:
+        report_no_test(pkg_path, report=report)
+        return 0
+
+    results = run_test_jobs(jobs, max_workers=max_workers, use_cache=use_cache, batch=batch, opts=opts,
+                            report=report)
+
+    return len([r for r in results if r.failed])  # return number of failed tests
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import os
+import re
+import math
+import json
+import threading
+from datetime import datetime
+from distutils.version import LooseVersion
+from typing import List, Tuple
+from .cache import cache_dir, write_json_atomic
+
+
+TRACE_FILE = 'wfpm-trace.txt'
+
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'TB': 1024 ** 4}
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# per process metrics kept from the trace, each the peak over the process's tasks
+METRICS = ('realtime', '%cpu', 'peak_rss', 'rchar', 'wchar')
+
+# metrics of which the value of each task is also kept, up to a number of tasks per process
+SAMPLED_METRICS = ('%cpu', 'peak_rss')
+MAX_SAMPLES = 200
+
+# metrics checked for regressions, with the least baseline value worth comparing as tiny
+# values vary a lot from run to run
+GATED_METRICS = {'realtime': 1.0, 'peak_rss': 64 * SIZE_UNITS['MB']}
+
+
+def read_trace(trace_file) -> List[dict]:
+    """
+    Tasks in a Nextflow trace file, each as a dict of field name to raw value
+    """
+    if not os.path.isfile(trace_file):
+        return []
+
+    with open(trace_file, 'r') as f:
+        header = f.readline().rstrip('\n').split('\t')
+        return [dict(zip(header, line.rstrip('\n').split('\t'))) for line in f if line.strip()]
+
+
+def parse_size(value) -> int:
+    """
+    Bytes of a size as Nextflow writes it, eg, '1.5 GB', None if not available
+    """
+    m = re.match(r'^\s*([0-9.]+)\s*([KMGT]?B)?\s*$', value or '')
+    if not m:
+        return None
+
+    return int(float(m.group(1)) * SIZE_UNITS[m.group(2) or 'B'])
+
+
+def parse_duration(value) -> float:
+    """
+    Seconds of a duration as Nextflow writes it, eg, '1m 5s' or '350ms', None if not available
+    """
+    parts = re.findall(r'([0-9.]+)\s*(ms|s|m|h|d)\b', value or '')
+    if not parts:
+        return None
+
+    return sum(float(n) * DURATION_UNITS[unit] for n, unit in parts)
+
+
+def parse_timestamp(value) -> float:
+    """
+    Seconds since the epoch of a time as Nextflow writes it, eg, '2021-01-19 12:00:01.250', None if
+    not available
+    """
+    try:
+        return datetime.strptime((value or '').strip(), '%Y-%m-%d %H:%M:%S.%f').timestamp()
+    except ValueError:
+        return None
+
+
+def tasks_span(tasks: List[dict]) -> float:
+    """
+    Seconds from the first submission to the last completion of the tasks, None if not available
+    """
+    submitted = [parse_timestamp(t.get('submit')) for t in tasks]
+    completed = [parse_timestamp(t.get('complete')) for t in tasks]
+    submitted = [t for t in submitted if t is not None]
+    completed = [t for t in completed if t is not None]
+    if not submitted or not completed:
+        return None
+
+    return max(0.0, max(completed) - min(submitted))
+
+
+def parse_percent(value) -> float:
+    m = re.match(r'^\s*([0-9.]+)%?\s*$', value or '')
+    return float(m.group(1)) if m else None
+
+
+def task_alias(task: dict) -> str:
+    """
+    Name of the top level workflow or process a task was called from, eg, 'checker' for 'checker:fastqc (1)'
+    """
+    return task.get('name', '').split(':')[0].split(' (')[0]
+
+
+def process_name(task: dict) -> str:
+    """
+    Name of the process a task ran, without the top level workflow it was called from and the
+    task tag, eg, 'fastqc' for 'checker:fastqc (1)'
+    """
+    name = task.get('name', '').split(' (')[0]
+    return name.split(':', 1)[1] if ':' in name else name
+
+
+def parse_metric(metric, value):
+    if metric == 'realtime':
+        return parse_duration(value)
+    if metric == '%cpu':
+        return parse_percent(value)
+    return parse_size(value)
+
+
+def process_metrics(tasks: List[dict]) -> dict:
+    """
+    Peak value of each metric over the succeeded tasks of each process, plus values of each task
+    for the sampled metrics
+    """
+    processes = {}
+    for task in tasks:
+        if task.get('status') not in ('COMPLETED', 'CACHED'):
+            continue
+
+        metrics = processes.setdefault(process_name(task), {'tasks': 0, 'samples': {}})
+        metrics['tasks'] += 1
+        for metric in METRICS:
+            value = parse_metric(metric, task.get(metric))
+            if value is None:
+                continue
+            if value > metrics.get(metric, -1):
+                metrics[metric] = value
+            if metric in SAMPLED_METRICS:
+                samples = metrics['samples'].setdefault(metric, [])
+                samples.append(value)
+                del samples[:-MAX_SAMPLES]
+
+    return processes
+
+
+def merge_metrics(*all_processes: dict) -> dict:
+    merged = {}
+    for processes in all_processes:
+        for name, metrics in processes.items():
+            peak = merged.setdefault(name, {'tasks': 0, 'samples': {}})
+            peak['tasks'] += metrics.get('tasks', 0)
+            for metric in METRICS:
+                if metrics.get(metric) is not None and metrics[metric] > peak.get(metric, -1):
+                    peak[metric] = metrics[metric]
+            for metric, values in metrics.get('samples', {}).items():
+                samples = peak['samples'].setdefault(metric, [])
+                samples.extend(values)
+                del samples[:-MAX_SAMPLES]
+
+    return merged
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Nearest-rank percentile, eg, 'pct' 95 for the value that 95% of the values do not exceed
+    """
+    ranked = sorted(values)
+    return ranked[max(0, math.ceil(pct / 100 * len(ranked)) - 1)]
+
+
+def compare_metrics(old: dict, new: dict, threshold: float = None) -> List[dict]:
+    """
+    Change of each metric of each process found in both, as a fraction of the old value. With a
+    'threshold' (eg, 0.2 for 20%), changes of gated metrics beyond it are marked as regressed
+    """
+    changes = []
+    for name in sorted(set(old).intersection(new)):
+        for metric in METRICS:
+            old_value, new_value = old[name].get(metric), new[name].get(metric)
+            if old_value is None or new_value is None:
+                continue
+
+            change = new_value / old_value - 1 if old_value else None
+            regressed = threshold is not None and metric in GATED_METRICS and change is not None and \
+                old_value >= GATED_METRICS[metric] and change > threshold
+            changes.append({
+                'process': name,
+                'metric': metric,
+                'old': old_value,
+                'new': new_value,
+                'change': change,
+                'regressed': regressed
+            })
+
+    return changes
+
+
+def format_metric(metric, value) -> str:
+    if value is None:
+        return 'n/a'
+    if metric == 'realtime':
+        return f"{value:.1f}s"
+    if metric == '%cpu':
+        return f"{value:.1f}%"
+    for unit in ('TB', 'GB', 'MB', 'KB'):
+        if value >= SIZE_UNITS[unit]:
+            return f"{value / SIZE_UNITS[unit]:.1f} {unit}"
+    return f"{int(value)} B"
+
+
+class PerfStore(object):
+    """
+    Local store of process metrics per package version, taken from the traces of the latest test
+    run of the version. Stored as 'perf/<pkg_id>/<version>.json' under the cache dir
+    """
+    path: str = None
+    _lock = threading.Lock()
+
+    def __init__(self, path=None):
+        self.path = path or cache_dir('perf')
+
+    def _file(self, pkg_id, version) -> str:
+        return os.path.join(self.path, *pkg_id.split('/'), f"{version}.json")
+
+    def get(self, pkg_id, version) -> dict:
+        try:
+            with open(self._file(pkg_id, version), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def versions(self, pkg_id) -> List[str]:
+        pkg_dir = os.path.join(self.path, *pkg_id.split('/'))
+        if not os.path.isdir(pkg_dir):
+            return []
+
+        versions = [f[:-len('.json')] for f in os.listdir(pkg_dir) if f.endswith('.json')]
+        return sorted(versions, key=LooseVersion)
+
+    def baseline(self, pkg_id, version) -> dict:
+        """
+        Metrics of the latest version recorded before the given one
+        """
+        older = [v for v in self.versions(pkg_id) if LooseVersion(v) < LooseVersion(version)]
+        return self.get(pkg_id, older[-1]) if older else None
+
+    def put(self, pkg_id, version, processes: dict, nextflow_version=None) -> None:
+        with self._lock:
+            os.makedirs(os.path.dirname(self._file(pkg_id, version)), exist_ok=True)
+            write_json_atomic(self._file(pkg_id, version), {
+                'pkg_id': pkg_id,
+                'version': version,
+                'nextflow_version': nextflow_version,
+                'recorded': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'processes': processes
+            })
+
+
+def resource_usage(tasks: List[dict]) -> Tuple[int, float]:
+    """
+    CPUs and memory (GB) used by the most demanding task, None where nothing was measured
+    """
+    cpus = [parse_percent(t.get('%cpu')) for t in tasks]
+    rss = [parse_size(t.get('peak_rss')) for t in tasks]
+    cpus = [c for c in cpus if c is not None]
+    rss = [r for r in rss if r is not None]
+
+    return (
+        max(1, math.ceil(max(cpus) / 100)) if cpus else None,
+        round(max(rss) / SIZE_UNITS['GB'], 3) if rss else None
+    )
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import os
+import re
+import math
+from glob import glob
+from typing import List, Tuple
+from .nf_script import parse_file
+from .trace import percentile, parse_size, SIZE_UNITS
+
+
+TUNE_BLOCK_START = '// wfpm tune starts'
+TUNE_BLOCK_END = '// wfpm tune ends'
+
+# memory recommendations are rounded up to a multiple of this
+MEMORY_STEP_MB = 256
+
+
+def pkg_process_blocks(pkg_path):
+    """
+    Processes defined in the package's own scripts, not those of its dependencies
+    """
+    blocks = []
+    for script in [os.path.join(pkg_path, 'main.nf')] + sorted(glob(os.path.join(pkg_path, 'local_modules', '*.nf'))):
+        if os.path.isfile(script):
+            blocks += parse_file(script).processes
+
+    return blocks
+
+
+def pkg_processes(pkg_path) -> List[str]:
+    return [p.name for p in pkg_process_blocks(pkg_path)]
+
+
+def resource_params(directives: dict) -> Tuple[str, Tuple[str, str]]:
+    """
+    Params a process takes its CPUs and memory from, eg, 'cpus' for 'cpus params.cpus' and
+    ('mem', 'GB') for 'memory "${params.mem} GB"' or 'memory params.mem.GB', None where not a param
+    """
+    cpus = re.match(r'^params\.(\w+)$', directives.get('cpus', '').strip())
+    memory_directive = directives.get('memory', '').strip()
+    memory = re.match(r'^"\$\{params\.(\w+)\}\s*\.?\s*([GM]B)"$', memory_directive) or \
+        re.match(r'^params\.(\w+)\s*\.\s*([GM]B)$', memory_directive)
+
+    return cpus.group(1) if cpus else None, memory.groups() if memory else None
+
+
+def pkg_resource_params(pkg_path) -> dict:
+    """
+    For each process of the package, the params it takes its CPUs and memory from, see 'resource_params'
+    """
+    return {p.name: resource_params(p.directives) for p in pkg_process_blocks(pkg_path)}
+
+
+def format_memory(memory_mb: int) -> str:
+    return f"{memory_mb // 1024} GB" if memory_mb % 1024 == 0 else f"{memory_mb} MB"
+
+
+def recommend(processes: dict, names: List[str], pct=95, headroom=20) -> dict:
+    """
+    CPUs and memory recommended for each of the named processes with recorded samples. CPUs cover
+    the 'pct' percentile of the CPU usage of their tasks, memory covers the 'pct' percentile of
+    the peak RSS plus 'headroom' percent
+    """
+    recommended = {}
+    for full_name, metrics in sorted(processes.items()):
+        name = full_name.split(':')[-1]
+        samples = metrics.get('samples', {})
+        if name not in names or name in recommended or not samples.get('peak_rss'):
+            continue
+
+        memory_mb = percentile(samples['peak_rss'], pct) * (1 + headroom / 100) / SIZE_UNITS['MB']
+        recommended[name] = {
+            'cpus': max(1, math.ceil(percentile(samples['%cpu'], pct) / 100)) if samples.get('%cpu') else 1,
+            'memory': format_memory(max(1, math.ceil(memory_mb / MEMORY_STEP_MB)) * MEMORY_STEP_MB),
+            'tasks': metrics.get('tasks')
+        }
+
+    return recommended
+
+
+def split_by_params(recommended: dict, process_params: dict) -> Tuple[dict, dict]:
+    """
+    Recommendations for processes taking their CPUs or memory from params become defaults of those
+    params, so that values given by users or test jobs still take precedence. The rest stay per
+    process. Returns the param defaults and the per process recommendations left
+    """
+    param_values, selectors = {}, {}
+    for name, r in recommended.items():
+        cpus_param, memory_param = process_params.get(name, (None, None))
+        if cpus_param:
+            param_values[cpus_param] = max(param_values.get(cpus_param, 0), r['cpus'])
+        else:
+            selectors.setdefault(name, {})['cpus'] = r['cpus']
+
+        if memory_param:
+            param, unit = memory_param
+            value = parse_size(r['memory']) / SIZE_UNITS[unit]
+            value = int(value) if value == int(value) else round(value, 2)
+            param_values[param] = max(param_values.get(param, 0), value)
+        else:
+            selectors.setdefault(name, {})['memory'] = r['memory']
+
+    return param_values, selectors
+
+
+def tune_block(recommended: dict, version, pct=95, headroom=20, param_values: dict = None) -> str:
+    """
+    Config block with 'param_values' as params defaults and the per process 'recommended'
+    resources as 'withName' selectors
+    """
+    lines = [
+        f"{TUNE_BLOCK_START}, do NOT edit till the end of the block, rerun 'wfpm tune' instead",
+        f"// from test runs of version {version}: {pct:g}th percentile of tasks' usage, memory plus {headroom:g}%"
+    ]
+    if param_values:
+        # defaults only, params given on the command line or in a params file take precedence
+        lines.append("params {")
+        lines += [f"    {name} = {value}" for name, value in sorted(param_values.items())]
+        lines.append("}")
+
+    if recommended:
+        lines.append("process {")
+        for name, r in recommended.items():
+            lines.append(f"    withName: '{name}' {{")
+            if 'cpus' in r:
+                lines.append(f"        cpus = {r['cpus']}")
+            if 'memory' in r:
+                lines.append(f"        memory = '{r['memory']}'")
+            lines.append("    }")
+        lines.append("}")
+
+    lines.append(TUNE_BLOCK_END)
+    return '\n'.join(lines) + '\n'
+
+
+def update_config(config_str: str, block: str) -> str:
+    """
+    Replace the tune block in a config with the new one, or append the new one when there is none
+    """
+    pattern = re.compile(r'^%s.*?^%s[^\n]*\n?' % (re.escape(TUNE_BLOCK_START), re.escape(TUNE_BLOCK_END)), re.M | re.S)
+    if pattern.search(config_str):
+        return pattern.sub(lambda m: block, config_str, count=1)
+
+    if config_str and not config_str.endswith('\n'):
+        config_str += '\n'
+
+    return config_str + ('\n' if config_str else '') + block
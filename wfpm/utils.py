@@ -21,11 +21,10 @@
 
 import os
 import re
-import subprocess
-from glob import glob
-from click import echo
 from typing import Tuple, List
 from wfpm import PRJ_NAME_REGEX, PKG_NAME_REGEX, PKG_VER_REGEX
+from .execution import run_process
+from .nf_script import parse_file
 
 
 def locate_nearest_parent_dir_with_file(start_dir=None, filename=None):
@@ -37,49 +36,19 @@ def locate_nearest_parent_dir_with_file(start_dir=None, filename=None):
             return path
 
 
-def run_cmd(cmd):
-    # keep this simple for now
-    proc = subprocess.Popen(
-                cmd,
-                shell=True,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-    stdout, stderr = proc.communicate()
+def run_cmd(cmd, cwd=None, timeout=None):
+    """
+    Run a command, 'cmd' is either an argv list or a string to be run by the shell
+    """
+    result = run_process(cmd, cwd=cwd, timeout=timeout, shell=isinstance(cmd, str))
 
     return (
-        stdout.decode("utf-8").strip(),
-        stderr.decode("utf-8").strip(),
-        proc.returncode
+        result.stdout.strip(),
+        result.stderr.strip(),
+        result.returncode
     )
 
 
-def test_package(pkg_path):
-    test_path = os.path.join(pkg_path, 'tests')
-    job_files = sorted(glob(os.path.join(test_path, 'test-*.json')))
-    test_count = len(job_files)
-    failed_count = 0
-    for i in range(test_count):
-        cmd = f"cd {test_path} && ./checker.nf -params-file {job_files[i]}"
-        echo(f"[{i+1}/{test_count}] Testing: {job_files[i]}. ", nl=False)
-        out, err, ret = run_cmd(cmd)
-        if ret != 0:
-            failed_count += 1
-            echo("FAILED")
-            echo(f"STDOUT: {out}")
-            echo(f"STDERR: {err}")
-        else:
-            echo("PASSED")
-
-    if not test_count:
-        echo("No test to run.")
-
-    echo(f"Tested package: {os.path.basename(pkg_path)}, PASSED: {test_count - failed_count}, FAILED: {failed_count}")
-
-    return failed_count  # return number of failed tests
-
-
 def pkg_uri_parser(pkg_uri) -> Tuple[str, str, str, str, str]:
     try:
         repo_server, repo_account, repo_name, pkg_fullname = pkg_uri.split('/')
@@ -132,11 +101,4 @@ def pkg_asset_download_urls(url) -> List[str]:
 
 
 def extract_version_str(script):
-    with open(script, 'r') as s:
-        for line in s:
-            m1 = re.match(r'^\s*version\s*=\s*"(.+?)"\s*.*$', line)
-            m2 = re.match(r'^\s*version\s*=\s*\'(.+?)\'\s*.*$', line)
-            if m1:
-                return m1.group(1)
-            elif m2:
-                return m2.group(1)
+    return parse_file(script).version
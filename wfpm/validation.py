@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Ontario Institute for Cancer Research (OICR).
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+    Authors:
+        Junjun Zhang <junjun.zhang@oicr.on.ca>
+"""
+
+import os
+from typing import List, Dict, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from .package import Package
+from .nf_script import parse_file
+
+
+class IncludeGraph(object):
+    """
+    Scripts of a package reachable through includes from its main script (and the checker for
+    local packages), with issues found in their includes
+    """
+    pkg: Package = None
+    scripts: List[str] = None
+    include_count: int = 0
+    issues: List[str] = None
+
+    def __init__(self, pkg: Package):
+        self.pkg = pkg
+        self.scripts = []
+        self.issues = []
+
+
+def script_file(path) -> str:
+    return path if path.endswith('.nf') else f"{path}.nf"
+
+
+def dep_of_include(source: str) -> str:
+    """
+    pkg_uri of the installed package an include source points into, eg, 'github.com/icgc-argo/demo-wfpkgs/demo-utils@1.3.0'
+    for './wfpr_modules/github.com/icgc-argo/demo-wfpkgs/demo-utils@1.3.0/main', None if not an installed package
+    """
+    parts = os.path.normpath(source).split(os.sep)
+    if 'wfpr_modules' not in parts:
+        return None
+
+    dep_parts = parts[parts.index('wfpr_modules') + 1:][:4]
+    return '/'.join(dep_parts) if len(dep_parts) == 4 and '@' in dep_parts[3] else None
+
+
+def script_names(script) -> List[str]:
+    """
+    Names a script makes available to scripts including it, ie, what it defines or includes itself
+    """
+    symbols = parse_file(script)
+    return symbols.defined_names + [alias for i in symbols.includes for _, alias in i.items]
+
+
+def pkg_entry_scripts(pkg: Package) -> List[str]:
+    scripts = [script_file(os.path.join(pkg.pkg_path, pkg.main))]
+    if 'wfpr_modules' not in pkg.pkg_path:  # installed packages are not tested from here
+        scripts.append(os.path.join(pkg.pkg_path, 'tests', 'checker.nf'))
+
+    return [s for s in scripts if os.path.isfile(s)]
+
+
+def validate_includes(pkg: Package) -> IncludeGraph:
+    """
+    Follow includes from the package's entry scripts through its own scripts. Every include
+    must point to an existing script exporting the included names, includes into installed
+    packages must be of declared dependencies, dev dependencies being allowed in tests only
+    """
+    graph = IncludeGraph(pkg)
+    pkg_root = os.path.join(os.path.realpath(pkg.pkg_path), '')
+    tests_root = os.path.join(pkg_root, 'tests', '')
+    to_visit = pkg_entry_scripts(pkg)
+    visited = set()
+    while to_visit:
+        script = to_visit.pop(0)
+        if os.path.realpath(script) in visited:
+            continue
+        visited.add(os.path.realpath(script))
+        graph.scripts.append(script)
+
+        rel_script = os.path.relpath(script, pkg.pkg_path)
+        for include in parse_file(script).includes:
+            graph.include_count += 1
+            location = f"{rel_script}:{include.line}"
+            if not include.source or '${' in include.source or include.source.startswith('plugin/'):
+                continue  # resolved only at run time
+
+            target = script_file(os.path.normpath(os.path.join(os.path.dirname(script), include.source)))
+            dep = dep_of_include(include.source)
+            allowed_deps = pkg.allDependencies if os.path.realpath(script).startswith(tests_root) else pkg.dependencies
+            if dep and dep not in allowed_deps:
+                graph.issues.append(
+                    f"{location}: includes from '{dep}' which is not declared as a "
+                    f"{'dependency' if allowed_deps is pkg.dependencies else 'dependency or devDependency'} in pkg.json."
+                )
+
+            if not os.path.isfile(target):
+                graph.issues.append(
+                    f"{location}: included script '{include.source}' not found" +
+                    (", please run 'wfpm install'." if dep else '.')
+                )
+                continue
+
+            missing = [name for name, _ in include.items if name not in script_names(target)]
+            if missing:
+                graph.issues.append(
+                    f"{location}: '{', '.join(missing)}' not defined in included script '{include.source}'."
+                )
+
+            if os.path.realpath(target).startswith(pkg_root) and not dep:
+                to_visit.append(target)  # own script, its includes are part of the package
+
+    return graph
+
+
+def project_pkgs(project, installed=True) -> List[Package]:
+    """
+    Local packages of the project followed by the installed ones
+    """
+    pkgs = sorted(project.pkgs, key=lambda p: p.name)
+    return pkgs + sorted(project.installed_pkgs, key=lambda p: p.pkg_uri) if installed else pkgs
+
+
+def validate_pkg(pkg: Package, repo: Tuple[str, str, str] = (None, None, None),
+                 installed_pkg_uris: Set[str] = None) -> Tuple[List[str], List[str]]:
+    """
+    Issues of a package: those of its pkg.json and scripts, and those of its includes. 'repo' is
+    the server, account and name of the project's repository, installed packages are checked
+    against the repository in their path instead
+    """
+    if 'wfpr_modules' in pkg.pkg_path:
+        repo = pkg.pkg_path.split(os.sep)[-4:-1]
+
+    try:
+        return pkg.validate(*repo, installed_pkg_uris=installed_pkg_uris or set()), validate_includes(pkg).issues
+    except Exception as ex:
+        return [f"Unable to validate package: {ex}"], []
+
+
+def validate_pkgs(pkgs: List[Package], repo: Tuple[str, str, str] = (None, None, None),
+                  installed_pkg_uris: Set[str] = None, max_workers=1,
+                  include_warnings: Dict[str, List[str]] = None) -> Dict[str, List[str]]:
+    """
+    Issues of each package by package path, packages are validated on a pool of workers. Scripts
+    shared by packages are parsed only once. Issues of includes are part of the issues, unless a
+    dict is given as 'include_warnings' to take them by package path instead
+    """
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = list(executor.map(lambda pkg: validate_pkg(pkg, repo, installed_pkg_uris), pkgs))
+
+    all_issues = dict()
+    for pkg, (issues, include_issues) in zip(pkgs, results):
+        if include_warnings is None:
+            all_issues[pkg.pkg_path] = issues + include_issues
+        else:
+            all_issues[pkg.pkg_path] = issues
+            include_warnings[pkg.pkg_path] = include_issues
+
+    return all_issues